@@ -0,0 +1,147 @@
+"""
+scaling of the sharded batch check from 1 to N worker processes on a
+replayed workload: recorded extractions checked against a local hsp archive,
+so no openai or hsp calls are made
+
+    python -m benchmarks.batch_sharding --tickets 2000 --corridors 40 --max-workers 4
+
+runs in a temporary directory; the claims it queues are thrown away
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import time
+
+from src.delay_ease.batch_sharding import (
+    check_tickets_sharded,
+    get_shard_key,
+    plan_shards,
+)
+from src.delay_ease.hsp_archive import get_partition_dir, write_partition
+from src.delay_ease.llm_usage import new_llm_usage
+from src.delay_ease.structured_logging import setup_logging, stop_logging
+from src.delay_ease.ticket_data_extraction import get_reference_data_path
+
+DEPARTURES = [f"{hour:02d}{minute:02d}" for hour in range(6, 22) for minute in (0, 30)]
+
+
+def load_station_pairs(corridors: int, rng: random.Random) -> list:
+    with open(get_reference_data_path("stations.csv"), newline="") as f:
+        stations = [(row["stationName"], row["crsCode"]) for row in csv.DictReader(f)]
+    return [tuple(rng.sample(stations, 2)) for _ in range(corridors)]
+
+
+def add_minutes(hhmm: str, minutes: int) -> str:
+    total = int(hhmm[:2]) * 60 + int(hhmm[2:]) + minutes
+    return f"{total // 60 % 24:02d}{total % 60:02d}"
+
+
+def write_archive(pairs: list, dates: list, rng: random.Random) -> None:
+    """one archived partition per corridor and date, every service with actuals"""
+    for (_, dep_crs), (_, arr_crs) in pairs:
+        for date in dates:
+            records = []
+            for i, dep in enumerate(DEPARTURES):
+                arr = add_minutes(dep, 55)
+                records.append(
+                    {
+                        "rid": f"{date.strftime('%Y%m%d')}{i:08d}",
+                        "toc_code": "GW",
+                        "gbtt_ptd": dep,
+                        "gbtt_pta": arr,
+                        "has_details": "1",
+                        "i_gbtt_ptd": dep,
+                        "i_actual_td": dep,
+                        "f_gbtt_pta": arr,
+                        "f_actual_ta": add_minutes(arr, rng.choice((0, 5, 20, 45))),
+                    }
+                )
+            write_partition(
+                get_partition_dir(date.strftime("%Y-%m-%d"), dep_crs, arr_crs), records
+            )
+
+
+def make_tickets(count: int, pairs: list, dates: list, rng: random.Random) -> list:
+    tickets = []
+    for i in range(count):
+        (dep_name, dep_crs), (arr_name, arr_crs) = rng.choice(pairs)
+        dep = rng.choice(DEPARTURES)
+        tickets.append(
+            {
+                "image_sha256": hashlib.sha256(str(i).encode()).hexdigest(),
+                "extracted_data": {
+                    "ticket_date": rng.choice(dates).strftime("%d %b %Y"),
+                    "departure_time": f"{dep[:2]}:{dep[2:]}",
+                    "departure_station": dep_name,
+                    "departure_crs": dep_crs,
+                    "arrival_station": arr_name,
+                    "arrival_crs": arr_crs,
+                    "ticket_format": "E-ticket",
+                    "ticket_type": "Anytime Day Single",
+                },
+                "llm_usage": new_llm_usage(),
+                "result": None,
+            }
+        )
+    return tickets
+
+
+def run(tickets: int, corridors: int, days: int, max_workers: int, seed: int):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days=d) for d in range(2, 2 + days)]
+    pairs = load_station_pairs(corridors, rng)
+    workload = make_tickets(tickets, pairs, dates, rng)
+    keys = [get_shard_key(ticket["extracted_data"]) for ticket in workload]
+    print(
+        f"{tickets} tickets on {corridors} corridors x {days} days "
+        f"({len(set(keys))} corridor/date groups), {os.cpu_count()} cpu(s)"
+    )
+
+    os.environ["HSP_ARCHIVE_MODE"] = "read"
+    setup_logging(logging.WARNING)
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            write_archive(pairs, dates, rng)
+            baseline = None
+            for workers in range(1, max_workers + 1):
+                shards = plan_shards(keys, workers)
+                started = time.perf_counter()
+                results, metrics = check_tickets_sharded(
+                    workload, "bench_user", "batch", workers
+                )
+                seconds = time.perf_counter() - started
+                assert all(r["status"] != "error_processing" for r in results)
+                busiest = metrics["busiest_worker_seconds"]
+                if baseline is None:
+                    baseline = (seconds, busiest)
+                print(
+                    f"{workers} worker(s): {seconds:.2f} s wall, busiest worker "
+                    f"{busiest:.2f} s, largest shard {max(map(len, shards))} | "
+                    f"speedup {baseline[0] / seconds:.2f}x "
+                    f"(efficiency {baseline[0] / seconds / workers:.0%}), "
+                    f"excluding process start {baseline[1] / busiest:.2f}x "
+                    f"({baseline[1] / busiest / workers:.0%})"
+                )
+        finally:
+            os.chdir(cwd)
+            stop_logging()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--corridors", type=int, default=40)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.tickets, args.corridors, args.days, args.max_workers, args.seed)
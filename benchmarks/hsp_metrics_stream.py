@@ -0,0 +1,119 @@
+"""
+time and peak memory of finding one departure in a large serviceMetrics
+response: json.loads of the whole body vs the streamed, early-stopping parse
+
+    python -m benchmarks.hsp_metrics_stream --services 1000 --days 300
+
+every service departs at a different minute; --days sets the rids per
+service, as a multi-day query returns
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from src.delay_ease.const import HSP_STREAM_CHUNK_BYTES
+from src.delay_ease.delay_calculation import (
+    find_service_by_dep_time,
+    is_service_departure,
+)
+from src.delay_ease.json_stream import iter_array_items
+
+
+def make_service(i: int, days: int) -> dict:
+    minutes = 5 * 60 + i
+    return {
+        "serviceAttributesMetrics": {
+            "origin_location": "EUS",
+            "destination_location": "MKC",
+            "gbtt_ptd": f"{minutes // 60:02d}{minutes % 60:02d}",
+            "gbtt_pta": f"{(minutes + 35) // 60 % 24:02d}{(minutes + 35) % 60:02d}",
+            "toc_code": "LM",
+            "matched_services": str(days),
+            "rids": [
+                f"2026{(d % 12) + 1:02d}{(d % 28) + 1:02d}{i:08d}" for d in range(days)
+            ],
+        },
+        "Metrics": [
+            {
+                "tolerance_value": str(tolerance),
+                "num_not_tolerance": "3",
+                "num_tolerance": str(days - 3),
+                "percent_tolerance": "90",
+                "global_tolerance": tolerance == 0,
+            }
+            for tolerance in (0, 5, 10)
+        ],
+    }
+
+
+def make_payload(services: int, days: int) -> bytes:
+    return json.dumps(
+        {
+            "header": {"from_location": "EUS", "to_location": "MKC"},
+            "Services": [make_service(i, days) for i in range(services)],
+        }
+    ).encode("utf-8")
+
+
+def iter_chunks(payload: bytes):
+    view = memoryview(payload)
+    for start in range(0, len(payload), HSP_STREAM_CHUNK_BYTES):
+        yield bytes(view[start : start + HSP_STREAM_CHUNK_BYTES])
+
+
+def find_whole(payload: bytes, dep_time: str):
+    return find_service_by_dep_time(json.loads(payload)["Services"], dep_time)
+
+
+def find_streamed(payload: bytes, dep_time: str):
+    for service in iter_array_items(iter_chunks(payload), "Services"):
+        if is_service_departure(service, dep_time):
+            return service
+    return None
+
+
+def measure(fn, *args) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    # peak memory from a second, traced run - tracing slows the first down
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(services: int, days: int):
+    if services > 19 * 60:
+        raise ValueError("at most one service per minute from 05:00")
+    payload = make_payload(services, days)
+    print(f"{services} services, {len(payload) / 1e6:.1f} MB response")
+
+    departures = json.loads(payload)["Services"]
+    targets = {
+        "first 1%": departures[services // 100],
+        "middle": departures[services // 2],
+        "last": departures[-1],
+    }
+    del departures
+    for label, target in targets.items():
+        dep_time = target["serviceAttributesMetrics"]["gbtt_ptd"]
+        whole, whole_s, whole_peak = measure(find_whole, payload, dep_time)
+        streamed, stream_s, stream_peak = measure(find_streamed, payload, dep_time)
+        assert whole == streamed
+        print(
+            f"match {label} ({dep_time}): whole {whole_s * 1000:.0f} ms, "
+            f"peak {whole_peak / 1e6:.1f} MB | streamed {stream_s * 1000:.0f} ms, "
+            f"peak {stream_peak / 1e6:.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=300, help="rids per service")
+    args = parser.parse_args()
+    run(args.services, args.days)
@@ -0,0 +1,134 @@
+"""
+per-ticket logging cost in the worker threads: a synchronous stdout handler
+(the old basicConfig setup) vs the queue pipeline, with and without sampling
+of per-step lines, writing to a slow stream such as a busy pipe
+
+    python -m benchmarks.logging_overhead --workers 8 --tickets 100
+
+also times disabled debug lines built with an f-string vs %-style args
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+import timeit
+
+from src.delay_ease.structured_logging import SAMPLED, setup_logging, stop_logging
+
+log = logging.getLogger("benchmarks.ticket")
+
+# shaped like one claimed ticket: status lines plus agent step lines
+TICKET = {
+    "claim_id": "DR_20260101_120000_test_user",
+    "toc": "Avanti West Coast",
+    "delay_minutes": 42,
+    "segments": [{"departure_station": "EUS", "arrival_station": "MKC"}] * 3,
+}
+STATUS_LINES = 15
+STEP_LINES = 40
+
+
+class SlowStream:
+    """a stream whose every write blocks for `delay` seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> None:
+        time.sleep(self.delay)
+        self.lines += 1
+
+    def flush(self) -> None:
+        pass
+
+
+def log_ticket(ticket_id: int) -> None:
+    for i in range(STATUS_LINES):
+        log.info("Ticket %s status line %s: %s", ticket_id, i, TICKET["toc"])
+    for step in range(STEP_LINES):
+        log.info("Step %s done at %s", step, "https://example.com", extra=SAMPLED)
+    for _ in range(STATUS_LINES):
+        log.debug("Ticket details: %s", TICKET)
+
+
+def setup_sync(stream) -> None:
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def setup_queue(stream, sample_every: int) -> None:
+    os.environ["DELAY_EASE_LOG_SAMPLE_EVERY"] = str(sample_every)
+    setup_logging(stream=stream)
+
+
+def run_workers(workers: int, tickets: int) -> float:
+    """mean seconds each worker thread spends logging one ticket"""
+    per_ticket = []
+
+    def worker(worker_id: int) -> None:
+        start = time.perf_counter()
+        for i in range(tickets):
+            log_ticket(worker_id * tickets + i)
+        per_ticket.append((time.perf_counter() - start) / tickets)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(per_ticket) / len(per_ticket)
+
+
+def run(workers: int, tickets: int, write_delay: float, sample_every: int):
+    print(
+        f"{workers} workers x {tickets} tickets, {STATUS_LINES + STEP_LINES} info "
+        f"lines per ticket, {write_delay * 1e6:.0f} us per write"
+    )
+    setups = [
+        ("sync stdout handler", setup_sync),
+        ("queue", lambda stream: setup_queue(stream, 1)),
+        (f"queue, 1 in {sample_every} steps", lambda s: setup_queue(s, sample_every)),
+    ]
+    for label, setup in setups:
+        stream = SlowStream(write_delay)
+        setup(stream)
+        seconds = run_workers(workers, tickets)
+        # time for the listener to drain what the workers queued
+        drain_start = time.perf_counter()
+        stop_logging()
+        drain = time.perf_counter() - drain_start
+        print(
+            f"{label}: {seconds * 1000:.2f} ms/ticket in the worker, "
+            f"{stream.lines / (workers * tickets):.0f} lines/ticket written, "
+            f"drained {drain:.2f} s after"
+        )
+
+    setup_sync(SlowStream(0))
+    number = 100_000
+    eager = timeit.timeit(lambda: log.debug(f"Ticket details: {TICKET}"), number=number)
+    lazy = timeit.timeit(lambda: log.debug("Ticket details: %s", TICKET), number=number)
+    print(
+        f"disabled debug line: f-string {eager / number * 1e6:.2f} us, "
+        f"%-style {lazy / number * 1e6:.2f} us"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--tickets", type=int, default=100)
+    parser.add_argument(
+        "--write-us", type=float, default=50, help="blocking time per write"
+    )
+    parser.add_argument("--sample-every", type=int, default=10)
+    args = parser.parse_args()
+    run(args.workers, args.tickets, args.write_us / 1e6, args.sample_every)
@@ -0,0 +1,106 @@
+"""
+memory of claim/segment records held as json dicts vs slotted records
+
+    python -m benchmarks.records_memory --count 200000
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from src.delay_ease.records import ClaimRecord, SegmentRecord
+
+STATIONS = [
+    ("London Euston", "EUS"),
+    ("Manchester Piccadilly", "MAN"),
+    ("Birmingham New Street", "BHM"),
+    ("Leeds", "LDS"),
+    ("Glasgow Central", "GLC"),
+    ("Bristol Temple Meads", "BRI"),
+]
+OPERATORS = ["Avanti West Coast", "LNER", "CrossCountry", "Great Western Railway"]
+
+
+def make_claim(i: int, rng: random.Random) -> dict:
+    (dep, _), (arr, _) = rng.sample(STATIONS, 2)
+    return {
+        "claim_id": f"DE_20260101_{i:06d}_user{i % 500}",
+        "user_id": f"user{i % 500}",
+        "toc_claim_reference": None,
+        "status": "pending_submission",
+        "toc": rng.choice(OPERATORS),
+        "journey_date": f"{rng.randint(1, 28):02d} Sep 2026",
+        "departure_station": dep,
+        "arrival_station": arr,
+        "departure_time": f"{rng.randint(5, 22):02d}:{rng.choice(['00', '15', '30'])}",
+        "delay_minutes": float(rng.randint(15, 180)),
+        "compensation_percentage": rng.choice(["25%", "50%", "100%"]),
+        "compensation_amount": None,
+        "submitted_at": f"2026-09-30T10:{i % 60:02d}:00.{i:06d}",
+        "ticket_image_path": f"data/uploads/{i:06d}.jpg",
+        "llm_usage": None,
+    }
+
+
+def make_segment(i: int, rng: random.Random) -> dict:
+    (dep, dep_crs), (arr, arr_crs) = rng.sample(STATIONS, 2)
+    return {
+        "ticket_date": f"{rng.randint(1, 28):02d} Sep 2026",
+        "departure_time": f"{rng.randint(5, 22):02d}:00",
+        "departure_station": dep,
+        "departure_crs": dep_crs,
+        "arrival_station": arr,
+        "arrival_crs": arr_crs,
+        "ticket_type": "Anytime Return",
+        "railcard": "None",
+        "delay_minutes": float(rng.randint(0, 90)),
+        "train_operator": rng.choice(OPERATORS),
+        "delay_status": "delayed",
+        "compensation_percentage": "25%",
+        "status": "eligible",
+    }
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build()
+    seconds = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size, seconds
+
+
+def run(count: int, seed: int):
+    rng = random.Random(seed)
+    # as json text, like claims read from disk: every string is a fresh object
+    claim_json = [json.dumps(make_claim(i, rng)) for i in range(count)]
+    segment_json = [json.dumps(make_segment(i, rng)) for i in range(count)]
+
+    cases = [
+        ("claims", claim_json, ClaimRecord),
+        ("segments", segment_json, SegmentRecord),
+    ]
+    for name, rows, record_type in cases:
+        dict_size, dict_s = measure(lambda: [json.loads(row) for row in rows])
+        slot_size, slot_s = measure(
+            lambda: [record_type.from_dict(json.loads(row)) for row in rows]
+        )
+        print(
+            f"{name}: {count} records - dict {dict_size / count:.0f} B/record "
+            f"({dict_s:.2f}s), {record_type.__name__} {slot_size / count:.0f} B/record "
+            f"({slot_s:.2f}s), {100 * (1 - slot_size / dict_size):.0f}% smaller"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    run(args.count, args.seed)
@@ -2,57 +2,491 @@ import datetime
 import json
 import logging
 import os
-import sys
+import time
 from pathlib import Path
 from typing import Optional
 
 import typer
 from dotenv import load_dotenv
 
-from src.delay_ease.service import process_single_ticket
+from src.delay_ease.automation_metrics import (
+    load_claim_timings,
+    summarise_claim_timings,
+)
+from src.delay_ease.batch_sharding import process_tickets_sharded
+from src.delay_ease.batch_submission import run_batch_submission
+from src.delay_ease.claim_status import reconcile_claim_statuses
+from src.delay_ease.claims_index import GROUP_KEYS, query_index, update_index
+from src.delay_ease.const import (
+    MAX_CONCURRENT_TICKETS,
+    PROFILE_STAGES,
+    SUBMISSION_CAPACITY_PER_HOUR,
+)
+from src.delay_ease.hsp_archive import ingest_dump
+from src.delay_ease.image_store import collect_image_garbage
+from src.delay_ease.llm_usage import get_llm_usage_totals, summarise_usage_by_toc
+from src.delay_ease.monitoring import (
+    get_next_monitor_run,
+    register_journey,
+    run_daily_monitor,
+    unregister_journey,
+)
+from src.delay_ease.profiling import profile_stage, profiling
+from src.delay_ease.recheck_queue import get_next_recheck_time, load_rechecks
+from src.delay_ease.records import SlottedRecord
+from src.delay_ease.scheduler import build_admission_report
+from src.delay_ease.service import (
+    PENDING_SUBMISSION,
+    load_claim_records,
+    process_due_rechecks,
+    process_single_ticket,
+    process_tickets,
+)
+from src.delay_ease.singleflight import get_singleflight_stats
+from src.delay_ease.structured_logging import setup_logging
+from src.delay_ease.user_profiles import (
+    build_profile_from_env,
+    delete_user_profile,
+    generate_profile_key,
+    save_user_profile,
+)
 
 load_dotenv()
 
 
-def setup_logging(level: int = logging.INFO) -> None:
-    logging.basicConfig(
-        level=level,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stdout,
-    )
-
-
 setup_logging()
 
 log = logging.getLogger(__name__)
 app = typer.Typer()
 
 
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(
+        False,
+        help="Profile the command: folded stacks, allocations and external wait "
+        "time per stage, written to data/profiling/",
+    ),
+    profile_stages: Optional[list[str]] = typer.Option(
+        None,
+        "--profile-stage",
+        help=f"Only profile this stage; repeat for several ({', '.join(PROFILE_STAGES)})",
+    ),
+):
+    """Delay-Ease CLI. Without a command, runs the built-in test."""
+    if profile or profile_stages:
+        unknown = set(profile_stages or ()) - set(PROFILE_STAGES)
+        if unknown:
+            raise typer.BadParameter(
+                f"Unknown stage(s): {', '.join(sorted(unknown))}",
+                param_hint="--profile-stage",
+            )
+        # ends, and writes its report, once the command has finished
+        ctx.with_resource(profiling(profile_stages))
+    if ctx.invoked_subcommand is None:
+        test_eticket_test()
+
+
 @app.command()
 def run(
-    image: Optional[Path] = typer.Option(None, help="Path to ticket image (.png/.jpg)"),
+    image: Optional[list[Path]] = typer.Option(
+        None, help="Path to ticket image (.png/.jpg); repeat for several tickets"
+    ),
     user_id: str = typer.Option("test_user", help="Optional user id for saved records"),
+    batch: bool = typer.Option(
+        False, help="Queue eligible Type A claims for the submit command"
+    ),
+    concurrency: int = typer.Option(
+        MAX_CONCURRENT_TICKETS, help="Tickets processed at once with several --image"
+    ),
+    workers: int = typer.Option(
+        1,
+        help="Processes checking tickets with several --image; tickets are sharded "
+        "by corridor and date",
+    ),
 ):
-    """Run Delay-Ease on a ticket image. If --image is omitted, runs a built-in test."""
-    if image is None:
+    """Run Delay-Ease on ticket images. If --image is omitted, runs a built-in test."""
+    if not image:
         test_eticket_test()
         return
 
-    result = process_single_ticket(str(image), user_id)
-    log.info(" RESULTS SUMMARY")
-    log.info(f"Status: {result.get('status', 'Unknown')}")
-    log.info(f"TOC: {result.get('train_operator', 'Unknown')}")
-    log.info(f"Delay: {result.get('delay_minutes', 'Unknown')} minutes")
-    log.info(f"Compensation: {result.get('compensation_percentage', 'Unknown')}")
+    submission_mode = "batch" if batch else "immediate"
+    if len(image) == 1:
+        results = [process_single_ticket(str(image[0]), user_id, submission_mode)]
+    elif workers > 1:
+        results = process_tickets_sharded(
+            [str(path) for path in image],
+            user_id,
+            submission_mode,
+            workers,
+            concurrency,
+        )
+    else:
+        results = process_tickets(
+            [str(path) for path in image], user_id, submission_mode, concurrency
+        )
+
+    for result in results:
+        # an image of several tickets has a result per ticket
+        for ticket_result in result.get("tickets", [result]):
+            log.info(" RESULTS SUMMARY")
+            log.info(f"Status: {ticket_result.get('status', 'Unknown')}")
+            log.info(f"TOC: {ticket_result.get('train_operator', 'Unknown')}")
+            log.info(f"Delay: {ticket_result.get('delay_minutes', 'Unknown')} minutes")
+            log.info(
+                f"Compensation: {ticket_result.get('compensation_percentage', 'Unknown')}"
+            )
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    result_file = f"data/results/delay_ease_result_{timestamp}.json"
     os.makedirs("data/results", exist_ok=True)
 
-    with open(result_file, "w") as f:
-        json.dump(result, f, indent=2)
+    for i, result in enumerate(results, 1):
+        suffix = f"_{i}" if len(results) > 1 else ""
+        result_file = f"data/results/delay_ease_result_{timestamp}{suffix}.json"
+        with open(result_file, "w") as f, profile_stage("result_serialization"):
+            # batch results are SegmentRecords
+            json.dump(result, f, indent=2, default=SlottedRecord.to_dict)
+
+        log.info(f"Full result saved to: {result_file}")
+
+    totals = get_llm_usage_totals()["total"]
+    log.info(
+        f"LLM usage: {totals['calls']} call(s), {totals['prompt_tokens']}+"
+        f"{totals['completion_tokens']} tokens, ${totals['cost_usd']:.3f}"
+    )
+    flights = {
+        name: stats
+        for name, stats in get_singleflight_stats().items()
+        if stats["executed"]
+    }
+    if flights:
+        log.info(
+            "Shared calls: "
+            + ", ".join(
+                f"{name} {stats['executed']} made, {stats['coalesced']} joined"
+                for name, stats in flights.items()
+            )
+        )
+
+
+@app.command()
+def submit(
+    max_sessions: Optional[int] = typer.Option(
+        None, help="Concurrent portal sessions per TOC (overrides config)"
+    ),
+    min_spacing: Optional[float] = typer.Option(
+        None, help="Minimum seconds between claim starts per TOC (overrides config)"
+    ),
+    max_claims: Optional[int] = typer.Option(
+        None, help="Only submit this many of the highest-priority claims"
+    ),
+):
+    """Submit queued claims in priority order, logging in once per TOC portal session."""
+    results = run_batch_submission(max_sessions, min_spacing, max_claims)
+    submitted = sum(1 for r in results if r["automation_status"] == "submitted")
+    log.info(f"Submitted {submitted} of {len(results)} queued claim(s)")
+    for result in results:
+        if result["automation_status"] != "submitted":
+            log.warning(
+                f"{result['claim_id']}: failed at {result.get('failed_stage')} - "
+                f"{result.get('automation_error')}"
+            )
+
+
+@app.command("check-claims")
+def check_claims(
+    dry_run: bool = typer.Option(False, help="Only report status changes"),
+):
+    """Update submitted claims' statuses from each TOC portal's claims list."""
+    summaries = reconcile_claim_statuses(dry_run=dry_run)
+    for summary in summaries:
+        log.info(
+            f"{summary['website']} ({summary['user_id']}): matched "
+            f"{summary['matched']} of {summary['claims']} claim(s) in "
+            f"{summary['rows']} row(s) read by {summary['method']}, "
+            f"{summary['changed']} changed - {summary['by_status']}"
+        )
+    changed = sum(summary["changed"] for summary in summaries)
+    action = "Would update" if dry_run else "Updated"
+    log.info(f"{action} {changed} claim status(es) from {len(summaries)} session(s)")
+
+
+@app.command()
+def schedule(
+    capacity: float = typer.Option(
+        SUBMISSION_CAPACITY_PER_HOUR, help="Claims the browsers can submit per hour"
+    ),
+    output: Optional[Path] = typer.Option(None, help="Write the full report as JSON"),
+):
+    """Report queued claims in submission order and those at risk of expiring."""
+    if capacity <= 0:
+        raise typer.BadParameter("Must be above 0", param_hint="--capacity")
+    report = build_admission_report(load_claim_records(PENDING_SUBMISSION), capacity)
+    log.info(f"Queued: {report['queued']} ({report['hours_to_clear']}h to clear)")
+    log.info(f"At risk of expiring: {len(report['at_risk'])}")
+    for entry in report["at_risk"]:
+        log.warning(
+            f"{entry['claim_id']} ({entry['toc']}): deadline {entry['deadline']}, "
+            f"estimated start {entry['estimated_start']}"
+        )
+    log.info(f"Already expired: {len(report['expired'])}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"Full report saved to: {output}")
+
+
+@app.command()
+def recheck(
+    watch: bool = typer.Option(
+        False, help="Keep running, waking for each due re-check"
+    ),
+    batch: bool = typer.Option(
+        False, help="Queue newly eligible Type A claims for the submit command"
+    ),
+):
+    """Re-check tickets whose HSP data wasn't published yet, without re-extracting."""
+    submission_mode = "batch" if batch else "immediate"
+    while True:
+        results = process_due_rechecks(submission_mode)
+        log.info(f"Resolved {len(results)} re-check(s)")
+
+        next_check = get_next_recheck_time()
+        if not watch or next_check is None:
+            if next_check:
+                log.info(f"Next re-check due at {next_check.isoformat()}")
+            return
+
+        wait = (next_check - datetime.datetime.now()).total_seconds()
+        log.info(f"Next re-check due at {next_check.isoformat()}")
+        time.sleep(max(wait, 0))
+
+
+@app.command("register-journey")
+def register_journey_command(
+    user_id: str = typer.Option(..., help="User to notify about delays"),
+    departure: str = typer.Option(..., help="Departure station name or CRS code"),
+    arrival: str = typer.Option(..., help="Arrival station name or CRS code"),
+    departure_time: str = typer.Option(..., help="Scheduled departure, HH:MM"),
+    days: str = typer.Option("WEEKDAY", help="WEEKDAY, WEEKEND, DAILY or MON,TUE,..."),
+    toc: Optional[str] = typer.Option(None, help="Only match this train operator"),
+):
+    """Register a recurring journey for daily delay monitoring."""
+    registration = register_journey(
+        user_id, departure, arrival, departure_time, days, toc
+    )
+    log.info(
+        f"Registered {registration['registration_id']}: "
+        f"{registration['departure_station']} to {registration['arrival_station']} "
+        f"at {registration['departure_time']} on {','.join(registration['days'])}"
+    )
+
+
+@app.command("unregister-journey")
+def unregister_journey_command(
+    registration_id: str = typer.Option(..., help="Registration to stop monitoring")
+):
+    """Stop monitoring a registered journey."""
+    if unregister_journey(registration_id):
+        log.info(f"Unregistered {registration_id}")
+    else:
+        log.info(f"No journey registered as {registration_id}")
+
+
+@app.command("add-profile")
+def add_profile(
+    user_id: str = typer.Option(..., help="User the profile belongs to"),
+    file: Optional[Path] = typer.Option(
+        None, help="JSON with passenger, bank and delay_repay sections"
+    ),
+    from_env: bool = typer.Option(
+        False, help="Build the profile from the USER_* and DELAY_REPAY_* variables"
+    ),
+):
+    """Store an encrypted passenger/bank/portal profile for a user."""
+    if file:
+        with open(file) as f:
+            profile = json.load(f)
+    elif from_env:
+        profile = build_profile_from_env()
+    else:
+        raise typer.BadParameter("Pass --file or --from-env")
+
+    save_user_profile(user_id, profile)
+    log.info(f"Saved profile for {user_id}")
+
+
+@app.command("remove-profile")
+def remove_profile(user_id: str = typer.Option(..., help="User to remove")):
+    """Delete a user's stored profile."""
+    if delete_user_profile(user_id):
+        log.info(f"Removed profile for {user_id}")
+    else:
+        log.info(f"No profile stored for {user_id}")
+
+
+@app.command("generate-profile-key")
+def generate_profile_key_command():
+    """Print a new key for DELAY_EASE_PROFILE_KEY."""
+    print(generate_profile_key())
+
+
+@app.command()
+def monitor(
+    date: Optional[str] = typer.Option(
+        None, help="Journey date YYYY-MM-DD (default: yesterday)"
+    ),
+    watch: bool = typer.Option(False, help="Keep running, checking once a day"),
+):
+    """Check registered journeys against HSP, one query per corridor."""
+    journey_date = datetime.datetime.strptime(date, "%Y-%m-%d").date() if date else None
+    while True:
+        summary = run_daily_monitor(journey_date)
+        for alert in summary["alerts"]:
+            log.info(f"{alert['user_id']}: {alert['message']}")
+
+        if not watch:
+            return
+
+        journey_date = None
+        next_run = get_next_monitor_run()
+        log.info(f"Next monitoring run at {next_run.isoformat()}")
+        time.sleep(max((next_run - datetime.datetime.now()).total_seconds(), 0))
+
+
+@app.command("ingest-hsp")
+def ingest_hsp(
+    dumps: list[Path] = typer.Argument(..., help="Exported HSP metrics/details JSON"),
+):
+    """Load exported HSP responses into the local columnar archive."""
+    total = sum(ingest_dump(str(dump)) for dump in dumps)
+    log.info(f"Archived {total} service row(s) from {len(dumps)} file(s)")
+
+
+@app.command("gc-images")
+def gc_images(
+    dry_run: bool = typer.Option(False, help="Only report what would be deleted"),
+):
+    """Delete stored ticket images no open claim or pending re-check needs."""
+    stats = collect_image_garbage(
+        load_claim_records(), load_rechecks(), dry_run=dry_run
+    )
+    action = "Would delete" if dry_run else "Deleted"
+    log.info(
+        f"{action} {stats['deleted']} image(s), {stats['freed_bytes'] / 1e6:.1f} MB; "
+        f"kept {stats['kept']}"
+    )
+
+
+@app.command()
+def report(
+    group_by: list[str] = typer.Option(
+        ["toc"], help=f"Group by any of: {', '.join(GROUP_KEYS)}"
+    ),
+    toc: Optional[str] = typer.Option(None, help="Only this train operator"),
+    status: Optional[str] = typer.Option(None, help="Only this status, e.g. eligible"),
+    since: Optional[str] = typer.Option(None, help="Journeys on/after YYYY-MM-DD"),
+    until: Optional[str] = typer.Option(None, help="Journeys on/before YYYY-MM-DD"),
+    rebuild: bool = typer.Option(False, help="Rebuild the index from scratch"),
+    output: Optional[Path] = typer.Option(None, help="Write the rows as JSON"),
+):
+    """Aggregate claim and result records, updating the index incrementally."""
+    started = time.perf_counter()
+    index = update_index(rebuild)
+    rows = query_index(
+        index,
+        group_by,
+        toc,
+        status,
+        datetime.datetime.strptime(since, "%Y-%m-%d").date() if since else None,
+        datetime.datetime.strptime(until, "%Y-%m-%d").date() if until else None,
+    )
+
+    for row in rows:
+        group = ", ".join(str(row[key]) for key in group_by)
+        log.info(
+            f"{group}: {row['claims']} claim(s), avg delay {row['avg_delay_minutes']} min, "
+            f"total compensation {row['total_compensation_pct']}%"
+            + (
+                f" (£{row['total_compensation_amount']:.2f})"
+                if row["total_compensation_amount"]
+                else ""
+            )
+        )
+    log.info(
+        f"Report over {index['rows']} record(s) in {time.perf_counter() - started:.3f}s"
+    )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+@app.command()
+def usage(
+    since: Optional[str] = typer.Option(
+        None, help="Only claims saved on/after YYYY-MM-DD"
+    ),
+    output: Optional[Path] = typer.Option(None, help="Write the breakdown as JSON"),
+):
+    """Per-TOC LLM token, cost and latency breakdown from claim records."""
+    records = [
+        record
+        for record in load_claim_records()
+        if not since or (record.get("submitted_at") or "")[:10] >= since
+    ]
+    breakdown = summarise_usage_by_toc(records)
+    if not breakdown:
+        log.info("No claim records with LLM usage yet")
+        return
+
+    for toc, row in breakdown.items():
+        log.info(
+            f"{toc}: {row['claims']} claim(s), ${row['cost_per_claim_usd']:.3f} and "
+            f"{row['seconds_per_claim']}s of LLM time per claim"
+        )
+        for stage, entry in row["usage"]["stages"].items():
+            log.info(
+                f"   {stage}: {entry['prompt_tokens']}+{entry['completion_tokens']} tokens, "
+                f"{entry['steps']} step(s), {entry['seconds']:.0f}s, ${entry['cost_usd']:.3f}"
+            )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(breakdown, f, indent=2)
+
+
+@app.command()
+def timings(
+    since: Optional[str] = typer.Option(
+        None, help="Only claims run on/after YYYY-MM-DD"
+    ),
+):
+    """Summarise per-claim portal automation timings by browser profile."""
+    summary = summarise_claim_timings(
+        load_claim_timings(
+            datetime.datetime.strptime(since, "%Y-%m-%d").date() if since else None
+        )
+    )
+    if not summary["profiles"]:
+        log.info("No submitted claims with timings yet")
+        return
 
-    log.info(f"Full result saved to: {result_file}")
+    for profile, row in summary["profiles"].items():
+        log.info(
+            f"{profile}: {row['claims']} claim(s), {row['agent_seconds']}s per claim, "
+            f"{row['step_seconds']}s per agent step, page load {row['page_load_ms']} ms, "
+            f"{row['steps']} step(s) per claim of which {row['replayed_steps']} replayed"
+        )
+    saved = summary["saved_per_claim"]
+    if saved:
+        log.info(
+            f"performance profile saves {saved.get('agent_seconds')}s per claim, "
+            f"{saved.get('step_seconds')}s per step and "
+            f"{saved.get('page_load_ms')} ms of page load"
+        )
 
 
 def test_eticket_test():
@@ -0,0 +1,325 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from urllib.parse import urlparse
+
+from src.delay_ease.const import (
+    ACTION_TRACE_ACTIONS,
+    ACTION_TRACE_CHOICE_ROLES,
+    ACTION_TRACE_CHOICE_TAGS,
+    ACTION_TRACE_DATA_ATTRIBUTES,
+    ACTION_TRACE_STEP_ATTEMPTS,
+    ACTION_TRACE_STEP_DELAY_SECONDS,
+)
+
+log = logging.getLogger(__name__)
+
+TRACES_DIR = Path("data/action_traces")
+
+SLOT_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+
+def is_action_traces_enabled() -> bool:
+    return os.environ.get("DELAY_EASE_ACTION_TRACES", "").strip().lower() not in (
+        "0",
+        "false",
+        "no",
+        "off",
+    )
+
+
+def get_trace_path(portal: str, stage: str) -> Path:
+    """
+    one trace per portal host and stage - tocs sharing a portal share it, and
+    so do its users: traces hold slot names and element hashes, never values
+    """
+    return TRACES_DIR / (urlparse(portal).hostname or portal) / f"{stage}.json"
+
+
+def build_login_slots(email: str, password: str) -> dict:
+    return {"email": email, "password": password}
+
+
+def build_claim_slots(
+    journey_details: dict,
+    passenger_details: dict,
+    bank_details: dict,
+    delay_range: str,
+    ticket_image_path: str,
+    email: str,
+    password: str,
+) -> dict:
+    """slot name -> this claim's value, for every value a stage agent types"""
+    slots = {
+        **build_login_slots(email, password),
+        "journey_date": journey_details["date"],
+        "departure_station": journey_details["departure_station"],
+        "arrival_station": journey_details["arrival_station"],
+        "departure_time": journey_details["departure_time"],
+        "delay_range": delay_range,
+        "delay_minutes": str(journey_details["delay_minutes"]),
+        "ticket_image_path": ticket_image_path,
+        "sort_code": bank_details["sort_code"],
+        "sort_code_digits": re.sub(r"\D", "", bank_details["sort_code"]),
+        "account_number": bank_details["account_number"],
+        "account_holder": bank_details["account_holder"],
+        **{
+            field: passenger_details.get(field, "")
+            for field in (
+                "title",
+                "first_name",
+                "last_name",
+                "address_line1",
+                "town_city",
+                "postcode",
+            )
+        },
+        "country": passenger_details.get("country", "United Kingdom"),
+    }
+    # portals' date fields take other formats than the ticket's
+    try:
+        date = datetime.datetime.strptime(journey_details["date"], "%d %b %Y")
+        slots["journey_date_slashed"] = date.strftime("%d/%m/%Y")
+        slots["journey_date_iso"] = date.strftime("%Y-%m-%d")
+    except ValueError:
+        pass
+    return {name: str(value) for name, value in slots.items() if value}
+
+
+def get_slot_placeholder(value, slots: dict) -> str:
+    """{{slot}} for a value that is exactly one of the claim's slot values"""
+    for name, slot_value in slots.items():
+        if str(value).strip() == slot_value:
+            return "{{" + name + "}}"
+    return None
+
+
+def is_choice_element(element) -> bool:
+    attributes = element.attributes or {}
+    return (
+        element.node_name.lower() in ACTION_TRACE_CHOICE_TAGS
+        or attributes.get("role") in ACTION_TRACE_CHOICE_ROLES
+        or attributes.get("type") in ("radio", "checkbox")
+    )
+
+
+def build_trace_element(element, slots: dict) -> dict:
+    """
+    How replay finds the element again: by the slot values in its attributes,
+    else by its hash for a plain control like a "Continue" button. None when
+    it is a choice or carries data no slot accounts for - replaying it would
+    repeat the recorded claim's choice
+    """
+    attributes = element.attributes or {}
+    slotted = {}
+    for name in ACTION_TRACE_DATA_ATTRIBUTES:
+        placeholder = get_slot_placeholder(attributes.get(name, ""), slots)
+        if attributes.get(name) and placeholder:
+            slotted[name] = placeholder
+    if slotted:
+        return {"tag": element.node_name.lower(), "attributes": slotted}
+    if is_choice_element(element):
+        return None
+    if any(
+        re.search(r"\d", attributes.get(name, ""))
+        for name in ACTION_TRACE_DATA_ATTRIBUTES
+    ):
+        return None
+    return {"tag": element.node_name.lower(), "element_hash": element.element_hash}
+
+
+def build_trace_step(action: dict, element, slots: dict) -> dict:
+    """one replayable action, or None if it can't be replayed safely"""
+    ((name, params),) = action.items()
+    if name not in ACTION_TRACE_ACTIONS or element is None:
+        return None
+    params = dict(params)
+    for param, value in params.items():
+        if param in ACTION_TRACE_ACTIONS[name]:
+            params[param] = get_slot_placeholder(value, slots)
+            if params[param] is None:
+                return None
+        elif isinstance(value, str):
+            # free text outside the slots could be anyone's data
+            return None
+    trace_element = build_trace_element(element, slots)
+    if trace_element is None:
+        return None
+    return {"action": {name: params}, "element": trace_element}
+
+
+def build_trace_steps(history, slots: dict) -> tuple:
+    """
+    (steps, complete) for an agent run: its actions, one per step, up to the
+    first one that can't be replayed safely. complete when only the closing
+    done was left, so a replay of the steps finishes the stage. Failed
+    actions and waits are left out; the model's text never goes in.
+    """
+    items = [
+        item
+        for item in history.history
+        if item.model_output and any(item.model_output.action)
+    ]
+    steps = []
+    for i, item in enumerate(items):
+        if any(result.error for result in item.result):
+            continue
+        actions = [
+            action.model_dump(exclude_none=True) for action in item.model_output.action
+        ]
+        elements = item.state.interacted_element or []
+        for j, action in enumerate(actions):
+            if "done" in action:
+                complete = i == len(items) - 1 and history.is_successful() is not False
+                return steps, complete
+            if "wait" in action:
+                continue
+            step = build_trace_step(
+                action, elements[j] if j < len(elements) else None, slots
+            )
+            if step is None:
+                return steps, False
+            steps.append(step)
+    return steps, False
+
+
+def find_personal_values(steps: list, slots: dict) -> list:
+    """slots whose value shows up in the steps - a trace must only hold names"""
+    text = json.dumps(steps).lower()
+    return [
+        name
+        for name, value in slots.items()
+        if len(value) >= 4 and value.lower() in text
+    ]
+
+
+def fill_slots(value, slots: dict):
+    if isinstance(value, dict):
+        return {key: fill_slots(item, slots) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill_slots(item, slots) for item in value]
+    if not isinstance(value, str):
+        return value
+    return SLOT_PATTERN.sub(lambda m: slots.get(m.group(1), m.group(0)), value)
+
+
+def get_trace_slot_names(steps: list) -> set:
+    return set(SLOT_PATTERN.findall(json.dumps(steps)))
+
+
+def describe_trace_step(step: dict, slots: dict) -> str:
+    """what a step did, for the agent taking over after a replay"""
+    ((name, params),) = fill_slots(step["action"], slots).items()
+    values = [str(value) for param, value in params.items() if param != "index"]
+    values = [value for value in values if value not in ("True", "False")]
+    target = f"<{step['element']['tag']}>"
+    return " ".join([name, *values[:1], "on", target])
+
+
+def load_trace(portal: str, stage: str) -> dict:
+    path = get_trace_path(portal, stage)
+    if not path.exists():
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning("Ignoring unreadable action trace %s: %s", path, e)
+        return None
+
+
+def save_trace(portal: str, stage: str, steps: list, complete: bool, slots: dict):
+    # a last check that no claim data made it past the slots
+    personal = find_personal_values(steps, slots)
+    if personal:
+        log.warning(
+            "Not saving the %s trace: it holds the value of %s",
+            stage,
+            ", ".join(personal),
+        )
+        return
+
+    path = get_trace_path(portal, stage)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    trace = {
+        "portal": urlparse(portal).hostname or portal,
+        "stage": stage,
+        "learned_at": datetime.datetime.now().isoformat(),
+        "complete": complete,
+        "slots": sorted(get_trace_slot_names(steps)),
+        "steps": steps,
+    }
+    # sessions on the same portal may learn at once - the last write wins whole
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(trace, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_trace_element(selector_map: dict, element: dict) -> int:
+    """
+    index of the one element on the page matching a (filled) trace element;
+    None when there is none, or several the recording can't tell apart
+    """
+    matches = [
+        index
+        for index, node in selector_map.items()
+        if node.node_name.lower() == element["tag"]
+        and (
+            node.element_hash == element["element_hash"]
+            if "element_hash" in element
+            else all(
+                (node.attributes or {}).get(name) == value
+                for name, value in element["attributes"].items()
+            )
+        )
+    ]
+    return matches[0] if len(matches) == 1 else None
+
+
+async def replay_trace_step(agent, step: dict, slots: dict) -> str:
+    """run one trace step; returns its error, if any. ValueError if the page
+    doesn't show its element (yet) - nothing has run then"""
+    step = fill_slots(step, slots)
+    state = await agent.browser_session.get_browser_state_summary(
+        include_screenshot=False
+    )
+    index = find_trace_element(state.dom_state.selector_map, step["element"])
+    if index is None:
+        raise ValueError(f"No single <{step['element']['tag']}> to act on")
+    action = agent.ActionModel.model_validate(step["action"])
+    action.set_index(index)
+    results = await agent.multi_act([action])
+    await asyncio.sleep(ACTION_TRACE_STEP_DELAY_SECONDS)
+    return next((result.error for result in results if result.error), None)
+
+
+async def replay_trace(agent, steps: list, slots: dict) -> int:
+    """
+    Replay trace steps on the agent's browser without calling its llm, until
+    the first one whose element isn't on the page or whose action fails.
+    Returns how many steps were replayed.
+    """
+    await agent.browser_session.start()
+    for i, step in enumerate(steps):
+        for attempt in range(1, ACTION_TRACE_STEP_ATTEMPTS + 1):
+            try:
+                error = await replay_trace_step(agent, step, slots)
+            except ValueError as e:
+                # raised before the action runs, so trying again is safe
+                error = str(e)
+                if attempt < ACTION_TRACE_STEP_ATTEMPTS:
+                    await asyncio.sleep(ACTION_TRACE_STEP_DELAY_SECONDS)
+                    continue
+            except Exception as e:
+                error = str(e)
+            break
+
+        if error:
+            log.info("Trace step %s/%s no longer applies: %s", i + 1, len(steps), error)
+            return i
+    return len(steps)
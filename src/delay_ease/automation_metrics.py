@@ -0,0 +1,153 @@
+import datetime
+import json
+import logging
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = Path("data/metrics")
+CLAIM_TIMINGS_FILE = METRICS_DIR / "claim_timings.jsonl"
+
+# navigation timing of the page a stage finished on, plus bytes fetched for it
+PAGE_TIMING_JS = """
+(() => {
+    const nav = performance.getEntriesByType("navigation")[0];
+    if (!nav) return null;
+    const resources = performance.getEntriesByType("resource");
+    return {
+        load_ms: Math.round(nav.loadEventEnd - nav.startTime),
+        requests: resources.length + 1,
+        transfer_bytes: resources.reduce((s, r) => s + (r.transferSize || 0), nav.transferSize || 0),
+    };
+})()
+"""
+
+
+async def get_page_timing(browser) -> dict:
+    try:
+        cdp_session = await browser.get_or_create_cdp_session(focus=False)
+        result = await cdp_session.cdp_client.send.Runtime.evaluate(
+            params={"expression": PAGE_TIMING_JS, "returnByValue": True},
+            session_id=cdp_session.session_id,
+        )
+        return result.get("result", {}).get("value")
+    except Exception as e:
+        log.debug(f"Could not read page timing: {e}")
+        return None
+
+
+async def build_stage_timing(
+    stage: str,
+    history,
+    browser,
+    replayed_steps: int = 0,
+    replay_seconds: float = 0.0,
+) -> dict:
+    """history is the agent's run, None for a stage replayed whole from its trace"""
+    steps = replayed_steps + (history.number_of_steps() if history else 0)
+    duration = replay_seconds + (history.total_duration_seconds() if history else 0)
+    return {
+        "stage": stage,
+        "steps": steps,
+        "replayed_steps": replayed_steps,
+        "duration_seconds": round(duration, 2),
+        "step_seconds": round(duration / steps, 2) if steps else None,
+        "page": await get_page_timing(browser),
+    }
+
+
+def build_claim_timing(
+    browser_profile: str,
+    toc: str,
+    stage_timings: list,
+    automation_status: str,
+    claim_id: str = None,
+    user_id: str = None,
+) -> dict:
+    steps = sum(s["steps"] for s in stage_timings)
+    agent_seconds = sum(s["duration_seconds"] for s in stage_timings)
+    page_loads = [s["page"]["load_ms"] for s in stage_timings if s.get("page")]
+    return {
+        "recorded_at": datetime.datetime.now().isoformat(),
+        "claim_id": claim_id,
+        "user_id": user_id,
+        "toc": toc,
+        "browser_profile": browser_profile,
+        "automation_status": automation_status,
+        "steps": steps,
+        "replayed_steps": sum(s.get("replayed_steps", 0) for s in stage_timings),
+        "agent_seconds": round(agent_seconds, 2),
+        "step_seconds": round(agent_seconds / steps, 2) if steps else None,
+        "page_load_ms": sum(page_loads) if page_loads else None,
+        "transfer_bytes": sum(
+            s["page"]["transfer_bytes"] for s in stage_timings if s.get("page")
+        ),
+        "stages": stage_timings,
+    }
+
+
+def record_claim_timing(claim_timing: dict) -> None:
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CLAIM_TIMINGS_FILE, "a") as f:
+        f.write(json.dumps(claim_timing) + "\n")
+    log.info(
+        f"Claim automation took {claim_timing['agent_seconds']}s over "
+        f"{claim_timing['steps']} step(s) ({claim_timing['browser_profile']} profile)"
+    )
+
+
+def load_claim_timings(since: datetime.date = None) -> list:
+    if not CLAIM_TIMINGS_FILE.exists():
+        return []
+    timings = []
+    with open(CLAIM_TIMINGS_FILE) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            timing = json.loads(line)
+            if since and timing["recorded_at"][:10] < since.isoformat():
+                continue
+            timings.append(timing)
+    return timings
+
+
+def mean(values: list):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def summarise_claim_timings(timings: list) -> dict:
+    """
+    Per-profile averages for submitted claims, and what the performance
+    profile saves per claim against the standard one when both have data.
+    """
+    profiles = {}
+    for timing in timings:
+        if timing["automation_status"] != "submitted":
+            continue
+        profiles.setdefault(timing["browser_profile"], []).append(timing)
+
+    summary = {"profiles": {}, "saved_per_claim": None}
+    for profile, profile_timings in sorted(profiles.items()):
+        summary["profiles"][profile] = {
+            "claims": len(profile_timings),
+            "agent_seconds": mean([t["agent_seconds"] for t in profile_timings]),
+            "steps": mean([t["steps"] for t in profile_timings]),
+            # steps replayed from learned traces, without an llm call
+            "replayed_steps": mean(
+                [t.get("replayed_steps", 0) for t in profile_timings]
+            ),
+            "step_seconds": mean([t["step_seconds"] for t in profile_timings]),
+            "page_load_ms": mean([t["page_load_ms"] for t in profile_timings]),
+            "transfer_bytes": mean([t["transfer_bytes"] for t in profile_timings]),
+        }
+
+    standard = summary["profiles"].get("standard")
+    performance = summary["profiles"].get("performance")
+    if standard and performance:
+        summary["saved_per_claim"] = {
+            key: round(standard[key] - performance[key], 2)
+            for key in ("agent_seconds", "step_seconds", "page_load_ms")
+            if standard[key] is not None and performance[key] is not None
+        }
+    return summary
@@ -0,0 +1,347 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+
+from src.delay_ease.const import MAX_CONCURRENT_TICKETS
+from src.delay_ease.delay_calculation import new_hsp_cache
+from src.delay_ease.image_index import remember_extraction
+from src.delay_ease.llm_usage import (
+    add_llm_usage_totals,
+    get_llm_usage_totals,
+    reset_llm_usage_totals,
+    track_llm_usage,
+)
+from src.delay_ease.profiling import (
+    collect_profile_data,
+    merge_profile_data,
+    restart_profiling,
+)
+from src.delay_ease.recheck_queue import get_ticket_legs
+from src.delay_ease.records import build_result_record
+from src.delay_ease.service import (
+    build_multi_ticket_result,
+    build_processing_error,
+    check_extracted_ticket_async,
+    read_ticket_async,
+    split_extracted_tickets,
+)
+from src.delay_ease.singleflight import (
+    add_singleflight_stats,
+    get_singleflight_stats,
+    reset_singleflight_stats,
+)
+from src.delay_ease.structured_logging import bind_log_context, setup_logging
+from src.delay_ease.ticket_data_extraction import validate_extracted_tickets
+
+log = logging.getLogger(__name__)
+
+# forked workers start with the modules already imported; spawning one
+# re-imports browser_use and friends, several seconds per worker
+START_METHOD = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def get_shard_key(extracted_data: dict) -> tuple:
+    """
+    (departure crs, arrival crs, date) of the ticket's first leg - the hsp
+    partition it reads first. None for unreadable tickets
+    """
+    if "error" in extracted_data:
+        return None
+    leg = get_ticket_legs(extracted_data)[0]
+    return (
+        leg.get("departure_crs", ""),
+        leg.get("arrival_crs", ""),
+        leg.get("ticket_date", ""),
+    )
+
+
+def plan_shards(keys: list, workers: int) -> list:
+    """
+    Ticket indexes per worker. Tickets sharing a key always share a worker;
+    groups are placed largest first on the least loaded worker, and keyless
+    tickets fill in on their own.
+    """
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(key if key is not None else i, []).append(i)
+    shards = [[] for _ in range(workers)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return [sorted(shard) for shard in shards if shard]
+
+
+async def read_batch_ticket_async(image_path: str, user_id: str) -> dict:
+    """
+    phase 1 of a sharded batch, in the parent: store and extract the ticket.
+    station validation is cpu work under the gil, so it waits for the workers
+    """
+    log.info("Processing ticket: %s", os.path.basename(image_path))
+    with track_llm_usage() as llm_usage, bind_log_context(user_id=user_id):
+        try:
+            image_sha256, extracted_data, result = await read_ticket_async(
+                image_path, user_id, validate=False
+            )
+        except Exception as e:
+            image_sha256, extracted_data, result = None, None, build_processing_error(e)
+    return {
+        "image_path": image_path,
+        "image_sha256": image_sha256,
+        "extracted_data": extracted_data,
+        "llm_usage": llm_usage,
+        "result": result,
+    }
+
+
+async def read_batch_tickets_async(
+    image_paths: list, user_id: str, max_concurrency: int
+) -> list:
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def read(image_path):
+        async with slots:
+            return await read_batch_ticket_async(image_path, user_id)
+
+    return await asyncio.gather(*(read(path) for path in image_paths))
+
+
+async def check_shard_tickets_async(
+    tickets: list,
+    user_id: str,
+    submission_mode: str,
+    max_concurrency: int,
+    hsp_cache: dict,
+) -> list:
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def check(ticket):
+        async with slots:
+            # usage continues from the parent's extraction
+            with (
+                track_llm_usage(ticket["llm_usage"]) as llm_usage,
+                bind_log_context(user_id=user_id),
+            ):
+                try:
+                    # re-validating an extraction read from the cache changes nothing
+                    ticket["extracted_data"] = validate_extracted_tickets(
+                        ticket["extracted_data"]
+                    )
+                    return await check_extracted_ticket_async(
+                        ticket["image_sha256"],
+                        ticket["extracted_data"],
+                        user_id,
+                        submission_mode,
+                        hsp_cache,
+                        llm_usage,
+                        ticket.get("ticket_index"),
+                    )
+                except Exception as e:
+                    return build_processing_error(e)
+
+    return await asyncio.gather(*(check(ticket) for ticket in tickets))
+
+
+def init_shard_worker(level: int) -> None:
+    # the parent's log listener and profiler threads don't exist in the worker
+    setup_logging(level)
+    restart_profiling()
+
+
+def check_ticket_shard(
+    tickets: list, user_id: str, submission_mode: str, max_concurrency: int
+) -> dict:
+    """
+    Worker process entry: validate and check one shard on its own event loop,
+    sharing one hsp cache between its tickets. Returns the results, the
+    validated extractions and the worker's metrics.
+    """
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    # worker processes only run shards, so the totals become this shard's alone
+    reset_llm_usage_totals()
+    reset_singleflight_stats()
+    hsp_cache = new_hsp_cache()
+    results = asyncio.run(
+        check_shard_tickets_async(
+            tickets, user_id, submission_mode, max_concurrency, hsp_cache
+        )
+    )
+    return {
+        "results": results,
+        "extractions": [ticket["extracted_data"] for ticket in tickets],
+        "metrics": {
+            "tickets": len(tickets),
+            "seconds": round(time.perf_counter() - started, 3),
+            "cpu_seconds": round(time.process_time() - cpu_started, 3),
+            "metrics_responses": len(hsp_cache["metrics"]),
+            "service_details": len(hsp_cache["details"]),
+            "llm_usage": get_llm_usage_totals(),
+            "singleflight": get_singleflight_stats(),
+            "profile": collect_profile_data(),
+        },
+    }
+
+
+def merge_shard_metrics(shard_metrics: list) -> dict:
+    """
+    totals over the workers; their llm usage, single-flight counters and
+    profiles join this process's
+    """
+    merged = {
+        "workers": len(shard_metrics),
+        "tickets": 0,
+        "cpu_seconds": 0.0,
+        "metrics_responses": 0,
+        "service_details": 0,
+        "busiest_worker_seconds": 0.0,
+    }
+    for metrics in shard_metrics:
+        for field in ("tickets", "metrics_responses", "service_details"):
+            merged[field] += metrics[field]
+        merged["cpu_seconds"] = round(merged["cpu_seconds"] + metrics["cpu_seconds"], 3)
+        merged["busiest_worker_seconds"] = max(
+            merged["busiest_worker_seconds"], metrics["seconds"]
+        )
+        add_llm_usage_totals(metrics["llm_usage"])
+        add_singleflight_stats(metrics.get("singleflight", {}))
+        merge_profile_data(metrics.get("profile"))
+    return merged
+
+
+def check_tickets_sharded(
+    tickets: list,
+    user_id: str = "test_user",
+    submission_mode: str = "immediate",
+    workers: int = None,
+    max_concurrency: int = MAX_CONCURRENT_TICKETS,
+) -> tuple:
+    """
+    Validate and check extracted tickets (from read_batch_ticket_async)
+    across worker processes, sharded by corridor and date. Each ticket's
+    extracted_data is replaced by the validated one its worker checked, and
+    marked validated.
+    Returns (results in input order, merged metrics).
+    """
+    workers = workers or os.cpu_count()
+    keys = [get_shard_key(ticket["extracted_data"]) for ticket in tickets]
+    shards = plan_shards(keys, workers)
+    log.info(
+        "Checking %s ticket(s) on %s worker(s), %s corridor/date group(s)",
+        len(tickets),
+        len(shards),
+        len({key for key in keys if key is not None}),
+    )
+
+    results = [None] * len(tickets)
+    shard_metrics = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max(len(shards), 1),
+        mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=init_shard_worker,
+        initargs=(logging.getLogger().getEffectiveLevel(),),
+    ) as pool:
+        futures = [
+            pool.submit(
+                check_ticket_shard,
+                [tickets[i] for i in shard],
+                user_id,
+                submission_mode,
+                max_concurrency,
+            )
+            for shard in shards
+        ]
+        for shard, future in zip(shards, futures):
+            try:
+                output = future.result()
+            except Exception as e:
+                log.error("Worker for %s ticket(s) failed: %s", len(shard), e)
+                output = {"results": [build_processing_error(e) for _ in shard]}
+            # held as records from here - the batch can be large
+            for i, result in zip(shard, output["results"]):
+                results[i] = build_result_record(result)
+            for i, extracted_data in zip(shard, output.get("extractions", [])):
+                tickets[i]["extracted_data"] = extracted_data
+                tickets[i]["validated"] = True
+            if "metrics" in output:
+                shard_metrics.append(output["metrics"])
+
+    return results, merge_shard_metrics(shard_metrics)
+
+
+def process_tickets_sharded(
+    image_paths: list,
+    user_id: str = "test_user",
+    submission_mode: str = "immediate",
+    workers: int = None,
+    max_concurrency: int = MAX_CONCURRENT_TICKETS,
+) -> list:
+    """
+    process_tickets over several cores. Tickets are read here - extraction
+    mostly waits on openai - then validated and checked in worker processes,
+    so tickets on the same corridor and date share one worker's hsp cache.
+    Fresh extractions are remembered here once validated. Results are
+    SegmentRecords, as from process_tickets.
+    """
+    images = asyncio.run(
+        read_batch_tickets_async(image_paths, user_id, max_concurrency)
+    )
+    results = [
+        build_result_record(image["result"]) if image["result"] else None
+        for image in images
+    ]
+    # images showing several tickets are checked ticket by ticket, possibly
+    # on different workers, and put back together afterwards
+    tickets = [
+        {
+            "image_index": i,
+            "image_sha256": image["image_sha256"],
+            "extracted_data": extracted_data,
+            "llm_usage": llm_usage,
+            "ticket_index": ticket_index,
+        }
+        for i, image in enumerate(images)
+        if image["result"] is None
+        for ticket_index, extracted_data, llm_usage in split_extracted_tickets(
+            image["extracted_data"], image["llm_usage"]
+        )
+    ]
+    if not tickets:
+        return results
+
+    checked, metrics = check_tickets_sharded(
+        tickets, user_id, submission_mode, workers, max_concurrency
+    )
+    multi_ticket_results = {}
+    extractions = {}
+    # a failed worker's tickets were never validated - not kept for re-uploads
+    unvalidated = {
+        ticket["image_index"] for ticket in tickets if not ticket.get("validated")
+    }
+    for ticket, result in zip(tickets, checked):
+        if ticket["ticket_index"] is None:
+            results[ticket["image_index"]] = result
+            extractions[ticket["image_index"]] = ticket["extracted_data"]
+        else:
+            multi_ticket_results.setdefault(ticket["image_index"], []).append(result)
+            extractions.setdefault(ticket["image_index"], {"tickets": []})[
+                "tickets"
+            ].append(ticket["extracted_data"])
+    for i, ticket_results in multi_ticket_results.items():
+        results[i] = build_result_record(build_multi_ticket_result(ticket_results))
+    # now validated, fresh extractions are kept for re-uploads
+    for i, extracted_data in extractions.items():
+        if i not in unvalidated:
+            remember_extraction(images[i]["image_path"], user_id, extracted_data)
+    log.info(
+        "Checked %s ticket(s) on %s worker(s): busiest %ss, %ss cpu, "
+        "%s metrics response(s), %s service detail(s)",
+        metrics["tickets"],
+        metrics["workers"],
+        metrics["busiest_worker_seconds"],
+        metrics["cpu_seconds"],
+        metrics["metrics_responses"],
+        metrics["service_details"],
+    )
+    return results
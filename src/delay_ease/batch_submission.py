@@ -0,0 +1,274 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from src.delay_ease.browser_automation_type_a import run_type_a_session
+from src.delay_ease.circuit_breaker import CircuitOpenError, get_portal_breaker
+from src.delay_ease.const import (
+    DEFAULT_SUBMISSION_LIMITS,
+    MAX_SUBMISSION_ATTEMPTS,
+    TOC_SUBMISSION_LIMITS,
+)
+from src.delay_ease.image_store import get_record_image_path
+from src.delay_ease.llm_usage import merge_llm_usage, summarise_usage_by_toc
+from src.delay_ease.profiling import external_wait
+from src.delay_ease.scheduler import schedule_claims
+from src.delay_ease.service import (
+    PENDING_SUBMISSION,
+    get_user_details,
+    load_claim_records,
+    update_claim_record,
+)
+from src.delay_ease.structured_logging import bind_log_context
+from src.delay_ease.ticket_data_extraction import openai_breaker
+from src.delay_ease.utils import get_operator_website
+
+log = logging.getLogger(__name__)
+
+
+def get_submission_limits(
+    operator: str, max_sessions: int = None, min_spacing_seconds: float = None
+) -> dict:
+    """per-toc limits, with explicit arguments overriding the configured values"""
+    limits = {**DEFAULT_SUBMISSION_LIMITS, **TOC_SUBMISSION_LIMITS.get(operator, {})}
+    if max_sessions is not None:
+        limits["max_sessions"] = max_sessions
+    if min_spacing_seconds is not None:
+        limits["min_spacing_seconds"] = min_spacing_seconds
+    limits["max_sessions"] = max(1, limits["max_sessions"])
+    return limits
+
+
+def group_claims_by_portal(records: list) -> dict:
+    """group claim records by delay repay website - one login serves a group"""
+    groups = {}
+    for record in records:
+        website = get_operator_website(record.get("toc", ""))
+        if not website:
+            log.warning(
+                "No portal for %s, skipping %s", record.get("toc"), record["claim_id"]
+            )
+            continue
+        groups.setdefault(website, []).append(record)
+    return groups
+
+
+def build_session_claim(record: dict) -> dict:
+    return {
+        "claim_id": record["claim_id"],
+        "journey_details": {
+            "train_operator": record["toc"],
+            "date": record["journey_date"],
+            "departure_time": record.get("departure_time", ""),
+            "departure_station": record["departure_station"],
+            "arrival_station": record["arrival_station"],
+            "delay_minutes": record["delay_minutes"],
+        },
+        "ticket_image_path": get_record_image_path(record),
+    }
+
+
+def split_round_robin(items: list, n: int) -> list:
+    return [items[i::n] for i in range(n) if items[i::n]]
+
+
+def make_spacing_gate(min_spacing_seconds: float):
+    """async gate that spaces claim starts on one portal across all its sessions"""
+    lock = asyncio.Lock()
+    last_start = [None]
+
+    async def wait_for_slot():
+        async with lock:
+            if last_start[0] is not None:
+                wait = min_spacing_seconds - (time.monotonic() - last_start[0])
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            last_start[0] = time.monotonic()
+
+    return wait_for_slot
+
+
+def group_claims_by_user(records: list) -> dict:
+    """each user logs in to the portal with their own delay repay account"""
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get("user_id"), []).append(record)
+    return groups
+
+
+async def submit_portal_claims(records: list, limits: dict) -> list:
+    """
+    Submit one portal's claims, one login per (user, session). At most
+    max_sessions sessions run on the portal at once, across all users.
+    """
+    wait_for_slot = make_spacing_gate(limits["min_spacing_seconds"])
+    session_slots = asyncio.Semaphore(limits["max_sessions"])
+    portal_breaker = get_portal_breaker(get_operator_website(records[0]["toc"]))
+
+    async def run_session(user_id, user_details, session_records):
+        claims = [build_session_claim(r) for r in session_records]
+        with bind_log_context(user_id=user_id):
+            return await submit_session(user_id, user_details, claims)
+
+    async def submit_session(user_id, user_details, claims):
+        async with session_slots:
+            # a portal (or model) that is down leaves its claims pending, unattempted
+            try:
+                if not openai_breaker.is_available():
+                    raise CircuitOpenError(
+                        openai_breaker.name, openai_breaker.get_retry_in()
+                    )
+                portal_breaker.check()
+            except CircuitOpenError as e:
+                log.warning("%s - leaving %s claim(s) pending", e, len(claims))
+                return []
+
+            try:
+                with external_wait("portal"):
+                    results = await run_type_a_session(
+                        claims,
+                        user_details["passenger"],
+                        user_details["bank"],
+                        before_claim=wait_for_slot,
+                        user_id=user_id,
+                    )
+            except Exception as e:
+                log.error("Portal session failed before submitting claims: %s", e)
+                # a rejected login or a stuck agent doesn't mean the portal is down
+                portal_breaker.record_error(e)
+                return [
+                    {
+                        "claim_id": c["claim_id"],
+                        "automation_status": "failed",
+                        "automation_error": f"Session failed: {e}",
+                        "failed_stage": "login",
+                    }
+                    for c in claims
+                ]
+
+        # one submitted claim shows the portal is up; claims that failed on
+        # the forms alone do too
+        if any(r["automation_status"] == "submitted" for r in results) or not any(
+            r.get("portal_outage") for r in results
+        ):
+            portal_breaker.record_success()
+        else:
+            portal_breaker.record_failure()
+        return results
+
+    sessions = []
+    for user_id, user_records in group_claims_by_user(records).items():
+        try:
+            user_details = get_user_details(user_id)
+        except ValueError as e:
+            # a missing profile is a setup problem - leave the claims pending
+            log.error("Skipping %s claim(s) for %s: %s", len(user_records), user_id, e)
+            continue
+        for session_records in split_round_robin(user_records, limits["max_sessions"]):
+            sessions.append(run_session(user_id, user_details, session_records))
+
+    session_results = await asyncio.gather(*sessions)
+    return [result for results in session_results for result in results]
+
+
+def record_submission_result(record: dict, result: dict) -> dict:
+    if result["automation_status"] == "submitted":
+        updates = {
+            "toc_claim_reference": "AUTO_SUBMITTED",
+            "automation_status": "submitted",
+            "submitted_at": datetime.datetime.now().isoformat(),
+        }
+    else:
+        attempts = record.get("submission_attempts", 0) + 1
+        updates = {
+            "automation_status": "failed",
+            "automation_error": result.get("automation_error"),
+            "failed_stage": result.get("failed_stage"),
+            "submission_attempts": attempts,
+        }
+        # keep failed claims queued for the next batch until attempts run out
+        if attempts >= MAX_SUBMISSION_ATTEMPTS:
+            updates["toc_claim_reference"] = "SUBMISSION_FAILED"
+    # extraction usage from the run step plus every submission attempt
+    updates["llm_usage"] = merge_llm_usage(
+        record.get("llm_usage"), result.get("llm_usage")
+    )
+    return update_claim_record(record["claim_id"], updates)
+
+
+async def submit_pending_claims(
+    max_sessions: int = None, min_spacing_seconds: float = None, max_claims: int = None
+) -> list:
+    """
+    Submit pending type a claims in deadline/value priority order, logging in
+    once per portal session. max_claims admits only the top of the schedule.
+    """
+    records, expired = schedule_claims(load_claim_records(PENDING_SUBMISSION))
+    for record in expired:
+        log.warning("Claim %s expired before submission", record["claim_id"])
+        update_claim_record(
+            record["claim_id"],
+            {"toc_claim_reference": "EXPIRED", "automation_status": "expired"},
+        )
+
+    if max_claims is not None:
+        records = records[:max_claims]
+    if not records:
+        log.info("No pending claims to submit")
+        return []
+
+    # groups keep schedule order, so each session submits its most urgent claims first
+    groups = group_claims_by_portal(records)
+    log.info(
+        "Submitting %s pending claim(s) to %s portal(s)", len(records), len(groups)
+    )
+
+    records_by_id = {record["claim_id"]: record for record in records}
+
+    portal_results = await asyncio.gather(
+        *(
+            submit_portal_claims(
+                group,
+                get_submission_limits(
+                    group[0]["toc"], max_sessions, min_spacing_seconds
+                ),
+            )
+            for group in groups.values()
+        )
+    )
+
+    results = [result for results in portal_results for result in results]
+    batch_usage = []
+    for result in results:
+        record_submission_result(records_by_id[result["claim_id"]], result)
+        batch_usage.append(
+            {
+                "toc": records_by_id[result["claim_id"]]["toc"],
+                "llm_usage": result.get("llm_usage"),
+            }
+        )
+
+    submitted = sum(1 for r in results if r["automation_status"] == "submitted")
+    log.info("Batch submission finished: %s/%s submitted", submitted, len(results))
+    for toc, row in summarise_usage_by_toc(batch_usage).items():
+        total = row["usage"]["total"]
+        log.info(
+            "%s: %s claim(s), %s+%s tokens, $%.2f ($%.2f/claim, %ss/claim)",
+            toc,
+            row["claims"],
+            total["prompt_tokens"],
+            total["completion_tokens"],
+            total["cost_usd"],
+            row["cost_per_claim_usd"],
+            row["seconds_per_claim"],
+        )
+    return results
+
+
+def run_batch_submission(
+    max_sessions: int = None, min_spacing_seconds: float = None, max_claims: int = None
+) -> list:
+    return asyncio.run(
+        submit_pending_claims(max_sessions, min_spacing_seconds, max_claims)
+    )
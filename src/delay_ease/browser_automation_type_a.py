@@ -1,24 +1,93 @@
 import asyncio
+import fcntl
 import logging
 import os
+import time
+from pathlib import Path
+from urllib.parse import urljoin
 
 from browser_use import ActionResult, Agent, Browser, ChatOpenAI, Controller
 
-from src.delay_ease.builders.func_builder import build_file_input_js
+from src.delay_ease.action_traces import (
+    build_claim_slots,
+    build_login_slots,
+    build_trace_steps,
+    describe_trace_step,
+    get_trace_slot_names,
+    is_action_traces_enabled,
+    load_trace,
+    replay_trace,
+    save_trace,
+)
+from src.delay_ease.automation_metrics import (
+    build_claim_timing,
+    build_stage_timing,
+    record_claim_timing,
+)
+from src.delay_ease.builders.func_builder import (
+    build_claims_list_js,
+    build_file_input_js,
+)
 from src.delay_ease.builders.prompt_builder import (
+    build_claims_list_prompt,
     build_journey_details_prompt,
     build_login_prompt,
+    build_resume_prompt,
     build_review_prompt,
     build_ticket_details_prompt,
 )
-from src.delay_ease.const import ALLOWED_DOMAINS
-from src.delay_ease.ticket_data_extraction import extract_ticket_details
-from src.delay_ease.utils import get_operator_website
+from src.delay_ease.checkpoint import (
+    clear_checkpoint,
+    get_storage_state_path,
+    load_checkpoint,
+    save_checkpoint,
+)
+from src.delay_ease.circuit_breaker import PortalLoginError, is_portal_outage
+from src.delay_ease.const import (
+    ACTION_TRACE_CHECKED_STAGES,
+    AGENT_STAGE_BUDGETS,
+    ALLOWED_DOMAINS,
+    AUTOMATION_STAGES,
+    BROWSER_CACHE_SIZE_BYTES,
+    BROWSER_PROFILES,
+    CLAIMS_LIST_WAIT_SECONDS,
+    DEFAULT_BROWSER_PROFILE,
+    PORTAL_ASSET_HOSTS,
+    PORTAL_CLAIMS_PATH,
+    PORTAL_LOGIN_REJECTED_MARKER,
+    TRACKER_DOMAINS,
+)
+from src.delay_ease.llm_usage import (
+    merge_llm_usage,
+    new_llm_usage,
+    record_agent_usage,
+    track_llm_usage,
+)
+from src.delay_ease.structured_logging import SAMPLED, bind_log_context
+from src.delay_ease.ticket_data_extraction import (
+    extract_ticket_details,
+    get_extracted_tickets,
+)
+from src.delay_ease.user_profiles import is_profile_store_enabled, load_user_profile
+from src.delay_ease.utils import get_operator_website, get_portal_home
 
 log = logging.getLogger(__name__)
 
+# http caches kept between portal sessions so static assets are fetched once;
+# chromium can't share one cache directory, so each open browser holds a slot
+BROWSER_CACHE_DIR = Path("data/browser_cache")
+
+# cache slot lock files held by open browsers, by id(browser)
+_cache_slot_locks = {}
+
+
+def get_delay_repay_credentials(user_id: str = None):
+    if is_profile_store_enabled():
+        if not user_id:
+            raise ValueError("A user id is required when the profile store is enabled")
+        credentials = load_user_profile(user_id)["delay_repay"]
+        return credentials["email"], credentials["password"]
 
-def get_delay_repay_credentials():
     email = os.environ.get("DELAY_REPAY_EMAIL")
     password = os.environ.get("DELAY_REPAY_PASSWORD")
 
@@ -34,19 +103,19 @@ def validate_ticket_file(ticket_image_path: str) -> bool:
     try:
         abs_path = os.path.abspath(ticket_image_path)
         if not os.path.exists(abs_path):
-            log.error(f"Ticket file does not exist: {abs_path}")
+            log.error("Ticket file does not exist: %s", abs_path)
             return False
 
         file_size = os.path.getsize(abs_path)
         if file_size == 0:
-            log.error(f"Ticket file is empty: {abs_path}")
+            log.error("Ticket file is empty: %s", abs_path)
             return False
 
-        log.info(f"Ticket file validated: {abs_path} ({file_size} bytes)")
+        log.info("Ticket file validated: %s (%s bytes)", abs_path, file_size)
         return True
 
     except Exception as e:
-        log.error(f"Error validating ticket file: {str(e)}")
+        log.error("Error validating ticket file: %s", str(e))
         return False
 
 
@@ -60,65 +129,154 @@ def validate_ticket_matches_journey(
     try:
         extracted_data = extract_ticket_details(ticket_image_path)
 
-        if "error" in extracted_data:
+        # an image of several tickets is proof if one of them is for the journey
+        tickets = [
+            ticket
+            for ticket in get_extracted_tickets(extracted_data)
+            if "error" not in ticket
+        ]
+        if not tickets:
             log.warning(
-                f"SECURITY WARNING: Could not validate ticket - {extracted_data['error']}"
+                "SECURITY WARNING: Could not validate ticket - %s",
+                get_extracted_tickets(extracted_data)[0]["error"],
             )
             return False
 
-        ticket_data = (
-            extracted_data["segments"][0]
-            if "segments" in extracted_data
-            else extracted_data
-        )
-
         journey_date = journey_details["date"]
         departure_station = journey_details["departure_station"]
         arrival_station = journey_details["arrival_station"]
 
-        ticket_date = ticket_data.get("ticket_date", "")
-        ticket_departure = ticket_data.get("departure_station", "")
-        ticket_arrival = ticket_data.get("arrival_station", "")
+        for ticket in tickets:
+            ticket_data = ticket["segments"][0] if "segments" in ticket else ticket
 
-        date_match = journey_date in ticket_date or ticket_date in journey_date
-        departure_match = (
-            departure_station.lower() in ticket_departure.lower()
-            or ticket_departure.lower() in departure_station.lower()
-        )
-        arrival_match = (
-            arrival_station.lower() in ticket_arrival.lower()
-            or ticket_arrival.lower() in arrival_station.lower()
-        )
+            ticket_date = ticket_data.get("ticket_date", "")
+            ticket_departure = ticket_data.get("departure_station", "")
+            ticket_arrival = ticket_data.get("arrival_station", "")
 
-        if not (date_match and departure_match and arrival_match):
-            log.warning("SECURITY BLOCK: Ticket details don't match journey")
-            log.warning(
-                f"Journey: {journey_date}, {departure_station} → {arrival_station}"
+            date_match = journey_date in ticket_date or ticket_date in journey_date
+            departure_match = (
+                departure_station.lower() in ticket_departure.lower()
+                or ticket_departure.lower() in departure_station.lower()
             )
+            arrival_match = (
+                arrival_station.lower() in ticket_arrival.lower()
+                or ticket_arrival.lower() in arrival_station.lower()
+            )
+
+            if date_match and departure_match and arrival_match:
+                log.info("Ticket matches journey details")
+                return True
+
             log.warning(
-                f"Ticket:  {ticket_date}, {ticket_departure} → {ticket_arrival}"
+                "Ticket:  %s, %s → %s", ticket_date, ticket_departure, ticket_arrival
             )
-            return False
 
-        log.info("Ticket matches journey details")
-        return True
+        log.warning("SECURITY BLOCK: Ticket details don't match journey")
+        log.warning(
+            "Journey: %s, %s → %s", journey_date, departure_station, arrival_station
+        )
+        return False
 
     except Exception as e:
-        log.warning(f"SECURITY WARNING: Error validating ticket match - {str(e)}")
+        log.warning("SECURITY WARNING: Error validating ticket match - %s", str(e))
         return False
 
 
-async def create_browser():
-    browser = Browser(
-        headless=False,
-        user_data_dir=None,
-        window_size={"width": 1280, "height": 1080},
-        allowed_domains=ALLOWED_DOMAINS,
-        keep_alive=True,
+def get_browser_profile_name() -> str:
+    name = os.environ.get("DELAY_EASE_BROWSER_PROFILE") or DEFAULT_BROWSER_PROFILE
+    if name not in BROWSER_PROFILES:
+        raise ValueError(
+            f"Unknown browser profile: {name} (expected one of {', '.join(BROWSER_PROFILES)})"
+        )
+    return name
+
+
+def get_browser_profile() -> dict:
+    return BROWSER_PROFILES[get_browser_profile_name()]
+
+
+def build_host_resolver_rules() -> str:
+    """tracker hosts fail fast at dns, so their scripts and beacons never load"""
+    rules = []
+    for domain in TRACKER_DOMAINS:
+        rules += [f"MAP {domain} ~NOTFOUND", f"MAP *.{domain} ~NOTFOUND"]
+    rules += [f"EXCLUDE {host}" for host in PORTAL_ASSET_HOSTS]
+    return ", ".join(rules)
+
+
+def claim_cache_slot() -> tuple:
+    """
+    (cache dir, held lock file) for the first cache slot no other browser has
+    open, in this process or another - the lock goes when the file is closed
+    """
+    BROWSER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    slot = 0
+    while True:
+        lock_file = open(BROWSER_CACHE_DIR / f"slot{slot}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            slot += 1
+            continue
+        return BROWSER_CACHE_DIR / f"slot{slot}", lock_file
+
+
+def build_browser_args(profile: dict, cache_dir: Path = None) -> list:
+    if not profile["block_resources"]:
+        return []
+
+    # chromium flags rather than cdp request interception: blocking in-process
+    # avoids a devtools round trip per request
+    args = [
+        "--blink-settings=imagesEnabled=false",
+        "--disable-remote-fonts",
+    ]
+    if profile["block_hosts"]:
+        args.append(f"--host-resolver-rules={build_host_resolver_rules()}")
+    if cache_dir:
+        args += [
+            f"--disk-cache-dir={cache_dir.resolve()}",
+            f"--disk-cache-size={BROWSER_CACHE_SIZE_BYTES}",
+        ]
+    return args
+
+
+async def create_browser(storage_state: str = None):
+    """a portal browser; close it with close_browser to free its cache slot"""
+    profile = get_browser_profile()
+    cache_dir, lock_file = (
+        claim_cache_slot() if profile["block_resources"] else (None, None)
     )
+    try:
+        browser = Browser(
+            headless=profile["headless"],
+            user_data_dir=None,
+            window_size=profile["window_size"],
+            allowed_domains=ALLOWED_DOMAINS,
+            keep_alive=True,
+            storage_state=storage_state,
+            args=build_browser_args(profile, cache_dir),
+        )
+    except Exception:
+        if lock_file:
+            lock_file.close()
+        raise
+    if lock_file:
+        _cache_slot_locks[id(browser)] = lock_file
     return browser
 
 
+async def close_browser(browser) -> None:
+    try:
+        await browser.kill()
+    finally:
+        lock_file = _cache_slot_locks.pop(id(browser), None)
+        if lock_file:
+            lock_file.close()
+    log.info("Browser session closed")
+
+
 async def create_controller():
     """Create controller with file upload capability for ticket uploads"""
 
@@ -132,15 +290,15 @@ async def create_controller():
                 return ActionResult(extracted_content="Failed: Empty file path")
 
             abs_path = os.path.abspath(file_path)
-            log.info(f"Attempting to upload file: {abs_path}")
+            log.info("Attempting to upload file: %s", abs_path)
 
             if not os.path.exists(abs_path):
-                log.error(f"Error: File does not exist at path: {abs_path}")
+                log.error("Error: File does not exist at path: %s", abs_path)
                 return ActionResult(
                     extracted_content=f"Failed: File not found at {abs_path}"
                 )
 
-            log.info(f"File exists and has size: {os.path.getsize(abs_path)} bytes")
+            log.info("File exists and has size: %s bytes", os.path.getsize(abs_path))
 
             result = await page.evaluate(build_file_input_js())
             if result:
@@ -150,7 +308,7 @@ async def create_controller():
                 )
 
                 if file_input:
-                    log.info(f"Found file input, setting file: {abs_path}")
+                    log.info("Found file input, setting file: %s", abs_path)
                     await file_input.set_input_files(abs_path)
                     log.info("Successfully set input files")
 
@@ -175,65 +333,128 @@ async def create_controller():
                 )
 
         except Exception as e:
-            log.error(f"Unexpected error in upload_ticket: {str(e)}")
+            log.error("Unexpected error in upload_ticket: %s", str(e))
             return ActionResult(extracted_content=f"Failed to upload ticket: {str(e)}")
 
     return controller
 
 
-async def run_type_a_automation(
-    journey_details: dict,
-    passenger_details: dict,
-    bank_details: dict,
-    ticket_image_path: str,
-):
+async def log_agent_step(agent: Agent) -> None:
+    """sampled progress line after each agent step"""
+    steps = agent.history.history
+    url = steps[-1].state.url if steps else None
+    log.info("Step %s done at %s", len(steps), url, extra=SAMPLED)
 
-    browser = await create_browser()
 
-    try:
-        llm = ChatOpenAI(
-            model="o3",
-        )
-        # browser use update mean no controler needed, but may be needed for future versions
-        # controller = await create_controller()
-        # log.info("Controller created for file uploads")
-
-        # Get credentials with validation
-        delay_repay_email, delay_repay_password = get_delay_repay_credentials()
-
-        operator_website = get_operator_website(journey_details["train_operator"])
+async def run_agent_stage(stage: str, agent: Agent):
+    """run one stage agent within its wall-clock and step budget"""
+    budget = AGENT_STAGE_BUDGETS[stage]
+    started = time.perf_counter()
+    with bind_log_context(stage=stage):
+        try:
+            history = await asyncio.wait_for(
+                agent.run(max_steps=budget["max_steps"], on_step_end=log_agent_step),
+                timeout=budget["timeout_seconds"],
+            )
+        except asyncio.TimeoutError:
+            # the tokens were still spent - account for them before failing
+            agent.history.usage = await agent.token_cost_service.get_usage_summary()
+            record_agent_usage(
+                stage, agent.llm.model, agent.history, time.perf_counter() - started
+            )
+            raise RuntimeError(
+                f"{stage} agent exceeded its {budget['timeout_seconds']}s time budget"
+            )
 
-        login_agent = Agent(
-            task=build_login_prompt(
-                operator_website, delay_repay_email, delay_repay_password
-            ),
-            llm=llm,
-            browser=browser,
-            use_vision=False,
+    record_agent_usage(stage, agent.llm.model, history, time.perf_counter() - started)
+    if not history.is_done():
+        raise RuntimeError(
+            f"{stage} agent did not finish within {budget['max_steps']} steps"
         )
+    return history
+
+
+async def save_stage_checkpoint(
+    browser, checkpoint_id: str, checkpoint: dict, stage: str
+) -> None:
+    """persist browser storage and current url after a completed stage"""
+    storage_state_path = get_storage_state_path(checkpoint_id)
+    storage_state_path.parent.mkdir(parents=True, exist_ok=True)
+    await browser.export_storage_state(storage_state_path)
+
+    checkpoint["completed_stages"] = checkpoint.get("completed_stages", []) + [stage]
+    checkpoint["current_url"] = await browser.get_current_page_url()
+    checkpoint["storage_state_path"] = str(storage_state_path)
+    checkpoint.pop("failed_stage", None)
+    checkpoint.pop("error", None)
+    save_checkpoint(checkpoint_id, checkpoint)
+    log.info("Checkpoint saved after %s stage", stage)
+
+
+def get_delay_range(delay_minutes: float) -> str:
+    """standardised type a delay range covering the given delay"""
+    if delay_minutes < 30:
+        return "15-29 minutes"
+    elif delay_minutes < 60:
+        return "30-59 minutes"
+    elif delay_minutes < 120:
+        return "60-119 minutes"
+    else:
+        return "120+ minutes"
+
+
+def build_login_agent(
+    llm, browser, operator_website: str, email: str, password: str, **options
+) -> Agent:
+    return Agent(
+        task=build_login_prompt(operator_website, email, password),
+        llm=llm,
+        browser=browser,
+        use_vision=False,
+        **options,
+    )
 
-        await login_agent.run()
-        log.info("Login completed")
-
-        journey_date = journey_details["date"]
-        departure_time = journey_details["departure_time"]
-        departure_station = journey_details["departure_station"]
-        arrival_station = journey_details["arrival_station"]
-        delay_minutes = journey_details["delay_minutes"]
-
-        # Calculate the appropriate delay range for Type A TOCs (standardized ranges)
-        if delay_minutes < 30:
-            delay_range = "15-29 minutes"
-        elif delay_minutes < 60:
-            delay_range = "30-59 minutes"
-        elif delay_minutes < 120:
-            delay_range = "60-119 minutes"
-        else:
-            delay_range = "120+ minutes"
-
-        log.info(f"Delay: {delay_minutes} minutes → Looking for range: {delay_range}")
 
-        journey_agent = Agent(
+def build_stage_agents(
+    llm,
+    browser,
+    journey_details: dict,
+    passenger_details: dict,
+    bank_details: dict,
+    ticket_image_path: str,
+    user_id: str = None,
+) -> dict:
+    """
+    agent factories for each automation stage of one claim; keyword options
+    are passed on to the Agent
+    """
+    # Get credentials with validation
+    delay_repay_email, delay_repay_password = get_delay_repay_credentials(user_id)
+
+    operator_website = get_operator_website(journey_details["train_operator"])
+
+    journey_date = journey_details["date"]
+    departure_time = journey_details["departure_time"]
+    departure_station = journey_details["departure_station"]
+    arrival_station = journey_details["arrival_station"]
+    delay_minutes = journey_details["delay_minutes"]
+
+    # Calculate the appropriate delay range for Type A TOCs (standardized ranges)
+    delay_range = get_delay_range(delay_minutes)
+    log.info("Delay: %s minutes → Looking for range: %s", delay_minutes, delay_range)
+
+    vision_detail_level = get_browser_profile()["vision_detail_level"]
+
+    return {
+        "login": lambda **options: build_login_agent(
+            llm,
+            browser,
+            operator_website,
+            delay_repay_email,
+            delay_repay_password,
+            **options,
+        ),
+        "journey": lambda **options: Agent(
             task=build_journey_details_prompt(
                 journey_date,
                 departure_station,
@@ -245,26 +466,20 @@ async def run_type_a_automation(
             llm=llm,
             browser=browser,
             use_vision=True,
-        )
-
-        await journey_agent.run()
-        log.info("Journey details entered")
-
-        log.info("Starting ticket selection and upload...")
-        ticket_agent = Agent(
+            vision_detail_level=vision_detail_level,
+            **options,
+        ),
+        "ticket": lambda **options: Agent(
             task=build_ticket_details_prompt(ticket_image_path),
             llm=llm,
             browser=browser,
             use_vision=True,
-            directly_open_url=False,
+            vision_detail_level=vision_detail_level,
             available_file_paths=[ticket_image_path],
-        )
-
-        ticket_result = await ticket_agent.run()
-        log.info(f"Ticket upload completed: {ticket_result}")
-
-        log.info("Starting final review...")
-        review_agent = Agent(
+            # the image path would pass for a url to open first
+            **{"directly_open_url": False, **options},
+        ),
+        "review": lambda **options: Agent(
             task=build_review_prompt(
                 passenger_details,
                 bank_details,
@@ -277,12 +492,423 @@ async def run_type_a_automation(
             llm=llm,
             browser=browser,
             use_vision=True,
+            vision_detail_level=vision_detail_level,
+            **options,
+        ),
+    }
+
+
+def build_stage_slots(
+    journey_details: dict,
+    passenger_details: dict,
+    bank_details: dict,
+    ticket_image_path: str,
+    user_id: str = None,
+) -> dict:
+    """the claim's values for the slots of its stages' action traces"""
+    delay_repay_email, delay_repay_password = get_delay_repay_credentials(user_id)
+    return build_claim_slots(
+        journey_details,
+        passenger_details,
+        bank_details,
+        get_delay_range(journey_details["delay_minutes"]),
+        ticket_image_path,
+        delay_repay_email,
+        delay_repay_password,
+    )
+
+
+async def run_traced_stage(
+    stage: str, browser, portal: str, build_agent, slots: dict
+) -> dict:
+    """
+    Run a stage from the action trace learned for it on this portal: the
+    recorded steps are replayed with this claim's slot values and no llm
+    calls, and the agent takes over at the first step that no longer
+    matches the page - or after the last one, when the trace stops short of
+    the end of the stage or the stage's outcome must be checked. Whenever
+    the agent ran, its steps are learned into the trace for the next claim.
+    Returns the stage timing.
+    """
+    enabled = is_action_traces_enabled()
+    trace = load_trace(portal, stage) if enabled else None
+    steps = []
+    replayed = 0
+    replay_seconds = 0.0
+    options = {}
+    if trace and trace["steps"]:
+        missing = get_trace_slot_names(trace["steps"]) - set(slots)
+        if missing:
+            log.info(
+                "Not replaying the %s trace, no value for: %s",
+                stage,
+                ", ".join(sorted(missing)),
+            )
+        else:
+            started = time.perf_counter()
+            with bind_log_context(stage=stage):
+                replayed = await replay_trace(build_agent(), trace["steps"], slots)
+            replay_seconds = time.perf_counter() - started
+            steps = trace["steps"][:replayed]
+            if (
+                replayed == len(trace["steps"])
+                and trace.get("complete")
+                and stage not in ACTION_TRACE_CHECKED_STAGES
+            ):
+                log.info(
+                    "%s stage replayed from its trace: %s step(s) in %.1fs",
+                    stage.capitalize(),
+                    replayed,
+                    replay_seconds,
+                )
+                return await build_stage_timing(
+                    stage, None, browser, replayed, replay_seconds
+                )
+            if replayed:
+                done_steps = [describe_trace_step(step, slots) for step in steps]
+                options = {
+                    "extend_system_message": build_resume_prompt(done_steps),
+                    "directly_open_url": False,
+                }
+
+    history = await run_agent_stage(stage, build_agent(**options))
+    log.info("%s stage completed: %s", stage.capitalize(), history.final_result())
+    if stage == "login" and history.is_successful() is False:
+        result = history.final_result() or ""
+        if PORTAL_LOGIN_REJECTED_MARKER in result:
+            # the user's credentials, not the portal - keeps its breaker closed
+            raise PortalLoginError(f"Portal login rejected: {result}")
+        raise RuntimeError(f"login agent failed: {result}")
+    # after a replay the agent's verdict is the only check of what was replayed
+    if replayed and not history.is_successful():
+        raise RuntimeError(
+            f"{stage} agent did not confirm the stage after {replayed} replayed step(s)"
+        )
+    if enabled:
+        agent_steps, complete = build_trace_steps(history, slots)
+        steps += agent_steps
+        if steps:
+            save_trace(portal, stage, steps, complete, slots)
+            log.info(
+                "%s trace %s: %s replayed + %s agent step(s)%s",
+                stage.capitalize(),
+                "re-learned" if trace else "learned",
+                replayed,
+                len(agent_steps),
+                "" if complete else ", stops short of the end",
+            )
+    return await build_stage_timing(stage, history, browser, replayed, replay_seconds)
+
+
+async def run_type_a_automation(
+    journey_details: dict,
+    passenger_details: dict,
+    bank_details: dict,
+    ticket_image_path: str,
+    checkpoint_id: str = None,
+    user_id: str = None,
+):
+    checkpoint = load_checkpoint(checkpoint_id) if checkpoint_id else {}
+    completed_stages = checkpoint.get("completed_stages", [])
+    if completed_stages:
+        log.info("Resuming claim automation after stages: %s", completed_stages)
+
+    browser = await create_browser(checkpoint.get("storage_state_path"))
+    current_stage = None
+    stage_timings = []
+    automation_status = "failed"
+
+    try:
+        llm = ChatOpenAI(
+            model="o3",
+        )
+        # browser use update mean no controler needed, but may be needed for future versions
+        # controller = await create_controller()
+        # log.info("Controller created for file uploads")
+
+        stage_agents = build_stage_agents(
+            llm,
+            browser,
+            journey_details,
+            passenger_details,
+            bank_details,
+            ticket_image_path,
+            user_id,
+        )
+        slots = build_stage_slots(
+            journey_details,
+            passenger_details,
+            bank_details,
+            ticket_image_path,
+            user_id,
+        )
+        portal = get_operator_website(journey_details["train_operator"])
+
+        # resume: restore the page the last completed stage finished on
+        if completed_stages and checkpoint.get("current_url"):
+            await browser.start()
+            await browser.navigate_to(checkpoint["current_url"])
+            log.info("Restored page: %s", checkpoint["current_url"])
+
+        for stage in AUTOMATION_STAGES:
+            if stage in completed_stages:
+                log.info("Skipping %s stage (checkpointed)", stage)
+                continue
+
+            current_stage = stage
+            log.info("Starting %s stage...", stage)
+            stage_timings.append(
+                await run_traced_stage(
+                    stage, browser, portal, stage_agents[stage], slots
+                )
+            )
+
+            if checkpoint_id:
+                await save_stage_checkpoint(browser, checkpoint_id, checkpoint, stage)
+
+        if checkpoint_id:
+            clear_checkpoint(checkpoint_id)
+        automation_status = "submitted"
+
+    except Exception as e:
+        if checkpoint_id and current_stage:
+            checkpoint["failed_stage"] = current_stage
+            checkpoint["error"] = str(e)
+            save_checkpoint(checkpoint_id, checkpoint)
+        raise
+
+    finally:
+        if browser:
+            await close_browser(browser)
+        if stage_timings:
+            record_claim_timing(
+                build_claim_timing(
+                    get_browser_profile_name(),
+                    journey_details["train_operator"],
+                    stage_timings,
+                    automation_status,
+                    user_id=user_id,
+                )
+            )
+
+
+async def run_type_a_session(
+    claims: list,
+    passenger_details: dict,
+    bank_details: dict,
+    before_claim=None,
+    user_id: str = None,
+) -> list:
+    """
+    Submit several claims for one user on one portal in a single logged-in session.
+    Each claim is a dict with claim_id, journey_details and ticket_image_path.
+    Failures are isolated per claim, and failed results say whether the portal
+    looked down (portal_outage); a login failure propagates to the caller.
+    """
+    browser = await create_browser()
+    results = []
+
+    try:
+        llm = ChatOpenAI(
+            model="o3",
         )
 
-        review_result = await review_agent.run()
-        log.info(f"Review completed: {review_result}")
+        first = claims[0]
+        login_agents = build_stage_agents(
+            llm,
+            browser,
+            first["journey_details"],
+            passenger_details,
+            bank_details,
+            first["ticket_image_path"],
+            user_id,
+        )
+        portal = get_operator_website(first["journey_details"]["train_operator"])
+        with track_llm_usage() as login_usage:
+            login_timing = await run_traced_stage(
+                "login",
+                browser,
+                portal,
+                login_agents["login"],
+                build_login_slots(*get_delay_repay_credentials(user_id)),
+            )
+        log.info("Logged in once for %s claim(s)", len(claims))
+
+        portal_home = get_portal_home(portal)
+
+        for i, claim in enumerate(claims):
+            if before_claim:
+                await before_claim()
+
+            current_stage = None
+            stage_timings = []
+            # the shared login is charged to the first claim
+            claim_usage = merge_llm_usage(login_usage) if i == 0 else new_llm_usage()
+            with bind_log_context(claim_id=claim["claim_id"]):
+                try:
+                    # start each claim after the first from the portal landing page
+                    if i > 0:
+                        await browser.navigate_to(portal_home)
+
+                    stage_agents = build_stage_agents(
+                        llm,
+                        browser,
+                        claim["journey_details"],
+                        passenger_details,
+                        bank_details,
+                        claim["ticket_image_path"],
+                        user_id,
+                    )
+                    slots = build_stage_slots(
+                        claim["journey_details"],
+                        passenger_details,
+                        bank_details,
+                        claim["ticket_image_path"],
+                        user_id,
+                    )
+                    for stage in AUTOMATION_STAGES:
+                        if stage == "login":
+                            continue
+                        current_stage = stage
+                        with track_llm_usage(claim_usage):
+                            stage_timings.append(
+                                await run_traced_stage(
+                                    stage,
+                                    browser,
+                                    portal,
+                                    stage_agents[stage],
+                                    slots,
+                                )
+                            )
+
+                    log.info("Claim %s submitted", claim["claim_id"])
+                    results.append(
+                        {
+                            "claim_id": claim["claim_id"],
+                            "automation_status": "submitted",
+                            "llm_usage": claim_usage,
+                        }
+                    )
+
+                except Exception as e:
+                    log.error(
+                        "Claim %s failed at %s stage: %s",
+                        claim["claim_id"],
+                        current_stage,
+                        e,
+                    )
+                    results.append(
+                        {
+                            "claim_id": claim["claim_id"],
+                            "automation_status": "failed",
+                            "automation_error": str(e),
+                            "failed_stage": current_stage,
+                            "portal_outage": is_portal_outage(e),
+                            "llm_usage": claim_usage,
+                        }
+                    )
+
+                if stage_timings:
+                    # the shared login is recorded once, with the first claim
+                    if i == 0:
+                        stage_timings.insert(0, login_timing)
+                    record_claim_timing(
+                        build_claim_timing(
+                            get_browser_profile_name(),
+                            claim["journey_details"]["train_operator"],
+                            stage_timings,
+                            results[-1]["automation_status"],
+                            claim["claim_id"],
+                            user_id,
+                        )
+                    )
 
     finally:
         if browser:
-            await browser.close()
-            log.info("Browser session closed")
+            await close_browser(browser)
+
+    return results
+
+
+async def evaluate_js(browser, expression: str):
+    """value of a javascript expression on the current page"""
+    cdp_session = await browser.get_or_create_cdp_session()
+    result = await cdp_session.cdp_client.send.Runtime.evaluate(
+        params={"expression": expression, "returnByValue": True, "awaitPromise": True},
+        session_id=cdp_session.session_id,
+    )
+    if result.get("exceptionDetails"):
+        raise RuntimeError(
+            f"JavaScript error: {result['exceptionDetails'].get('text', 'unknown')}"
+        )
+    return result.get("result", {}).get("value")
+
+
+async def read_claim_rows(browser, claims_url: str) -> list:
+    """
+    scripted read of the claims list - each row's text and its status cell's
+    ("" without one), [] if none render
+    """
+    await browser.navigate_to(claims_url)
+    deadline = time.monotonic() + CLAIMS_LIST_WAIT_SECONDS
+    while True:
+        rows = await evaluate_js(browser, build_claims_list_js()) or []
+        if rows or time.monotonic() >= deadline:
+            return rows
+        await asyncio.sleep(1)
+
+
+async def read_portal_claims(operator_website: str, user_id: str = None) -> dict:
+    """
+    One portal session for a user: log in, then read the whole claims list,
+    scripted where the page allows it, else by an agent. Returns the method
+    used and either the rows read or the claims the agent reported.
+    """
+    delay_repay_email, delay_repay_password = get_delay_repay_credentials(user_id)
+    claims_url = urljoin(get_portal_home(operator_website), PORTAL_CLAIMS_PATH)
+
+    browser = await create_browser()
+    try:
+        llm = ChatOpenAI(
+            model="o3",
+        )
+        await run_traced_stage(
+            "login",
+            browser,
+            operator_website,
+            lambda **options: build_login_agent(
+                llm,
+                browser,
+                operator_website,
+                delay_repay_email,
+                delay_repay_password,
+                **options,
+            ),
+            build_login_slots(delay_repay_email, delay_repay_password),
+        )
+
+        try:
+            rows = await read_claim_rows(browser, claims_url)
+        except Exception as e:
+            log.warning("Scripted claims list read failed: %s", e)
+            rows = []
+        if rows:
+            return {"method": "scripted", "rows": rows}
+
+        log.info(
+            "No claim rows found at %s, reading the list with an agent", claims_url
+        )
+        history = await run_agent_stage(
+            "status",
+            Agent(
+                task=build_claims_list_prompt(claims_url),
+                llm=llm,
+                browser=browser,
+                use_vision=True,
+                vision_detail_level=get_browser_profile()["vision_detail_level"],
+            ),
+        )
+        return {"method": "agent", "report": history.final_result()}
+
+    finally:
+        await close_browser(browser)
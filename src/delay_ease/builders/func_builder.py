@@ -16,3 +16,41 @@ def build_file_input_js() -> str:
                 return false;
             })();
             """
+
+
+def build_claims_list_js() -> str:
+    return """
+            (function() {
+                const clean = text => text.replace(/\\s+/g, ' ').trim();
+                // rows of a claims table, or claim cards when the list isn't a table
+                let rows = Array.from(document.querySelectorAll('table tbody tr'))
+                    .filter(row => row.querySelector('td'));
+                if (rows.length === 0) {
+                    rows = Array.from(document.querySelectorAll(
+                        '[data-claim-id], [class*="claim-card"], [class*="claim-item"], li[class*="claim"]'
+                    ));
+                }
+                // the cell under a "Status" heading, else an element marked as the status
+                const findStatus = row => {
+                    const table = row.closest('table');
+                    if (table) {
+                        const headings = Array.from(table.querySelectorAll('thead th'))
+                            .map(th => clean(th.innerText).toLowerCase());
+                        const column = headings.findIndex(heading => heading.includes('status'));
+                        if (column >= 0 && row.children[column]) {
+                            return row.children[column];
+                        }
+                    }
+                    return row.querySelector('[data-status], [class*="status"]');
+                };
+                return rows
+                    .map(row => {
+                        const status = findStatus(row);
+                        return {
+                            text: clean(row.innerText),
+                            status: status ? clean(status.innerText) : ''
+                        };
+                    })
+                    .filter(row => row.text.length > 0);
+            })();
+            """
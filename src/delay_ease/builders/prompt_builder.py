@@ -1,14 +1,21 @@
+from src.delay_ease.const import PORTAL_LOGIN_REJECTED_MARKER, PORTAL_UNAVAILABLE_MARKER
+
+
 def build_ticket_extraction_prompt() -> str:
     prompt = (
         "Analyze this train ticket image. First, determine if this is a PAPER ticket or an E-TICKET/M-TICKET:\n"
         "- Paper tickets: Physical tickets that were printed on paper/cardstock, scanned or photographed\n"
         "- E-tickets/M-tickets: Digital tickets displayed on phone/computer screens, screenshots, or digital PDFs\n\n"
-        "If the ticket shows a single journey leg, "
-        "return a JSON dictionary with these keys exactly: "
+        "The image may show more than one ticket, e.g. an outbound and a return ticket, "
+        "or the tickets of several passengers. Return a JSON dictionary with one key 'tickets', "
+        "whose value is an array with one entry per ticket shown (an array of one for a single ticket). "
+        "Never merge two tickets into one entry, even if they are for the same journey. "
+        "If a ticket shows a single journey leg, "
+        "its entry is a dictionary with these keys exactly: "
         "'ticket_format' (either 'Paper' or 'E-ticket'), "
         "'ticket_date', 'departure_time', 'departure_station', 'departure_crs', "
         "'arrival_station', 'arrival_crs', 'ticket_type', 'railcard', and 'ctr'. "
-        "If the ticket shows multiple segments, return a JSON dictionary with one key 'segments', "
+        "If a ticket shows multiple segments, its entry is a dictionary with one key 'segments', "
         "whose value is an array of dictionaries, each with the same keys as above (including 'ticket_format'). "
         "Formatting rules (mandatory): "
         "ticket_date MUST be 'DD Mon YYYY' (e.g., '10 Jul 2025') — do NOT use 'YYYY-MM-DD' or 'DD/MM/YYYY'. "
@@ -46,6 +53,8 @@ IMPORTANT RULES:
 - Do NOT click "Make a claim" or fill out any forms - that's for the next agent
 - Just verify you are logged in and then STOP
 - Wait for each page to fully load before proceeding
+- If the site says the email or password is wrong, or the account is locked, STOP: report failure with a message starting with {PORTAL_LOGIN_REJECTED_MARKER}
+- If the site does not load or shows a server error page, STOP: report failure with a message starting with {PORTAL_UNAVAILABLE_MARKER}
 """
     return login_task
 
@@ -158,3 +167,36 @@ VERIFY (do not change):
 CRITICAL: Review all details carefully but DO NOT submit the claim. Stop at the final review page.
 """
     return review_task
+
+
+def build_claims_list_prompt(claims_url: str) -> str:
+    status_task = f"""
+CRITICAL: You are already logged in and on the delay repay website. DO NOT navigate away from this website.
+
+Read the status of every claim this account has made:
+
+1. Go to the list of submitted claims - try {claims_url} first, otherwise use the "My claims" / "Claim history" link
+2. Read every claim in the list. If the list has several pages, read all of them
+3. For each claim note: journey date, departure station, arrival station, departure time, status and claim reference
+
+Return only JSON, with no code blocks or extra text:
+{{"claims": [{{"journey_date": "DD Mon YYYY", "departure_station": "", "arrival_station": "", "departure_time": "HH:MM", "status": "", "reference": ""}}]}}
+
+IMPORTANT RULES:
+- Do NOT open, edit, withdraw or submit any claim - only read the list
+- NEVER navigate to Google or any other website
+- Use an empty string for anything the list doesn't show
+"""
+    return status_task
+
+
+def build_resume_prompt(done_steps: list) -> str:
+    """system prompt addition for an agent taking over part-way through a stage"""
+    steps = "\n".join(f"{i}. {step}" for i, step in enumerate(done_steps, 1))
+    resume_task = f"""
+The first steps of this task were already carried out on the current page, from a recording of an earlier claim:
+{steps}
+
+Check the page as it is now: make sure each of these steps took effect with this claim's details, fix anything that didn't, then carry on with the rest of the task. Do not start the task over. Only report success once the page shows the task's end state.
+"""
+    return resume_task
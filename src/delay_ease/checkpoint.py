@@ -0,0 +1,68 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = Path("data/checkpoints")
+
+
+def build_checkpoint_id(user_id: str, journey_details: dict) -> str:
+    """stable id per user and journey so a retry finds the same checkpoint"""
+    key = "|".join(
+        str(journey_details.get(field, ""))
+        for field in (
+            "train_operator",
+            "date",
+            "departure_time",
+            "departure_station",
+            "arrival_station",
+        )
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return f"{user_id}_{digest}"
+
+
+def get_checkpoint_path(checkpoint_id: str) -> Path:
+    return CHECKPOINT_DIR / f"{checkpoint_id}.json"
+
+
+def get_storage_state_path(checkpoint_id: str) -> Path:
+    return CHECKPOINT_DIR / f"{checkpoint_id}_storage.json"
+
+
+def load_checkpoint(checkpoint_id: str) -> dict:
+    path = get_checkpoint_path(checkpoint_id)
+    if not path.exists():
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return {}
+
+
+def save_checkpoint(checkpoint_id: str, checkpoint: dict) -> None:
+    CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    checkpoint["checkpoint_id"] = checkpoint_id
+    checkpoint["updated_at"] = datetime.datetime.now().isoformat()
+
+    # write then rename so a crash never leaves a half-written checkpoint
+    path = get_checkpoint_path(checkpoint_id)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(checkpoint_id: str) -> None:
+    for path in (
+        get_checkpoint_path(checkpoint_id),
+        get_storage_state_path(checkpoint_id),
+    ):
+        if path.exists():
+            path.unlink()
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+
+from src.delay_ease.const import CIRCUIT_BREAKER_SETTINGS, PORTAL_OUTAGE_MARKERS
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# every breaker by name, for status reporting
+BREAKERS = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{name} is unavailable, retrying in {retry_in:.0f}s")
+
+
+class PortalLoginError(Exception):
+    """the portal turned down a user's credentials - it is up, the login isn't"""
+
+
+def is_portal_outage(error: Exception) -> bool:
+    """timeouts, dropped connections, failed navigation and 5xx pages"""
+    if isinstance(error, PortalLoginError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in PORTAL_OUTAGE_MARKERS)
+
+
+class CircuitBreaker:
+    """
+    Fail fast on a dependency that keeps failing. After failure_threshold
+    consecutive failures the breaker opens and calls raise CircuitOpenError
+    without touching the dependency. Once reset_seconds have passed one probe
+    call is let through (half-open): success closes the breaker, failure
+    opens it again. is_failure decides which errors count against the
+    dependency - others (a bad request, say) still prove it is up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_seconds: float,
+        is_failure=None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.is_failure = is_failure or (lambda e: True)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def get_retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def is_available(self) -> bool:
+        """would a call be let through now (without reserving the probe)"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return self.get_retry_in() == 0
+            return not self._probing
+
+    def check(self) -> None:
+        """raise CircuitOpenError unless a call may go ahead"""
+        with self._lock:
+            if self.state == OPEN and self.get_retry_in() == 0:
+                self.state = HALF_OPEN
+                log.info(f"Circuit {self.name} half-open, probing")
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    self.name, self.get_retry_in() or self.reset_seconds
+                )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                log.info(f"Circuit {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    log.warning(
+                        f"Circuit {self.name} open after {self.failures} failure(s), "
+                        f"retrying in {self.reset_seconds}s"
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def record_error(self, error: Exception) -> None:
+        if self.is_failure(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def call(self, fn, *args, **kwargs):
+        self.check()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        self.check()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self.record_error(e)
+            else:
+                # cancelled - says nothing about the dependency, free the probe
+                with self._lock:
+                    self._probing = False
+            raise
+        self.record_success()
+        return result
+
+    def get_status(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in_seconds": round(self.get_retry_in(), 1),
+            "rejected": self.rejected,
+        }
+
+
+def get_breaker(name: str, is_failure=None) -> CircuitBreaker:
+    """
+    the named breaker, created on first use. settings are looked up by the
+    part before any ':' - "portal:<website>" uses the "portal" settings
+    """
+    with _breakers_lock:
+        breaker = BREAKERS.get(name)
+        if breaker is None:
+            settings = CIRCUIT_BREAKER_SETTINGS[name.split(":")[0]]
+            breaker = CircuitBreaker(name, is_failure=is_failure, **settings)
+            BREAKERS[name] = breaker
+        return breaker
+
+
+def get_portal_breaker(website: str) -> CircuitBreaker:
+    return get_breaker(f"portal:{website}", is_failure=is_portal_outage)
+
+
+def get_breaker_statuses() -> dict:
+    with _breakers_lock:
+        breakers = dict(BREAKERS)
+    return {name: breaker.get_status() for name, breaker in breakers.items()}
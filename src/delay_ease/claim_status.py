@@ -0,0 +1,278 @@
+import asyncio
+import datetime
+import json
+import logging
+import re
+
+from src.delay_ease.batch_submission import (
+    group_claims_by_portal,
+    group_claims_by_user,
+)
+from src.delay_ease.browser_automation_type_a import read_portal_claims
+from src.delay_ease.circuit_breaker import CircuitOpenError, get_portal_breaker
+from src.delay_ease.const import (
+    CLAIM_PAYMENT_PENDING_KEYWORDS,
+    CLAIM_STATUS_KEYWORDS,
+    FINAL_CLAIM_STATUSES,
+)
+from src.delay_ease.profiling import external_wait
+from src.delay_ease.service import load_claim_records, update_claim_record
+from src.delay_ease.structured_logging import bind_log_context
+from src.delay_ease.ticket_data_extraction import openai_breaker
+
+log = logging.getLogger(__name__)
+
+# claims whose status we follow up on the portal
+SUBMITTED_REFERENCE = "AUTO_SUBMITTED"
+
+DATE_FORMATS = {
+    re.compile(r"\b\d{1,2}/\d{1,2}/\d{4}\b"): ("%d/%m/%Y",),
+    re.compile(r"\b\d{4}-\d{2}-\d{2}\b"): ("%Y-%m-%d",),
+    re.compile(r"\b\d{1,2} [A-Za-z]{3,9} \d{4}\b"): ("%d %b %Y", "%d %B %Y"),
+}
+
+
+def build_keyword_pattern(keywords: tuple) -> re.Pattern:
+    return re.compile(r"\b(" + "|".join(map(re.escape, keywords)) + r")\b")
+
+
+PAYMENT_PENDING_PATTERN = build_keyword_pattern(CLAIM_PAYMENT_PENDING_KEYWORDS)
+STATUS_PATTERNS = {
+    status: build_keyword_pattern(keywords)
+    for status, keywords in CLAIM_STATUS_KEYWORDS.items()
+}
+PORTAL_STATUS_MAX_CHARS = 200
+
+
+def normalise_text(text: str) -> str:
+    """lowercase words for matching: "London King's Cross" -> "london kings cross" """
+    text = re.sub(r"['.]", "", str(text).lower())
+    return " ".join(re.sub(r"[^a-z0-9:/-]+", " ", text).split())
+
+
+def parse_row_dates(text: str) -> set:
+    """every date shown in a row - a list can show journey and submission dates"""
+    dates = set()
+    for pattern, formats in DATE_FORMATS.items():
+        for value in pattern.findall(text):
+            for fmt in formats:
+                try:
+                    dates.add(datetime.datetime.strptime(value, fmt).date())
+                    break
+                except ValueError:
+                    continue
+    return dates
+
+
+def get_claim_status(text: str) -> str:
+    """
+    our claim status for the portal's wording, or None if it isn't recognised.
+    Paid and rejected are final - a claim is never checked again - so they are
+    only taken when nothing else in the wording matches
+    """
+    normalised = normalise_text(text)
+    if PAYMENT_PENDING_PATTERN.search(normalised):
+        return "in_progress"
+    statuses = [
+        status
+        for status, pattern in STATUS_PATTERNS.items()
+        if pattern.search(normalised)
+    ]
+    if len(statuses) == 1:
+        return statuses[0]
+    # e.g. "submitted 01/09/2025 approved", or paid and rejected at once
+    pending = [status for status in statuses if status not in FINAL_CLAIM_STATUSES]
+    return pending[0] if pending else None
+
+
+def parse_claim_row(text: str, status_text: str = None, reference: str = "") -> dict:
+    return {
+        "dates": parse_row_dates(text),
+        "text": normalise_text(text),
+        "claim_status": get_claim_status(status_text or text),
+        "portal_status": " ".join((status_text or text).split())[
+            :PORTAL_STATUS_MAX_CHARS
+        ],
+        "reference": reference,
+    }
+
+
+def parse_agent_claims(report: str) -> list:
+    """the claims an agent read off the list, as rows like the scripted read's"""
+    report = (report or "").strip()
+    # agents sometimes wrap the json in a code block despite the prompt
+    report = re.sub(r"^```(?:json)?|```$", "", report).strip()
+    try:
+        claims = json.loads(report).get("claims", [])
+    except (ValueError, AttributeError):
+        log.warning("Could not read the agent's claims list: %s", report[:200])
+        return []
+
+    rows = []
+    for claim in claims:
+        fields = (
+            "journey_date",
+            "departure_station",
+            "arrival_station",
+            "departure_time",
+        )
+        text = " ".join(str(claim.get(field) or "") for field in fields)
+        rows.append(
+            parse_claim_row(
+                text, str(claim.get("status") or ""), str(claim.get("reference") or "")
+            )
+        )
+    return rows
+
+
+def is_row_match(record: dict, row: dict) -> bool:
+    return (
+        normalise_text(record.get("departure_station", "")) in row["text"]
+        and normalise_text(record.get("arrival_station", "")) in row["text"]
+    )
+
+
+def match_claim_rows(records: list, rows: list) -> dict:
+    """
+    claim_id -> portal row, matched on journey date and both stations. Each row
+    matches one claim at most; a row showing the claim's departure time wins
+    """
+    rows_by_date = {}
+    for i, row in enumerate(rows):
+        for date in row["dates"]:
+            rows_by_date.setdefault(date, []).append(i)
+
+    used = set()
+    matches = {}
+    for record in records:
+        try:
+            journey_date = datetime.datetime.strptime(
+                record.get("journey_date", ""), "%d %b %Y"
+            ).date()
+        except ValueError:
+            continue
+        candidates = [
+            i
+            for i in rows_by_date.get(journey_date, [])
+            if i not in used and is_row_match(record, rows[i])
+        ]
+        if not candidates:
+            continue
+        departure_time = record.get("departure_time") or ""
+        timed = [
+            i
+            for i in candidates
+            if departure_time and departure_time in rows[i]["text"]
+        ]
+        best = (timed or candidates)[0]
+        used.add(best)
+        matches[record["claim_id"]] = rows[best]
+    return matches
+
+
+def build_status_updates(row: dict, checked_at: str) -> dict:
+    updates = {"portal_status": row["portal_status"], "status_checked_at": checked_at}
+    if row["claim_status"]:
+        updates["claim_status"] = row["claim_status"]
+    if row["reference"]:
+        updates["portal_reference"] = row["reference"]
+    return updates
+
+
+async def reconcile_user_claims(
+    website: str, user_id: str, records: list, dry_run: bool
+) -> dict:
+    """one login and one read of the claims list, however many claims are pending"""
+    with external_wait("portal"):
+        portal = await read_portal_claims(website, user_id)
+    if portal["method"] == "scripted":
+        # the status cell, where the list has one, is read on its own - the
+        # rest of a row can hold words like "submitted" or "paid by"
+        rows = [parse_claim_row(row["text"], row["status"]) for row in portal["rows"]]
+    else:
+        rows = parse_agent_claims(portal["report"])
+
+    matches = match_claim_rows(records, rows)
+    checked_at = datetime.datetime.now().isoformat()
+    summary = {
+        "website": website,
+        "user_id": user_id,
+        "method": portal["method"],
+        "claims": len(records),
+        "rows": len(rows),
+        "matched": len(matches),
+        "changed": 0,
+        "by_status": {},
+    }
+    for record in records:
+        row = matches.get(record["claim_id"])
+        if row is None:
+            continue
+        updates = build_status_updates(row, checked_at)
+        status = updates.get("claim_status", "unknown")
+        summary["by_status"][status] = summary["by_status"].get(status, 0) + 1
+        if status != record.get("claim_status"):
+            summary["changed"] += 1
+            log.info(
+                "%s: %s → %s", record["claim_id"], record.get("claim_status"), status
+            )
+        if not dry_run:
+            update_claim_record(record["claim_id"], updates)
+    return summary
+
+
+async def reconcile_portal_claims(website: str, records: list, dry_run: bool) -> list:
+    """each user with claims on the portal gets one session, one after another"""
+    breaker = get_portal_breaker(website)
+    summaries = []
+    for user_id, user_records in group_claims_by_user(records).items():
+        with bind_log_context(user_id=user_id):
+            try:
+                if not openai_breaker.is_available():
+                    raise CircuitOpenError(
+                        openai_breaker.name, openai_breaker.get_retry_in()
+                    )
+                breaker.check()
+            except CircuitOpenError as e:
+                log.warning("%s - not checking %s claim(s)", e, len(user_records))
+                continue
+
+            try:
+                summary = await reconcile_user_claims(
+                    website, user_id, user_records, dry_run
+                )
+            except Exception as e:
+                log.error("Claims list read failed on %s: %s", website, e)
+                breaker.record_error(e)
+                continue
+            breaker.record_success()
+            summaries.append(summary)
+    return summaries
+
+
+async def reconcile_claim_statuses_async(dry_run: bool = False) -> list:
+    """
+    Bring submitted claims up to date with their portals: per portal and user,
+    log in once, read the claims list and update every claim found on it.
+    Claims already paid or rejected are not checked again.
+    """
+    records = [
+        record
+        for record in load_claim_records(SUBMITTED_REFERENCE)
+        if record.get("claim_status") not in FINAL_CLAIM_STATUSES
+    ]
+    if not records:
+        return []
+
+    # portals are independent - read them at the same time
+    portal_summaries = await asyncio.gather(
+        *(
+            reconcile_portal_claims(website, portal_records, dry_run)
+            for website, portal_records in group_claims_by_portal(records).items()
+        )
+    )
+    return [summary for summaries in portal_summaries for summary in summaries]
+
+
+def reconcile_claim_statuses(dry_run: bool = False) -> list:
+    return asyncio.run(reconcile_claim_statuses_async(dry_run))
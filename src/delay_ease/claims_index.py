@@ -0,0 +1,279 @@
+import datetime
+import json
+import logging
+import math
+import os
+from array import array
+from itertools import repeat
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+INDEX_DIR = Path("data/index/claims")
+CLAIMS_DIR = Path("data/claims")
+RESULTS_DIR = Path("data/results")
+
+# dictionary-encoded string columns; "claim_id" codes double as row numbers
+STRING_COLUMNS = ("claim_id", "user_id", "toc", "status", "reference", "corridor")
+NUMERIC_COLUMNS = {
+    "journey_day": "i",
+    "delay_minutes": "d",
+    "compensation_pct": "d",
+    "compensation_amount": "d",
+}
+
+GROUP_KEYS = ("toc", "status", "reference", "corridor", "user", "date", "week", "month")
+DATE_KEYS = ("date", "week", "month")
+
+
+def parse_journey_day(value) -> int:
+    """journey date as a proleptic ordinal, 0 when missing or unreadable"""
+    for fmt in ("%d %b %Y", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(str(value), fmt).toordinal()
+        except ValueError:
+            continue
+    return 0
+
+
+def parse_percentage(value) -> float:
+    try:
+        return float(str(value).rstrip("%"))
+    except ValueError:
+        return 0.0
+
+
+def build_index_row(record: dict, source_name: str) -> dict:
+    """normalise a claim record or a result file into index columns"""
+    amount = record.get("compensation_amount")
+    return {
+        "claim_id": record.get("claim_id") or f"result:{source_name}",
+        "user_id": record.get("user_id") or "",
+        "toc": record.get("toc") or record.get("train_operator") or "Unknown",
+        "status": record.get("status") or "unknown",
+        "reference": record.get("toc_claim_reference") or "",
+        "corridor": f"{record.get('departure_station', '?')} → {record.get('arrival_station', '?')}",
+        "journey_day": parse_journey_day(
+            record.get("journey_date") or record.get("ticket_date")
+        ),
+        "delay_minutes": float(record.get("delay_minutes") or 0.0),
+        "compensation_pct": parse_percentage(
+            record.get("compensation_percentage", "0%")
+        ),
+        "compensation_amount": float(amount) if amount else math.nan,
+    }
+
+
+def new_index() -> dict:
+    index = {
+        "rows": 0,
+        "last_mtime": 0.0,
+        "last_files": [],
+        "dictionaries": {name: [] for name in STRING_COLUMNS},
+        "columns": {name: array("I") for name in STRING_COLUMNS},
+    }
+    for name, typecode in NUMERIC_COLUMNS.items():
+        index["columns"][name] = array(typecode)
+    index["lookup"] = {name: {} for name in STRING_COLUMNS}
+    return index
+
+
+def load_index() -> dict:
+    manifest_file = INDEX_DIR / "manifest.json"
+    if not manifest_file.exists():
+        return new_index()
+
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+
+    index = new_index()
+    index.update(
+        {k: manifest[k] for k in ("rows", "last_mtime", "last_files", "dictionaries")}
+    )
+    for name, column in index["columns"].items():
+        with open(INDEX_DIR / f"{name}.bin", "rb") as f:
+            column.fromfile(f, index["rows"])
+    index["lookup"] = {
+        name: {value: code for code, value in enumerate(values)}
+        for name, values in index["dictionaries"].items()
+    }
+    return index
+
+
+def save_index(index: dict) -> None:
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    for name, column in index["columns"].items():
+        tmp_path = INDEX_DIR / f"{name}.bin.tmp"
+        with open(tmp_path, "wb") as f:
+            column.tofile(f)
+        os.replace(tmp_path, INDEX_DIR / f"{name}.bin")
+
+    manifest = {
+        k: index[k] for k in ("rows", "last_mtime", "last_files", "dictionaries")
+    }
+    with open(INDEX_DIR / "manifest.json.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(INDEX_DIR / "manifest.json.tmp", INDEX_DIR / "manifest.json")
+
+
+def encode(index: dict, name: str, value: str) -> int:
+    lookup = index["lookup"][name]
+    if value not in lookup:
+        lookup[value] = len(index["dictionaries"][name])
+        index["dictionaries"][name].append(value)
+    return lookup[value]
+
+
+def upsert_row(index: dict, row: dict) -> None:
+    """append a new claim, or overwrite its row when the record was updated"""
+    row_number = encode(index, "claim_id", row["claim_id"])
+    is_new = row_number == index["rows"]
+
+    for name in STRING_COLUMNS:
+        code = row_number if name == "claim_id" else encode(index, name, row[name])
+        if is_new:
+            index["columns"][name].append(code)
+        else:
+            index["columns"][name][row_number] = code
+    for name in NUMERIC_COLUMNS:
+        if is_new:
+            index["columns"][name].append(row[name])
+        else:
+            index["columns"][name][row_number] = row[name]
+
+    if is_new:
+        index["rows"] += 1
+
+
+def find_new_files(index: dict) -> list:
+    """(mtime, path) for record files written since the last update"""
+    seen_at_last = set(index["last_files"])
+    new_files = []
+    for source_dir in (CLAIMS_DIR, RESULTS_DIR):
+        if not source_dir.exists():
+            continue
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                mtime = entry.stat().st_mtime
+                if mtime > index["last_mtime"] or (
+                    mtime == index["last_mtime"] and entry.path not in seen_at_last
+                ):
+                    new_files.append((mtime, entry.path))
+    return sorted(new_files)
+
+
+def update_index(rebuild: bool = False) -> dict:
+    """ingest only claim/result files newer than the last run"""
+    index = new_index() if rebuild else load_index()
+    new_files = find_new_files(index)
+
+    for mtime, path in new_files:
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Skipping unreadable record {path}: {e}")
+            continue
+        # results that became claims are indexed through the claim record
+        if Path(path).parent == RESULTS_DIR and record.get("claim_id"):
+            continue
+        upsert_row(index, build_index_row(record, os.path.basename(path)))
+
+    if new_files:
+        index["last_mtime"] = new_files[-1][0]
+        index["last_files"] = [p for m, p in new_files if m == index["last_mtime"]]
+        save_index(index)
+
+    log.info(f"Indexed {len(new_files)} new file(s), {index['rows']} record(s) total")
+    return index
+
+
+def get_group_label(index: dict, key: str, code: int) -> str:
+    if key in DATE_KEYS:
+        if not code:
+            return "unknown"
+        day = datetime.date.fromordinal(code)
+        if key == "date":
+            return day.isoformat()
+        if key == "week":
+            year, week, _ = day.isocalendar()
+            return f"{year}-W{week:02d}"
+        return day.strftime("%Y-%m")
+    return index["dictionaries"][get_group_column(key)][code]
+
+
+def get_group_column(key: str) -> str:
+    if key in DATE_KEYS:
+        return "journey_day"
+    return "user_id" if key == "user" else key
+
+
+def query_index(
+    index: dict,
+    group_by: list,
+    toc: str = None,
+    status: str = None,
+    since: datetime.date = None,
+    until: datetime.date = None,
+) -> list:
+    """grouped counts, average delay and compensation totals over matching rows"""
+    unknown = [key for key in group_by if key not in GROUP_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown group-by keys: {', '.join(unknown)}")
+
+    columns = index["columns"]
+    toc_code = index["lookup"]["toc"].get(toc, -1) if toc else None
+    status_code = index["lookup"]["status"].get(status, -1) if status else None
+    since_day = since.toordinal() if since else 0
+    until_day = until.toordinal() if until else math.inf
+
+    # aggregate on raw codes and day ordinals; labels are resolved per group at the end
+    key_columns = [columns[get_group_column(key)] for key in group_by]
+    keys = zip(*key_columns) if key_columns else repeat((), index["rows"])
+    groups = {}
+    for key, toc_value, status_value, day, delay, pct, amount in zip(
+        keys,
+        columns["toc"],
+        columns["status"],
+        columns["journey_day"],
+        columns["delay_minutes"],
+        columns["compensation_pct"],
+        columns["compensation_amount"],
+    ):
+        if toc_code is not None and toc_value != toc_code:
+            continue
+        if status_code is not None and status_value != status_code:
+            continue
+        if day < since_day or day > until_day:
+            continue
+
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = [0, 0.0, 0.0, 0.0]
+        group[0] += 1
+        group[1] += delay
+        group[2] += pct
+        if amount == amount:  # not nan
+            group[3] += amount
+
+    labelled = {}
+    for key, totals in groups.items():
+        label = tuple(get_group_label(index, k, code) for k, code in zip(group_by, key))
+        merged = labelled.setdefault(label, [0, 0.0, 0.0, 0.0])
+        for j, value in enumerate(totals):
+            merged[j] += value
+
+    return [
+        {
+            **dict(zip(group_by, label)),
+            "claims": count,
+            "avg_delay_minutes": round(delay_total / count, 1),
+            "total_compensation_pct": round(pct_total, 1),
+            "total_compensation_amount": round(amount_total, 2),
+        }
+        for label, (count, delay_total, pct_total, amount_total) in sorted(
+            labelled.items()
+        )
+    ]
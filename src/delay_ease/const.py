@@ -1,5 +1,15 @@
 HSP_SERVICE_METRICS_URL = "https://hsp-prod.rockshore.net/api/v1/serviceMetrics"
 HSP_SERVICE_DETAILS_URL = "https://hsp-prod.rockshore.net/api/v1/serviceDetails"
+# (connect, read) seconds - a dead hsp fails fast instead of pinning a worker
+HSP_REQUEST_TIMEOUT_SECONDS = (5, 30)
+# read size for streamed serviceMetrics responses
+HSP_STREAM_CHUNK_BYTES = 64 * 1024
+
+# vision extraction: per-request timeout and the openai client's own retries
+OPENAI_REQUEST_TIMEOUT_SECONDS = 60
+OPENAI_MAX_RETRIES = 1
+# room for every ticket on a screenshot of several, at ~150 tokens a ticket
+EXTRACTION_MAX_TOKENS = 1500
 
 TYPE_A_TOCS = {
     "CrossCountry": "https://delayrepay.crosscountrytrains.co.uk/en/login",
@@ -19,3 +29,292 @@ ALLOWED_DOMAINS = [
     "https://delayrepay.northernrailway.co.uk",  # Northern
     "https://delayrepay.southwesternrailway.com",  # South Western Railway & Island Line
 ]
+
+# delay repay claims must be made within this many days of travel
+CLAIM_WINDOW_DAYS = 28
+
+# pre-hsp eligibility rules, evaluated in order before any network i/o
+PREFILTER_RULES = ("claim_window", "no_compensation_toc", "ticket_type")
+
+# ticket types the single-ticket compensation table does not cover
+UNSUPPORTED_TICKET_TYPES = ("season", "flexi", "carnet", "rover", "ranger")
+
+# type a claim automation stages, run in order by separate agents
+AUTOMATION_STAGES = ("login", "journey", "ticket", "review")
+
+# per-stage budgets so a stuck agent is stopped instead of burning tokens
+AGENT_STAGE_BUDGETS = {
+    "login": {"max_steps": 15, "timeout_seconds": 180},
+    "journey": {"max_steps": 30, "timeout_seconds": 420},
+    "ticket": {"max_steps": 20, "timeout_seconds": 300},
+    "review": {"max_steps": 25, "timeout_seconds": 420},
+    # claims list read by an agent when the scripted read finds nothing
+    "status": {"max_steps": 15, "timeout_seconds": 240},
+}
+
+# batched submission limits per portal, to stay under anti-abuse thresholds
+DEFAULT_SUBMISSION_LIMITS = {"max_sessions": 1, "min_spacing_seconds": 30}
+TOC_SUBMISSION_LIMITS = {
+    "CrossCountry": {"max_sessions": 2, "min_spacing_seconds": 20},
+}
+MAX_SUBMISSION_ATTEMPTS = 3
+
+# submission scheduling: browser capacity and how deadline, value and fairness trade off
+SUBMISSION_CAPACITY_PER_HOUR = 20
+AT_RISK_MARGIN_HOURS = 24
+FAIRNESS_PENALTY_HOURS = 6
+AVERAGE_FARE_GBP = 25.0
+VALUE_REFERENCE_GBP = 20.0
+
+# hsp results that usually mean actuals aren't published yet - re-checked later.
+# "degraded" tickets were parked because hsp or openai was down
+DEGRADED_STATUS = "degraded"
+DEFERRABLE_STATUSES = ("error_no_delay_data", "error_no_services", DEGRADED_STATUS)
+RECHECK_BASE_DELAY_MINUTES = 60
+DEGRADED_RECHECK_BASE_MINUTES = 5
+RECHECK_MAX_DELAY_HOURS = 24
+RECHECK_MAX_ATTEMPTS = 12
+
+# daily commute monitoring checks the previous day once hsp actuals are published
+MONITOR_RUN_TIME = "04:00"
+
+# decrypted user profiles are cached in-process for this long
+PROFILE_CACHE_TTL_SECONDS = 300
+
+# browser profiles for portal sessions, picked with DELAY_EASE_BROWSER_PROFILE.
+# performance runs headless, skips images/remote fonts and analytics/tag hosts,
+# keeps on-disk http caches and sends low-detail screenshots to the agents
+BROWSER_PROFILES = {
+    "standard": {
+        "headless": False,
+        "window_size": {"width": 1280, "height": 1080},
+        "vision_detail_level": "auto",
+        "block_resources": False,
+        "block_hosts": False,
+    },
+    "performance": {
+        "headless": True,
+        "window_size": {"width": 1024, "height": 768},
+        "vision_detail_level": "low",
+        "block_resources": True,
+        "block_hosts": True,
+    },
+}
+DEFAULT_BROWSER_PROFILE = "standard"
+
+# analytics, tag manager and ad beacon domains (and their subdomains) a profile
+# with block_hosts fails at dns: the portals load them on every page, and no
+# form needs them to work
+TRACKER_DOMAINS = [
+    "googletagmanager.com",
+    "google-analytics.com",
+    "analytics.google.com",
+    "doubleclick.net",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "connect.facebook.net",
+    "hotjar.com",
+    "hotjar.io",
+    "clarity.ms",
+    "bat.bing.com",
+    "snap.licdn.com",
+    "px.ads.linkedin.com",
+    "analytics.tiktok.com",
+    "js-agent.newrelic.com",
+    "nr-data.net",
+    "contentsquare.net",
+    "quantummetric.com",
+    "demdex.net",
+    "omtrdc.net",
+    "adsrvr.org",
+]
+
+# third-party hosts a portal needs to work, never blocked even if a tracker
+# domain above covers them: the captcha providers the login forms embed
+PORTAL_ASSET_HOSTS = [
+    "www.google.com",  # recaptcha
+    "www.gstatic.com",
+    "www.recaptcha.net",
+    "hcaptcha.com",
+    "*.hcaptcha.com",
+    "challenges.cloudflare.com",  # turnstile
+]
+
+BROWSER_CACHE_SIZE_BYTES = 200 * 1024 * 1024
+
+# tickets processed at once by process_tickets - each immediate claim holds a browser
+MAX_CONCURRENT_TICKETS = 8
+
+# multi-leg tickets: "through" scores the whole journey on final-arrival delay,
+# "segment" scores every leg separately. set with DELAY_EASE_MULTILEG_MODE
+MULTILEG_MODES = ("through", "segment")
+# a connection counts as made with at least this long between arrival and the
+# onward departure (or the booked gap, if that was shorter)
+MIN_INTERCHANGE_MINUTES = 2
+# how far past a missed connection to look for the next onward service
+REPLACEMENT_SEARCH_MINUTES = 180
+
+# near-duplicate ticket images: 64-bit dhash, matched within this many bits,
+# searched by multi-index hashing over this many 16-bit chunks. a re-crop that
+# cuts into the ticket moves the dhash by up to ~11 bits, so the reach is wide
+# and only the closest few candidates go on to the detail check below
+IMAGE_NEAR_DUPLICATE_MAX_DISTANCE = 11
+IMAGE_HASH_CHUNKS = 4
+IMAGE_CONFIRM_MAX_CANDIDATES = 5
+# a dhash barely moves when a ticket's date or time text changes, so a near
+# match is only reused if grayscale copies this wide agree everywhere they
+# overlap, once registered for a re-crop's scale and offset. the status bar
+# rows at the top are left out, and the overlap must cover this much of each
+# copy's width and height
+IMAGE_CONFIRM_WIDTH = 384
+IMAGE_CONFIRM_STATUS_BAR_ROWS = 48
+IMAGE_CONFIRM_MIN_OVERLAP = 0.75
+# mean difference over any window this many pixels square, after a slight
+# blur (re-crops and re-saves stay within ~13, one changed digit reaches 25+)
+IMAGE_CONFIRM_WINDOW = 9
+IMAGE_CONFIRM_MAX_DIFFERENCE = 18
+# images held in in-memory tails before merging into the sorted on-disk tables
+IMAGE_INDEX_COMPACT_ROWS = 50_000
+
+# list prices used for llm cost accounting, usd per million tokens
+LLM_PRICES_USD_PER_MTOK = {
+    "gpt-4.1": {"prompt": 2.00, "completion": 8.00},
+    "o3": {"prompt": 2.00, "completion": 8.00},
+}
+
+# circuit breakers per dependency: open after this many consecutive failures,
+# then let one probe call through every reset_seconds. portals get one each
+CIRCUIT_BREAKER_SETTINGS = {
+    "hsp": {"failure_threshold": 5, "reset_seconds": 60},
+    "openai": {"failure_threshold": 5, "reset_seconds": 60},
+    "portal": {"failure_threshold": 3, "reset_seconds": 900},
+}
+# error wording that means a portal itself is down: chromium network errors,
+# navigation failures and 5xx pages, plus the marker agents report them with.
+# a claim an agent couldn't complete, or a user's rejected login, is no outage
+PORTAL_UNAVAILABLE_MARKER = "PORTAL_UNAVAILABLE"
+PORTAL_LOGIN_REJECTED_MARKER = "LOGIN_REJECTED"
+PORTAL_OUTAGE_MARKERS = (
+    PORTAL_UNAVAILABLE_MARKER.lower(),
+    "net::err_",
+    "navigation failed",
+    "navigation timeout",
+    "500 internal server error",
+    "502 bad gateway",
+    "503 service unavailable",
+    "504 gateway timeout",
+)
+
+# ticket images sent to portals: upright jpeg, longest side capped
+UPLOAD_IMAGE_MAX_SIDE = 2000
+UPLOAD_IMAGE_JPEG_QUALITY = 85
+
+# stored ticket images are kept while a claim with one of these references (or
+# a failed submission, or a pending re-check) needs them, and for this long
+# after their last upload
+IMAGE_KEEP_CLAIM_REFERENCES = (
+    "PENDING_SUBMISSION",
+    "MANUAL_REQUIRED",
+    "SUBMISSION_FAILED",
+)
+IMAGE_GC_GRACE_HOURS = 24
+
+# log records carry these fields from the bound log context; per-step lines
+# marked as sampled are kept one in this many (DELAY_EASE_LOG_SAMPLE_EVERY)
+LOG_CONTEXT_FIELDS = ("user_id", "claim_id", "stage")
+LOG_SAMPLE_EVERY = 10
+# loggers whose info lines are all per-step chatter, sampled like SAMPLED lines
+LOG_SAMPLED_LOGGERS = ("browser_use",)
+
+# claim status reconciliation: the claims list page on the shared type a portal
+# platform, and how long its rows may take to render
+PORTAL_CLAIMS_PATH = "/en/claims"
+CLAIMS_LIST_WAIT_SECONDS = 10
+# wording that says the money is still to come - checked first, so "approved -
+# payment pending" or "not paid" is never read as paid
+CLAIM_PAYMENT_PENDING_KEYWORDS = (
+    "not paid",
+    "not yet paid",
+    "unpaid",
+    "payment pending",
+    "pending payment",
+    "awaiting payment",
+    "payment due",
+    "to be paid",
+    "not approved",
+    "not accepted",
+    "not completed",
+)
+# portal status wording per claim status. A final status is only taken when it
+# is the only one the wording matches; mixed wording keeps the claim checked
+CLAIM_STATUS_KEYWORDS = {
+    "rejected": ("rejected", "declined", "unsuccessful", "not eligible", "refused"),
+    "query": ("query", "more information", "action required", "awaiting your"),
+    "paid": ("paid", "payment sent", "approved", "accepted", "completed"),
+    "in_progress": (
+        "in progress",
+        "under review",
+        "submitted",
+        "received",
+        "processing",
+        "pending",
+    ),
+}
+FINAL_CLAIM_STATUSES = ("paid", "rejected")
+
+# --profile: pipeline stages that can be profiled, how often the sampler reads
+# the stacks, and how many calls per stage get a tracemalloc snapshot diff
+PROFILE_STAGES = (
+    "reference_loading",
+    "validate_extracted_data",
+    "extract_delay_info",
+    "result_serialization",
+)
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.005
+PROFILE_SNAPSHOTS_PER_STAGE = 5
+# deep enough to reach the stage's caller from inside csv/json internals
+PROFILE_TRACEMALLOC_FRAMES = 32
+PROFILE_TOP_ALLOCATIONS = 10
+
+# learned action traces: tries per replayed step while its page settles, and
+# the pause after each one
+ACTION_TRACE_STEP_ATTEMPTS = 3
+ACTION_TRACE_STEP_DELAY_SECONDS = 1.0
+# actions a trace may replay, with the parameters that must be a slot value
+ACTION_TRACE_ACTIONS = {
+    "click": (),
+    "input": ("text",),
+    "select_dropdown": ("text",),
+    "upload_file": ("path",),
+}
+# element attributes that can carry a claim's data; a slot value in one of
+# them identifies the element, any other digits make it unsafe to replay
+ACTION_TRACE_DATA_ATTRIBUTES = (
+    "id",
+    "name",
+    "value",
+    "aria-label",
+    "title",
+    "href",
+    "for",
+    "placeholder",
+    "data-testid",
+    "data-test",
+    "data-cy",
+)
+# elements that are one choice among several (delay band, ticket type, date):
+# replayed only when a slot value identifies them
+ACTION_TRACE_CHOICE_TAGS = ("option", "li", "td", "label")
+ACTION_TRACE_CHOICE_ROLES = (
+    "radio",
+    "checkbox",
+    "option",
+    "menuitem",
+    "menuitemradio",
+    "gridcell",
+    "tab",
+    "listitem",
+    "treeitem",
+)
+# stages whose outcome the agent always checks after a replay, never the trace
+ACTION_TRACE_CHECKED_STAGES = ("review",)
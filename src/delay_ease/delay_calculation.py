@@ -3,14 +3,44 @@ import csv
 import datetime
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
-from src.delay_ease.const import HSP_SERVICE_DETAILS_URL, HSP_SERVICE_METRICS_URL
+from src.delay_ease.circuit_breaker import CircuitOpenError, get_breaker
+from src.delay_ease.const import (
+    CLAIM_WINDOW_DAYS,
+    DEGRADED_STATUS,
+    HSP_REQUEST_TIMEOUT_SECONDS,
+    HSP_SERVICE_DETAILS_URL,
+    HSP_SERVICE_METRICS_URL,
+    HSP_STREAM_CHUNK_BYTES,
+    MIN_INTERCHANGE_MINUTES,
+    MULTILEG_MODES,
+    PREFILTER_RULES,
+    REPLACEMENT_SEARCH_MINUTES,
+    UNSUPPORTED_TICKET_TYPES,
+)
+from src.delay_ease.hsp_archive import (
+    archive_metrics,
+    archive_service,
+    get_archive_mode,
+    get_minutes,
+    lookup_archived_service,
+)
+from src.delay_ease.json_stream import iter_array_items
+from src.delay_ease.profiling import external_wait, profile_stage
+from src.delay_ease.records import SegmentRecord
+from src.delay_ease.singleflight import SingleFlight
 from src.delay_ease.ticket_data_extraction import extract_ticket_details, get_data_path
+from src.delay_ease.utils import is_test_mode
 
 log = logging.getLogger(__name__)
 
+metrics_flight = SingleFlight("hsp_service_metrics")
+details_flight = SingleFlight("hsp_service_details")
+stream_flight = SingleFlight("hsp_service_metrics_stream")
+
 
 def get_hsp_credentials():
     """Get HSP credentials with fail-fast validation"""
@@ -31,12 +61,82 @@ def hsp_auth_header(email, password):
 
 
 def get_service_metrics(from_loc, to_loc, from_time, to_time, from_date, to_date, days):
+    """serviceMetrics lookup - concurrent identical queries share one request"""
+    args = (from_loc, to_loc, from_time, to_time, from_date, to_date, days)
+    key = tuple(arg.strip() for arg in args)
+    return metrics_flight.do(key, fetch_service_metrics, *args)
+
+
+def find_metrics_service(query: dict, ticket_dep_time: str) -> tuple:
+    """
+    (service departing at ticket_dep_time or None, services read) - streams
+    the serviceMetrics response and stops reading at the match
+    """
+    key = (*(value.strip() for value in query.values()), ticket_dep_time.strip())
+    return stream_flight.do(key, stream_service_metrics, query, ticket_dep_time)
+
+
+def get_service_details(rid):
+    """serviceDetails lookup - concurrent lookups of one rid share one request"""
+    return details_flight.do(rid.strip(), fetch_service_details, rid)
+
+
+def is_hsp_outage(error: Exception) -> bool:
+    """timeouts, connection errors, 5xx and rate limiting - not bad requests"""
+    if isinstance(
+        error,
+        (
+            requests.Timeout,
+            requests.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    ):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code == 429
+    return False
+
+
+def is_hsp_unavailable(error: Exception) -> bool:
+    return isinstance(error, CircuitOpenError) or is_hsp_outage(error)
+
+
+hsp_breaker = get_breaker("hsp", is_failure=is_hsp_outage)
+
+
+def post_hsp(url: str, payload: dict, read=None):
+    """
+    post to hsp through its circuit breaker - fails fast while hsp is down.
+    read(response) consumes a streamed response instead of parsing it whole
+    """
     hsp_email, hsp_password = get_hsp_credentials()
     headers = {
         "Content-Type": "application/json",
         **hsp_auth_header(hsp_email, hsp_password),
     }
-    payload = {
+
+    def send():
+        with (
+            external_wait("hsp"),
+            requests.post(
+                url,
+                json=payload,
+                headers=headers,
+                timeout=HSP_REQUEST_TIMEOUT_SECONDS,
+                stream=read is not None,
+            ) as response,
+        ):
+            response.raise_for_status()
+            return read(response) if read else response.json()
+
+    return hsp_breaker.call(send)
+
+
+def build_metrics_payload(
+    from_loc, to_loc, from_time, to_time, from_date, to_date, days
+) -> dict:
+    return {
         "from_loc": from_loc.strip(),
         "to_loc": to_loc.strip(),
         "from_time": from_time.strip(),
@@ -45,32 +145,161 @@ def get_service_metrics(from_loc, to_loc, from_time, to_time, from_date, to_date
         "to_date": to_date.strip(),
         "days": days.strip(),
     }
-    response = requests.post(HSP_SERVICE_METRICS_URL, json=payload, headers=headers)
-    response.raise_for_status()
-    return response.json()
 
 
-def get_service_details(rid):
-    hsp_email, hsp_password = get_hsp_credentials()
-    headers = {
-        "Content-Type": "application/json",
-        **hsp_auth_header(hsp_email, hsp_password),
+def fetch_service_metrics(
+    from_loc, to_loc, from_time, to_time, from_date, to_date, days
+):
+    payload = build_metrics_payload(
+        from_loc, to_loc, from_time, to_time, from_date, to_date, days
+    )
+    return post_hsp(HSP_SERVICE_METRICS_URL, payload)
+
+
+def stream_service_metrics(query: dict, ticket_dep_time: str) -> tuple:
+    def read(response):
+        seen = 0
+        services = iter_array_items(
+            response.iter_content(HSP_STREAM_CHUNK_BYTES), "Services"
+        )
+        for service in services:
+            seen += 1
+            if is_service_departure(service, ticket_dep_time):
+                return service, seen
+        return None, seen
+
+    return post_hsp(HSP_SERVICE_METRICS_URL, build_metrics_payload(**query), read)
+
+
+def fetch_service_details(rid):
+    return post_hsp(HSP_SERVICE_DETAILS_URL, {"rid": rid.strip()})
+
+
+def get_hsp_unavailable_status() -> dict:
+    return {
+        "delay_status": "HSP unavailable",
+        "status": DEGRADED_STATUS,
+        "message": "Rail performance data is temporarily unavailable. Your ticket has been queued and we'll check it again automatically shortly.",
+        "next_action": "await_recheck",
     }
-    payload = {"rid": rid.strip()}
-    response = requests.post(HSP_SERVICE_DETAILS_URL, json=payload, headers=headers)
-    response.raise_for_status()
-    return response.json()
+
+
+def is_service_departure(service: dict, ticket_dep_time: str) -> bool:
+    svc_dep_time = service["serviceAttributesMetrics"].get("gbtt_ptd", "").strip()
+    return svc_dep_time == ticket_dep_time.strip()
 
 
 def find_service_by_dep_time(services, ticket_dep_time):
-    ticket_dep_time = ticket_dep_time.strip()
     for service in services:
-        svc_dep_time = service["serviceAttributesMetrics"].get("gbtt_ptd", "").strip()
-        if svc_dep_time == ticket_dep_time:
+        if is_service_departure(service, ticket_dep_time):
             return service
     return None
 
 
+def get_hsp_days(parsed_date: datetime.datetime) -> str:
+    weekday_index = parsed_date.weekday()
+    if weekday_index < 5:
+        return "WEEKDAY"
+    elif weekday_index == 5:
+        return "SATURDAY"
+    else:
+        return "SUNDAY"
+
+
+def build_metrics_query(ticket_data: dict) -> dict:
+    """hsp serviceMetrics parameters for a ticket: a window around its departure"""
+    parsed_date = datetime.datetime.strptime(ticket_data["ticket_date"], "%d %b %Y")
+    hsp_date = parsed_date.strftime("%Y-%m-%d")
+    dep_hour = int(ticket_data["departure_time"].replace(":", "")[:2])
+
+    return {
+        "from_loc": ticket_data["departure_crs"],
+        "to_loc": ticket_data["arrival_crs"],
+        "from_time": f"{max(dep_hour - 1, 0):02d}00",
+        "to_time": f"{min(dep_hour + 1, 23):02d}59",
+        "from_date": hsp_date,
+        "to_date": hsp_date,
+        "days": get_hsp_days(parsed_date),
+    }
+
+
+def get_corridor_key(query: dict) -> tuple:
+    return (
+        query["from_loc"].strip(),
+        query["to_loc"].strip(),
+        query["from_date"],
+        query["to_date"],
+        query["days"],
+    )
+
+
+def merge_metrics_queries(queries: list) -> list:
+    """coalesce queries for the same corridor and date into one covering window"""
+    merged = {}
+    for query in queries:
+        key = get_corridor_key(query)
+        if key not in merged:
+            merged[key] = dict(query)
+        else:
+            merged[key]["from_time"] = min(merged[key]["from_time"], query["from_time"])
+            merged[key]["to_time"] = max(merged[key]["to_time"], query["to_time"])
+    return list(merged.values())
+
+
+def new_hsp_cache(keep_metrics: bool = True) -> dict:
+    """
+    per-run store of hsp responses shared between tickets. without
+    keep_metrics, lookups stream each metrics response only as far as the
+    ticket's train instead of reading and caching all of it
+    """
+    return {"metrics": [], "details": {}, "keep_metrics": keep_metrics}
+
+
+def find_cached_metrics(query: dict, hsp_cache: dict) -> dict:
+    """a cached response whose window covers the query, or None"""
+    key = get_corridor_key(query)
+    for cached_query, metrics_data in hsp_cache["metrics"]:
+        if (
+            get_corridor_key(cached_query) == key
+            and cached_query["from_time"] <= query["from_time"]
+            and cached_query["to_time"] >= query["to_time"]
+        ):
+            return metrics_data
+    return None
+
+
+def get_cached_service_metrics(query: dict, hsp_cache: dict) -> dict:
+    """reuse any cached response whose window covers the query, else fetch it"""
+    metrics_data = find_cached_metrics(query, hsp_cache)
+    if metrics_data is not None:
+        return metrics_data
+
+    metrics_data = get_service_metrics(**query)
+    hsp_cache["metrics"].append((query, metrics_data))
+    return metrics_data
+
+
+def get_cached_service_details(rid: str, hsp_cache: dict) -> dict:
+    if rid not in hsp_cache["details"]:
+        hsp_cache["details"][rid] = get_service_details(rid)
+    return hsp_cache["details"][rid]
+
+
+def prefetch_service_metrics(tickets: list, hsp_cache: dict) -> int:
+    """one merged metrics query per corridor/date for a group of tickets"""
+    queries = merge_metrics_queries([build_metrics_query(t) for t in tickets])
+    for query in queries:
+        try:
+            get_cached_service_metrics(query, hsp_cache)
+        except Exception as e:
+            # left to the per-ticket lookup, which reports the api error
+            log.warning(
+                "Prefetch failed for %s-%s: %s", query["from_loc"], query["to_loc"], e
+            )
+    return len(queries)
+
+
+@profile_stage("extract_delay_info")
 def extract_delay_info(service_details, departure_crs, arrival_crs):
     dep_info = {}
     arr_info = {}
@@ -108,6 +337,7 @@ def extract_delay_info(service_details, departure_crs, arrival_crs):
     return result
 
 
+@profile_stage("reference_loading")
 def load_tok_codes(csv_filename="toc_code.csv") -> dict:
     tok_dict = {}
     with open(get_data_path(csv_filename), newline="") as csvfile:
@@ -120,6 +350,7 @@ def load_tok_codes(csv_filename="toc_code.csv") -> dict:
     return tok_dict
 
 
+@profile_stage("reference_loading")
 def load_delay_repay(csv_filename="delay_repay_percentages_single_tickets.csv") -> dict:
     percentages = {}
     with open(get_data_path(csv_filename), newline="") as csvfile:
@@ -181,10 +412,10 @@ def get_delay_repay_percentage(
 def get_detailed_status_message(
     delay_minutes: float, operator: str, days_old: int, compensation_pct: str
 ) -> dict:
-    if days_old > 28:
+    if days_old > CLAIM_WINDOW_DAYS:
         return {
             "status": "ineligible_age",
-            "message": f"Your journey was {days_old} days ago, which exceeds the 28-day claim window. UK delay repay claims must be submitted within 28 days of travel.",
+            "message": f"Your journey was {days_old} days ago, which exceeds the {CLAIM_WINDOW_DAYS}-day claim window. UK delay repay claims must be submitted within {CLAIM_WINDOW_DAYS} days of travel.",
             "next_action": "learn_more",
             "learn_more_topic": "claim_deadlines",
         }
@@ -223,155 +454,538 @@ def get_detailed_status_message(
     }
 
 
+def get_operator_name(toc_code: str, tok_codes: dict) -> str:
+    """map a toc code to the full operator name"""
+    toc_code = (toc_code or "").strip().upper()
+    if toc_code and toc_code in tok_codes:
+        return tok_codes[toc_code]
+    return "Unknown"
+
+
+def check_claim_window(ticket_data: dict, context: dict) -> dict:
+    if context["test_mode"] or context["days_old"] <= CLAIM_WINDOW_DAYS:
+        return None
+    status_info = get_detailed_status_message(0, "Unknown", context["days_old"], "0%")
+    status_info["delay_status"] = f"Ticket is older than {CLAIM_WINDOW_DAYS} days"
+    return status_info
+
+
+def check_toc_compensation(ticket_data: dict, context: dict) -> dict:
+    operator = ticket_data.get("train_operator") or get_operator_name(
+        ticket_data.get("toc_code", ""), context["tok_codes"]
+    )
+    if operator in ("", "Unknown", "N/A"):
+        return None
+    if get_toc_minimum_delay(operator, context["delay_csv_filename"]) != 999:
+        return None
+    status_info = get_detailed_status_message(0, operator, context["days_old"], "0%")
+    status_info["train_operator"] = operator
+    status_info["delay_status"] = "Operator does not offer compensation"
+    return status_info
+
+
+def check_ticket_type(ticket_data: dict, context: dict) -> dict:
+    ticket_type = (ticket_data.get("ticket_type") or "").strip()
+    if not any(t in ticket_type.lower() for t in UNSUPPORTED_TICKET_TYPES):
+        return None
+    return {
+        "delay_status": "Unsupported ticket type",
+        "status": "ineligible_ticket_type",
+        "message": f"{ticket_type} tickets aren't supported yet. Delay EASE currently handles single journey tickets only.",
+        "next_action": "learn_more",
+        "learn_more_topic": "ticket_types",
+    }
+
+
+PREFILTER_CHECKS = {
+    "claim_window": check_claim_window,
+    "no_compensation_toc": check_toc_compensation,
+    "ticket_type": check_ticket_type,
+}
+
+
+def get_prefilter_rules() -> list:
+    """enabled pre-filter rules, overridable with DELAY_EASE_PREFILTER_RULES"""
+    configured = os.environ.get("DELAY_EASE_PREFILTER_RULES", "").strip()
+    if not configured:
+        return list(PREFILTER_RULES)
+    if configured.lower() == "none":
+        return []
+    rules = [r.strip() for r in configured.split(",") if r.strip()]
+    unknown = [r for r in rules if r not in PREFILTER_CHECKS]
+    if unknown:
+        raise ValueError(f"Unknown pre-filter rules: {', '.join(unknown)}")
+    return rules
+
+
+def run_prefilter(ticket_data: dict, context: dict, rules: list) -> dict:
+    """evaluate pre-filter rules in order - returns the first rejection or None"""
+    for rule in rules:
+        status_info = PREFILTER_CHECKS[rule](ticket_data, context)
+        if status_info:
+            log.info("Pre-filter '%s' rejected ticket: %s", rule, status_info["status"])
+            return status_info
+    return None
+
+
+def lookup_hsp_service(
+    ticket_data: dict,
+    hsp_cache: dict,
+    prefilter_rules: list,
+    prefilter_context: dict,
+    archive: bool = False,
+) -> tuple:
+    """(service_details, None) for the ticket's train, or (None, status_info)"""
+    ticket_dep_time = ticket_data["departure_time"].replace(":", "")
+
+    query = build_metrics_query(ticket_data)
+    metrics_data = find_cached_metrics(query, hsp_cache)
+    # the archive needs the whole response, as do later tickets sharing the cache
+    stream = (
+        metrics_data is None and not archive and not hsp_cache.get("keep_metrics", True)
+    )
+    try:
+        if stream:
+            matching_service, services_read = find_metrics_service(
+                query, ticket_dep_time
+            )
+        else:
+            metrics_data = get_cached_service_metrics(query, hsp_cache)
+            services = metrics_data.get("Services", [])
+            matching_service = find_service_by_dep_time(services, ticket_dep_time)
+            services_read = len(services)
+    except Exception as e:
+        if is_hsp_unavailable(e):
+            log.warning("HSP unavailable, parking ticket: %s", e)
+            return None, get_hsp_unavailable_status()
+        return None, {
+            "delay_status": f"Metrics API error: {e}",
+            "status": "error_api",
+            "message": f"Unable to verify delays due to a technical issue: {e}. Please try again later.",
+            "next_action": "retry",
+        }
+
+    if not services_read:
+        return None, {
+            "delay_status": "No matching services",
+            "status": "error_no_services",
+            "message": "No matching train services found for your journey. This may be due to incomplete schedule data.",
+            "next_action": "manual_check",
+        }
+
+    if matching_service is None:
+        return None, {
+            "delay_status": "No matching service found",
+            "status": "error_no_match",
+            "message": "Could not find your specific train service. Please ensure your ticket details are clear and try again.",
+            "next_action": "upload_clearer_photo",
+        }
+
+    # metrics already carry the toc code, so re-check it before the details call
+    if "no_compensation_toc" in prefilter_rules:
+        status_info = check_toc_compensation(
+            {"toc_code": matching_service["serviceAttributesMetrics"].get("toc_code")},
+            prefilter_context,
+        )
+        if status_info:
+            return None, status_info
+
+    rid_list = matching_service["serviceAttributesMetrics"]["rids"]
+    matching_rid = rid_list[0]
+    try:
+        service_details = get_cached_service_details(matching_rid, hsp_cache)
+    except Exception as e:
+        if not is_hsp_unavailable(e):
+            raise
+        log.warning("HSP unavailable, parking ticket: %s", e)
+        return None, get_hsp_unavailable_status()
+
+    if archive:
+        try:
+            archive_metrics(metrics_data, query["from_loc"], query["to_loc"])
+            archive_service(
+                matching_service, service_details, query["from_loc"], query["to_loc"]
+            )
+        except Exception as e:
+            log.warning("Could not archive HSP responses: %s", e)
+
+    return service_details, None
+
+
+def build_prefilter_context(
+    ticket_data: dict, tok_codes: dict, delay_csv_filename: str
+) -> dict:
+    parsed_date = datetime.datetime.strptime(ticket_data["ticket_date"], "%d %b %Y")
+    return {
+        "days_old": (datetime.datetime.now() - parsed_date).days,
+        "test_mode": is_test_mode(),
+        "tok_codes": tok_codes,
+        "delay_csv_filename": delay_csv_filename,
+    }
+
+
+def resolve_ticket_service(
+    ticket_data: dict, hsp_cache: dict, prefilter_rules: list, prefilter_context: dict
+) -> tuple:
+    """(service_details, None) from the local archive or live hsp, or (None, status_info)"""
+    archive_mode = get_archive_mode()
+    if archive_mode != "off":
+        parsed_date = datetime.datetime.strptime(ticket_data["ticket_date"], "%d %b %Y")
+        archived = lookup_archived_service(
+            ticket_data["departure_crs"],
+            ticket_data["arrival_crs"],
+            parsed_date.strftime("%Y-%m-%d"),
+            ticket_data["departure_time"].replace(":", ""),
+        )
+        if archived:
+            log.info("Delay data found in local HSP archive")
+            return archived[1], None
+
+    return lookup_hsp_service(
+        ticket_data,
+        hsp_cache,
+        prefilter_rules,
+        prefilter_context,
+        archive=archive_mode == "collect",
+    )
+
+
+def set_no_delay_data(ticket_data: dict) -> dict:
+    ticket_data["delay_status"] = "Delay data unavailable"
+    ticket_data.update(
+        {
+            "status": "error_no_delay_data",
+            "message": "Delay information is not available for this journey. This may be due to incomplete performance data.",
+            "next_action": "manual_check",
+        }
+    )
+    return ticket_data
+
+
+def apply_compensation(
+    ticket_data: dict,
+    delay_minutes: float,
+    operator_full: str,
+    days_old: int,
+    delay_csv_filename: str,
+) -> dict:
+    """score a delay against the operator's delay repay brackets"""
+    ticket_data["delay_minutes"] = delay_minutes
+    ticket_data["train_operator"] = operator_full
+
+    # get compensation percentage based on delay and operator
+    comp_pct = get_delay_repay_percentage(
+        delay_minutes, operator_full, delay_csv_filename
+    )
+    ticket_data["compensation_percentage"] = comp_pct
+
+    status_info = get_detailed_status_message(
+        delay_minutes, operator_full, days_old, comp_pct
+    )
+    ticket_data.update(status_info)
+
+    min_delay = get_toc_minimum_delay(operator_full, delay_csv_filename)
+    if delay_minutes < min_delay or comp_pct == "0%":
+        ticket_data["delay_status"] = "Delay does not qualify"
+    else:
+        ticket_data["delay_status"] = "Delayed"
+    return ticket_data
+
+
 def process_ticket_delay(
     ticket_data,
     toc_csv_filename="toc_code.csv",
     delay_csv_filename="delay_repay_percentages_single_tickets.csv",
+    prefilter_rules=None,
+    hsp_cache=None,
 ) -> dict:
     tok_codes = load_tok_codes(toc_csv_filename)
     departure_crs = ticket_data["departure_crs"]
     arrival_crs = ticket_data["arrival_crs"]
 
-    parsed_date = datetime.datetime.strptime(ticket_data["ticket_date"], "%d %b %Y")
-    days_old = (datetime.datetime.now() - parsed_date).days
+    # pre-filter: reject tickets that can't qualify before spending hsp quota
+    if prefilter_rules is None:
+        prefilter_rules = get_prefilter_rules()
+    prefilter_context = build_prefilter_context(
+        ticket_data, tok_codes, delay_csv_filename
+    )
+    status_info = run_prefilter(ticket_data, prefilter_context, prefilter_rules)
+    if status_info:
+        ticket_data.update(status_info)
+        return ticket_data
 
-    # TEST OVERRIDE: Temporarily disable early return for tickets older than 28 days
-    # if days_old > 28:
-    #     status_info = get_detailed_status_message(0, "Unknown", days_old, "0%")
-    #     ticket_data["delay_status"] = "Ticket is older than 28 days"
-    #     ticket_data.update(status_info)
-    #     return ticket_data
+    if hsp_cache is None:
+        # nothing else will read this ticket's metrics - stream to its train
+        hsp_cache = new_hsp_cache(keep_metrics=False)
 
-    hsp_date = parsed_date.strftime("%Y-%m-%d")
-    ticket_dep_time = ticket_data["departure_time"].replace(":", "")
+    service_details, status_info = resolve_ticket_service(
+        ticket_data, hsp_cache, prefilter_rules, prefilter_context
+    )
+    if status_info:
+        ticket_data.update(status_info)
+        return ticket_data
 
-    dep_hour = int(ticket_dep_time[:2])
-    from_time_str = f"{max(dep_hour - 1, 0):02d}00"
-    to_time_str = f"{min(dep_hour + 1, 23):02d}59"
+    delay_info = extract_delay_info(service_details, departure_crs, arrival_crs)
+    if delay_info.get("arrival_delay_minutes") is None:
+        return set_no_delay_data(ticket_data)
 
-    weekday_index = parsed_date.weekday()
-    if weekday_index < 5:
-        days = "WEEKDAY"
-    elif weekday_index == 5:
-        days = "SATURDAY"
-    else:
-        days = "SUNDAY"
+    # map toc code to full operator name
+    operator_full = get_operator_name(delay_info.get("toc_code", ""), tok_codes)
+    apply_compensation(
+        ticket_data,
+        delay_info["arrival_delay_minutes"],
+        operator_full,
+        prefilter_context["days_old"],
+        delay_csv_filename,
+    )
 
-    try:
-        metrics_data = get_service_metrics(
-            from_loc=departure_crs,
-            to_loc=arrival_crs,
-            from_time=from_time_str,
-            to_time=to_time_str,
-            from_date=hsp_date,
-            to_date=hsp_date,
-            days=days,
+    ticket_data.update(delay_info)
+    return ticket_data
+
+
+def get_multileg_mode() -> str:
+    """through (whole-journey delay) or segment (legacy per-segment scoring)"""
+    mode = os.environ.get("DELAY_EASE_MULTILEG_MODE", "").strip().lower() or "through"
+    if mode not in MULTILEG_MODES:
+        raise ValueError(
+            f"Unknown multi-leg mode: {mode} (expected one of {', '.join(MULTILEG_MODES)})"
         )
-    except Exception as e:
-        ticket_data["delay_status"] = f"Metrics API error: {e}"
-        ticket_data.update(
-            {
-                "status": "error_api",
-                "message": f"Unable to verify delays due to a technical issue: {e}. Please try again later.",
-                "next_action": "retry",
-            }
+    return mode
+
+
+def get_journey_minutes(hhmm: str, after: int) -> int:
+    """minutes since midnight on the journey date, rolling past midnight after `after`"""
+    minutes = get_minutes(hhmm)
+    while minutes < after - 720:
+        minutes += 1440
+    return minutes
+
+
+def build_through_ticket(segments: list) -> dict:
+    """journey-level ticket fields: origin from the first leg, destination from the last"""
+    first, last = segments[0], segments[-1]
+    journey = {
+        k: first[k]
+        for k in ("ticket_date", "ticket_type", "railcard", "ctr", "ticket_format")
+        if k in first
+    }
+    journey.update(
+        {
+            "departure_time": first.get("departure_time", ""),
+            "departure_station": first.get("departure_station", ""),
+            "departure_crs": first.get("departure_crs", ""),
+            "arrival_station": last.get("arrival_station", ""),
+            "arrival_crs": last.get("arrival_crs", ""),
+            "journey_mode": "through",
+        }
+    )
+    return journey
+
+
+def resolve_leg(leg: dict, resolved: tuple, tok_codes: dict) -> dict:
+    service_details, status_info = resolved
+    leg = dict(leg)
+    if status_info:
+        leg.update(status_info)
+        return leg
+
+    leg.update(
+        extract_delay_info(service_details, leg["departure_crs"], leg["arrival_crs"])
+    )
+    leg["delay_minutes"] = leg["arrival_delay_minutes"]
+    leg["train_operator"] = get_operator_name(leg.get("toc_code", ""), tok_codes)
+    return leg
+
+
+def find_next_service(leg: dict, earliest: int, hsp_cache: dict) -> tuple:
+    """first service on a leg's corridor departing at or after `earliest` minutes"""
+    if earliest >= 1440:
+        return None, None
+    latest = min(earliest + REPLACEMENT_SEARCH_MINUTES, 1439)
+    query = {
+        **build_metrics_query(leg),
+        "from_time": f"{earliest // 60:02d}{earliest % 60:02d}",
+        "to_time": f"{latest // 60:02d}{latest % 60:02d}",
+    }
+    metrics_data = get_cached_service_metrics(query, hsp_cache)
+
+    candidates = [
+        service
+        for service in metrics_data.get("Services", [])
+        if service["serviceAttributesMetrics"].get("gbtt_ptd", "").strip()
+        and get_minutes(service["serviceAttributesMetrics"]["gbtt_ptd"].strip())
+        >= earliest
+    ]
+    if not candidates:
+        return None, None
+    service = min(
+        candidates, key=lambda s: s["serviceAttributesMetrics"]["gbtt_ptd"].strip()
+    )
+    rid = service["serviceAttributesMetrics"]["rids"][0]
+    return get_cached_service_details(rid, hsp_cache), None
+
+
+def check_connections(legs: list, tok_codes: dict, hsp_cache: dict) -> list:
+    """
+    Walk the legs in order. Where the passenger arrived too late for the
+    ticketed connection, move the onward leg to the next service they could
+    have caught. Returns one connection summary per interchange.
+    """
+    connections = []
+    for i in range(1, len(legs)):
+        prev, leg = legs[i - 1], legs[i]
+        connection = {
+            "station": leg.get("departure_station", ""),
+            "crs": leg.get("departure_crs", ""),
+        }
+        connections.append(connection)
+
+        arrived = prev.get("F_actual_ta")
+        departed = leg.get("I_actual_td") or leg.get("I_gbtt_ptd")
+        if not arrived or not departed or not prev.get("F_gbtt_pta"):
+            # no actuals for one side - assume the booked connection was made
+            connection["status"] = "unverified"
+            continue
+
+        scheduled_arrival = get_minutes(prev["F_gbtt_pta"])
+        arrived_at = get_journey_minutes(arrived, scheduled_arrival)
+        scheduled_slack = (
+            get_journey_minutes(leg["I_gbtt_ptd"], scheduled_arrival)
+            - scheduled_arrival
+            if leg.get("I_gbtt_ptd")
+            else MIN_INTERCHANGE_MINUTES
         )
-        return ticket_data
+        required = min(MIN_INTERCHANGE_MINUTES, max(scheduled_slack, 0))
+        slack = get_journey_minutes(departed, arrived_at) - arrived_at
+        connection["slack_minutes"] = slack
+        if slack >= required:
+            connection["status"] = "made"
+            continue
 
-    services = metrics_data.get("Services", [])
-    if not services:
-        ticket_data["delay_status"] = "No matching services"
-        ticket_data.update(
-            {
-                "status": "error_no_services",
-                "message": "No matching train services found for your journey. This may be due to incomplete schedule data.",
-                "next_action": "manual_check",
-            }
+        connection["status"] = "missed"
+        replacement = find_next_service(leg, arrived_at + required, hsp_cache)
+        if replacement[0] is None:
+            connection["status"] = "missed_no_replacement"
+            return connections
+
+        replaced = resolve_leg(leg, replacement, tok_codes)
+        replaced["replacement_service"] = True
+        # the onward leg is now a different train, judged on its own actuals
+        legs[i] = replaced
+        connection["replacement_departure"] = replaced.get("I_gbtt_ptd", "")
+        log.info(
+            "Missed connection at %s, next service departed %s",
+            connection["station"],
+            connection["replacement_departure"],
         )
-        return ticket_data
 
-    matching_service = find_service_by_dep_time(services, ticket_dep_time)
-    if matching_service is None:
-        ticket_data["delay_status"] = "No matching service found"
-        ticket_data.update(
-            {
-                "status": "error_no_match",
-                "message": "Could not find your specific train service. Please ensure your ticket details are clear and try again.",
-                "next_action": "upload_clearer_photo",
-            }
+    return connections
+
+
+def process_through_journey(
+    segments: list,
+    toc_csv_filename="toc_code.csv",
+    delay_csv_filename="delay_repay_percentages_single_tickets.csv",
+    prefilter_rules=None,
+    hsp_cache=None,
+) -> dict:
+    """
+    Score a multi-leg ticket as one journey: compensation follows the delay at
+    the final destination against the booked arrival, claimed from the operator
+    of the train that got the passenger there.
+    """
+    tok_codes = load_tok_codes(toc_csv_filename)
+    journey = build_through_ticket(segments)
+
+    if prefilter_rules is None:
+        prefilter_rules = get_prefilter_rules()
+    prefilter_context = build_prefilter_context(journey, tok_codes, delay_csv_filename)
+    # the claiming operator isn't known until the final leg is resolved
+    leg_rules = [r for r in prefilter_rules if r != "no_compensation_toc"]
+    status_info = run_prefilter(journey, prefilter_context, leg_rules)
+    if status_info:
+        journey.update(status_info)
+        journey["segments"] = segments
+        return journey
+
+    if hsp_cache is None:
+        # nothing else will read this ticket's metrics - stream to its train
+        hsp_cache = new_hsp_cache(keep_metrics=False)
+
+    # legs resolve side by side; the shared cache and single-flight groups
+    # collapse any identical metrics/details requests between them
+    final_index = len(segments) - 1
+    with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+        resolved = list(
+            pool.map(
+                lambda i: resolve_ticket_service(
+                    segments[i],
+                    hsp_cache,
+                    prefilter_rules if i == final_index else leg_rules,
+                    prefilter_context,
+                ),
+                range(len(segments)),
+            )
         )
-        return ticket_data
+    legs = [
+        resolve_leg(leg, result, tok_codes) for leg, result in zip(segments, resolved)
+    ]
+    booked_arrival = legs[-1].get("F_gbtt_pta")
 
-    rid_list = matching_service["serviceAttributesMetrics"]["rids"]
-    matching_rid = rid_list[0]
-    service_details = get_service_details(matching_rid)
+    # connections can't be judged without every leg's actuals
+    if any(leg.get("status") == DEGRADED_STATUS for leg in legs):
+        journey.update(get_hsp_unavailable_status())
+        journey["segments"] = legs
+        return journey
+    try:
+        journey["connections"] = check_connections(legs, tok_codes, hsp_cache)
+    except Exception as e:
+        if not is_hsp_unavailable(e):
+            raise
+        log.warning("HSP unavailable while checking connections: %s", e)
+        journey.update(get_hsp_unavailable_status())
+        journey["segments"] = legs
+        return journey
+    journey["segments"] = legs
 
-    delay_info = extract_delay_info(service_details, departure_crs, arrival_crs)
-    if delay_info.get("arrival_delay_minutes") is None:
-        ticket_data["delay_status"] = "Delay data unavailable"
-        ticket_data.update(
+    final_leg = legs[-1]
+    if final_leg.get("status"):
+        for k in ("status", "message", "next_action", "delay_status", "train_operator"):
+            if k in final_leg:
+                journey[k] = final_leg[k]
+        return journey
+
+    if any(c["status"] == "missed_no_replacement" for c in journey["connections"]):
+        journey.update(
             {
-                "status": "error_no_delay_data",
-                "message": "Delay information is not available for this journey. This may be due to incomplete performance data.",
+                "delay_status": "Missed connection",
+                "status": "error_connection_unresolved",
+                "message": "You missed a connection and we couldn't find the train you took onwards. Please check this journey manually.",
                 "next_action": "manual_check",
             }
         )
-        return ticket_data
-    else:
-        ticket_data["delay_minutes"] = delay_info["arrival_delay_minutes"]
-        # map toc code to full operator name
-        toc_code = delay_info.get("toc_code", "").strip()
-        if toc_code and toc_code.upper() in tok_codes:
-            operator_full = tok_codes[toc_code.upper()]
-        else:
-            operator_full = "Unknown"
-        ticket_data["train_operator"] = operator_full
-
-        # get compensation percentage based on delay and operator
-        comp_pct = get_delay_repay_percentage(
-            delay_info["arrival_delay_minutes"], operator_full, delay_csv_filename
-        )
-        ticket_data["compensation_percentage"] = comp_pct
+        return journey
 
-        status_info = get_detailed_status_message(
-            delay_info["arrival_delay_minutes"], operator_full, days_old, comp_pct
-        )
-        ticket_data.update(status_info)
+    if not booked_arrival or not final_leg.get("F_actual_ta"):
+        return set_no_delay_data(journey)
 
-        min_delay = get_toc_minimum_delay(operator_full, delay_csv_filename)
-        if delay_info["arrival_delay_minutes"] < min_delay or comp_pct == "0%":
-            ticket_data["delay_status"] = "Delay does not qualify"
-        else:
-            ticket_data["delay_status"] = "Delayed"
+    booked = get_minutes(booked_arrival)
+    delay = get_journey_minutes(final_leg["F_actual_ta"], booked) - booked
 
-    ticket_data.update(delay_info)
-    return ticket_data
+    apply_compensation(
+        journey,
+        float(delay),
+        final_leg["train_operator"],
+        prefilter_context["days_old"],
+        delay_csv_filename,
+    )
+    journey["toc_code"] = final_leg.get("toc_code", "")
+    journey["arrival_delay_minutes"] = float(delay)
+    return journey
 
 
 def filter_crucial_info(ticket_data):
-    crucial_fields = [
-        "ticket_date",
-        "departure_time",
-        "departure_station",
-        "departure_crs",
-        "arrival_station",
-        "arrival_crs",
-        "ticket_type",
-        "railcard",
-        "ctr",
-        "delay_minutes",
-        "train_operator",
-        "toc_code",
-        "delay_status",
-        "compensation_percentage",
-        "arrival_delay_minutes",
-        "ticket_format",
-        # include new status fields
-        "status",
-        "message",
-        "next_action",
-        "learn_more_topic",
-    ]
+    crucial_fields = SegmentRecord.FIELDS
 
     # if it's a multi-leg journey, filter each segment
     if "segments" in ticket_data:
@@ -381,6 +995,14 @@ def filter_crucial_info(ticket_data):
                 k: segment.get(k, "") for k in crucial_fields if k in segment
             }
             filtered_segments.append(filtered_segment)
+        if ticket_data.get("journey_mode") == "through":
+            # through journeys are scored and claimed at the journey level
+            filtered = {
+                k: ticket_data.get(k, "") for k in crucial_fields if k in ticket_data
+            }
+            filtered["connections"] = ticket_data.get("connections", [])
+            filtered["segments"] = filtered_segments
+            return filtered
         return {"segments": filtered_segments}
     else:
         # single leg journey - filter the ticket data directly
@@ -394,7 +1016,27 @@ def calculate_delay_compensation(
 ) -> dict:
     """main function - extract ticket data and calculate delay compensation"""
     extracted_data = extract_ticket_details(image_path)
+    if "tickets" in extracted_data:
+        # several tickets on one image share their hsp lookups
+        hsp_cache = new_hsp_cache()
+        return {
+            "tickets": [
+                check_ticket_delays(
+                    ticket, toc_csv_filename, delay_csv_filename, hsp_cache=hsp_cache
+                )
+                for ticket in extracted_data["tickets"]
+            ]
+        }
+    return check_ticket_delays(extracted_data, toc_csv_filename, delay_csv_filename)
+
 
+def check_ticket_delays(
+    extracted_data,
+    toc_csv_filename="toc_code.csv",
+    delay_csv_filename="delay_repay_percentages_single_tickets.csv",
+    hsp_cache=None,
+) -> dict:
+    """calculate delay compensation for already-extracted ticket data"""
     if "error" in extracted_data:
         return {
             "status": "error_extraction",
@@ -405,7 +1047,7 @@ def calculate_delay_compensation(
     ticket_format = extracted_data.get(
         "ticket_format", "E-ticket"
     )  # default to e-ticket for safety
-    log.info(f"Detected ticket format: {ticket_format}")
+    log.info("Detected ticket format: %s", ticket_format)
 
     # mvp: block paper tickets
     if ticket_format == "Paper":
@@ -430,8 +1072,26 @@ def calculate_delay_compensation(
                 blocked_result[field] = extracted_data[field]
         return blocked_result
 
-    # if multi-leg, process each segment
-    if "segments" in extracted_data:
+    if "segments" in extracted_data and get_multileg_mode() == "through":
+        segments = extracted_data["segments"]
+        if any(seg.get("ticket_format") == "Paper" for seg in segments):
+            result = build_through_ticket(segments)
+            result.update(
+                {
+                    "delay_status": "Paper tickets are currently not supported. Please use E-tickets or M-tickets only for this MVP version.",
+                    "status": "blocked_paper",
+                    "message": "Paper ticket segment detected. Please use e-tickets only.",
+                    "next_action": "upload_eticket",
+                    "segments": segments,
+                }
+            )
+        else:
+            result = process_through_journey(
+                segments, toc_csv_filename, delay_csv_filename, hsp_cache=hsp_cache
+            )
+
+    # segment mode: process each segment
+    elif "segments" in extracted_data:
         processed_segments = []
         for seg in extracted_data["segments"]:
             # check if this segment is a paper ticket
@@ -453,7 +1113,7 @@ def calculate_delay_compensation(
                 processed_segments.append(seg)
             else:
                 processed_seg = process_ticket_delay(
-                    seg, toc_csv_filename, delay_csv_filename
+                    seg, toc_csv_filename, delay_csv_filename, hsp_cache=hsp_cache
                 )
                 processed_segments.append(processed_seg)
 
@@ -479,7 +1139,7 @@ def calculate_delay_compensation(
             )
     else:
         result = process_ticket_delay(
-            extracted_data, toc_csv_filename, delay_csv_filename
+            extracted_data, toc_csv_filename, delay_csv_filename, hsp_cache=hsp_cache
         )
 
     return filter_crucial_info(result)
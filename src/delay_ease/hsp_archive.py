@@ -0,0 +1,343 @@
+import contextlib
+import datetime
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path("data/hsp_archive")
+
+# a partition's columns live in a version directory named by its CURRENT file;
+# writers build a new version and swap the pointer, so readers never mix two
+VERSION_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+READ_ATTEMPTS = 3
+
+# one row per service in a date/corridor partition; fixed-width byte columns,
+# one file per column, so lookups mmap and scan only the columns they need
+COLUMNS = {
+    "rid": 16,
+    "toc_code": 2,
+    "gbtt_ptd": 4,
+    "gbtt_pta": 4,
+    "has_details": 1,
+    "i_gbtt_ptd": 4,
+    "i_gbtt_pta": 4,
+    "i_actual_td": 4,
+    "i_actual_ta": 4,
+    "f_gbtt_ptd": 4,
+    "f_gbtt_pta": 4,
+    "f_actual_td": 4,
+    "f_actual_ta": 4,
+}
+
+LOCATION_FIELDS = ("gbtt_ptd", "gbtt_pta", "actual_td", "actual_ta")
+
+
+def get_archive_mode() -> str:
+    """off, read (default) or collect - collect also archives live responses"""
+    mode = os.environ.get("HSP_ARCHIVE_MODE", "").strip().lower() or "read"
+    if mode not in ("off", "read", "collect"):
+        raise ValueError(f"Unknown HSP_ARCHIVE_MODE: {mode}")
+    return mode
+
+
+def get_partition_dir(hsp_date: str, from_loc: str, to_loc: str) -> Path:
+    return ARCHIVE_DIR / hsp_date / f"{from_loc.strip()}_{to_loc.strip()}"
+
+
+def get_rid_date(rid: str) -> str:
+    """rids start with the service's run date as YYYYMMDD"""
+    return datetime.datetime.strptime(rid[:8], "%Y%m%d").strftime("%Y-%m-%d")
+
+
+@contextlib.contextmanager
+def lock_partition(partition_dir: Path):
+    """one writer per partition at a time, across threads and processes"""
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    with open(partition_dir / LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_version_dir(partition_dir: Path) -> Path:
+    """the directory holding a partition's current columns"""
+    try:
+        version = (partition_dir / VERSION_FILE).read_text().strip()
+    except FileNotFoundError:
+        # written before partitions were versioned
+        return partition_dir
+    return partition_dir / version
+
+
+def read_version(version_dir: Path, columns=None) -> dict:
+    """read columns of one partition version as lists of strings"""
+    meta_file = version_dir / "meta.json"
+    if not meta_file.exists():
+        return {}
+    with open(meta_file) as f:
+        rows = json.load(f)["rows"]
+
+    data = {}
+    for name in columns or COLUMNS:
+        width = COLUMNS[name]
+        with open(version_dir / f"{name}.col", "rb") as f:
+            if rows == 0:
+                data[name] = []
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                column = mm[: rows * width].decode("ascii")
+            data[name] = [
+                column[i : i + width].rstrip("\0")
+                for i in range(0, rows * width, width)
+            ]
+    return data
+
+
+def read_partition(partition_dir: Path, columns=None) -> dict:
+    """read columns of a partition's current version as lists of strings"""
+    for attempt in range(1, READ_ATTEMPTS + 1):
+        try:
+            return read_version(get_version_dir(partition_dir), columns)
+        except FileNotFoundError:
+            # a writer retired the version mid-read - the pointer names a newer one
+            if attempt == READ_ATTEMPTS:
+                raise
+
+
+def write_version(partition_dir: Path, records: list) -> None:
+    """write records as a new version and make it current; hold the lock"""
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    version_dir = Path(tempfile.mkdtemp(prefix="v", dir=partition_dir))
+    for name, width in COLUMNS.items():
+        column = bytearray(len(records) * width)
+        for i, record in enumerate(records):
+            value = record.get(name, "").encode("ascii")[:width]
+            column[i * width : i * width + len(value)] = value
+        with open(version_dir / f"{name}.col", "wb") as f:
+            f.write(column)
+    with open(version_dir / "meta.json", "w") as f:
+        json.dump({"rows": len(records), "columns": COLUMNS}, f)
+
+    tmp_path = partition_dir / f"{VERSION_FILE}.tmp"
+    tmp_path.write_text(version_dir.name)
+    os.replace(tmp_path, partition_dir / VERSION_FILE)
+
+    # readers that still have an old version open keep their mapped files
+    for path in partition_dir.iterdir():
+        if path.is_dir() and path != version_dir:
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.suffix == ".col" or path.name == "meta.json":
+            path.unlink(missing_ok=True)
+
+
+def write_partition(partition_dir: Path, records: list) -> None:
+    """replace a partition's records"""
+    with lock_partition(partition_dir):
+        write_version(partition_dir, records)
+
+
+def merge_into_partition(partition_dir: Path, updates: list) -> None:
+    """upsert records keyed by rid, never dropping archived details"""
+    with lock_partition(partition_dir):
+        existing = read_partition(partition_dir)
+        records = {}
+        for i, rid in enumerate(existing.get("rid", [])):
+            records[rid] = {name: existing[name][i] for name in COLUMNS}
+
+        for update in updates:
+            record = {**records.get(update["rid"], {}), **update}
+            # details-only rows still need the departure time for lookups
+            if not record.get("gbtt_ptd"):
+                record["gbtt_ptd"] = record.get("i_gbtt_ptd", "")
+            records[update["rid"]] = record
+
+        write_version(
+            partition_dir,
+            sorted(records.values(), key=lambda r: r.get("gbtt_ptd", "")),
+        )
+
+
+def build_metrics_records(metrics_data: dict) -> list:
+    records = []
+    for service in metrics_data.get("Services", []):
+        attrs = service["serviceAttributesMetrics"]
+        for rid in attrs.get("rids", []):
+            records.append(
+                {
+                    "rid": rid.strip(),
+                    "toc_code": attrs.get("toc_code", "").strip(),
+                    "gbtt_ptd": attrs.get("gbtt_ptd", "").strip(),
+                    "gbtt_pta": attrs.get("gbtt_pta", "").strip(),
+                }
+            )
+    return records
+
+
+def build_details_record(service_details: dict, from_loc: str, to_loc: str) -> dict:
+    details = service_details["serviceAttributesDetails"]
+    record = {
+        "rid": details.get("rid", "").strip(),
+        "toc_code": details.get("toc_code", "").strip(),
+        "has_details": "1",
+    }
+    for loc in details.get("locations", []):
+        location = loc.get("location", "").strip()
+        for prefix, crs in (("i_", from_loc), ("f_", to_loc)):
+            if location == crs.strip():
+                for field in LOCATION_FIELDS:
+                    record[prefix + field] = loc.get(field, "").strip()
+    return record
+
+
+def archive_metrics(metrics_data: dict, from_loc: str, to_loc: str) -> int:
+    partitions = {}
+    for record in build_metrics_records(metrics_data):
+        partitions.setdefault(get_rid_date(record["rid"]), []).append(record)
+    for hsp_date, records in partitions.items():
+        merge_into_partition(get_partition_dir(hsp_date, from_loc, to_loc), records)
+    return sum(len(records) for records in partitions.values())
+
+
+def archive_service(
+    matching_service: dict, service_details: dict, from_loc: str, to_loc: str
+) -> None:
+    """archive one service with its details, as fetched by process_ticket_delay"""
+    record = build_details_record(service_details, from_loc, to_loc)
+    if not record["rid"]:
+        record["rid"] = matching_service["serviceAttributesMetrics"]["rids"][0].strip()
+    attrs = matching_service["serviceAttributesMetrics"]
+    record["gbtt_ptd"] = attrs.get("gbtt_ptd", "").strip()
+    record["gbtt_pta"] = attrs.get("gbtt_pta", "").strip()
+    merge_into_partition(
+        get_partition_dir(get_rid_date(record["rid"]), from_loc, to_loc), [record]
+    )
+
+
+def build_archived_service(data: dict, i: int, from_loc: str, to_loc: str) -> tuple:
+    """rebuild hsp-shaped metrics and details responses for one archived row"""
+    matching_service = {
+        "serviceAttributesMetrics": {
+            "toc_code": data["toc_code"][i],
+            "gbtt_ptd": data["gbtt_ptd"][i],
+            "gbtt_pta": data["gbtt_pta"][i],
+            "rids": [data["rid"][i]],
+        }
+    }
+    service_details = {
+        "serviceAttributesDetails": {
+            "rid": data["rid"][i],
+            "toc_code": data["toc_code"][i],
+            "locations": [
+                {
+                    "location": crs,
+                    **{field: data[prefix + field][i] for field in LOCATION_FIELDS},
+                }
+                for prefix, crs in (("i_", from_loc), ("f_", to_loc))
+            ],
+        }
+    }
+    return matching_service, service_details
+
+
+def lookup_archived_service(
+    from_loc: str, to_loc: str, hsp_date: str, dep_time: str
+) -> tuple:
+    """
+    (matching_service, service_details) for the departure if the archive holds
+    its details with an actual arrival, else None so the caller goes to hsp.
+    """
+    # both reads from one version - a merge in between re-sorts the rows
+    version_dir = get_version_dir(get_partition_dir(hsp_date, from_loc, to_loc))
+    try:
+        departures = read_version(version_dir, ("gbtt_ptd",)).get("gbtt_ptd", [])
+        if dep_time.strip() not in departures:
+            return None
+        i = departures.index(dep_time.strip())
+        data = read_version(version_dir)
+    except FileNotFoundError:
+        # replaced while we read it - hsp answers this time
+        return None
+    if data["has_details"][i] != "1" or not data["f_actual_ta"][i]:
+        return None
+    return build_archived_service(data, i, from_loc.strip(), to_loc.strip())
+
+
+def get_minutes(hhmm: str) -> int:
+    return int(hhmm[:2]) * 60 + int(hhmm[2:4])
+
+
+def load_corridor_delays(
+    from_loc: str, to_loc: str, start_date: datetime.date, end_date: datetime.date
+) -> list:
+    """arrival delays for every archived service on a corridor between two dates"""
+    columns = ("rid", "toc_code", "gbtt_ptd", "f_gbtt_pta", "f_actual_ta")
+    delays = []
+    day = start_date
+    while day <= end_date:
+        hsp_date = day.strftime("%Y-%m-%d")
+        data = read_partition(get_partition_dir(hsp_date, from_loc, to_loc), columns)
+        for i, actual in enumerate(data.get("f_actual_ta", [])):
+            scheduled = data["f_gbtt_pta"][i]
+            if not actual or not scheduled:
+                continue
+            delay = get_minutes(actual) - get_minutes(scheduled)
+            if delay < -720:
+                # arrived after midnight
+                delay += 1440
+            delays.append(
+                {
+                    "date": hsp_date,
+                    "rid": data["rid"][i],
+                    "toc_code": data["toc_code"][i],
+                    "gbtt_ptd": data["gbtt_ptd"][i],
+                    "arrival_delay_minutes": float(delay),
+                }
+            )
+        day += datetime.timedelta(days=1)
+    return delays
+
+
+def ingest_dump(path: str) -> int:
+    """
+    Ingest an exported dump: a JSON object or list of objects, each with
+    "metrics" (a serviceMetrics response) and optional "details" (a list of
+    serviceDetails responses). The corridor comes from "from_loc"/"to_loc" or
+    the metrics header.
+    """
+    with open(path) as f:
+        dump = json.load(f)
+
+    ingested = 0
+    for entry in dump if isinstance(dump, list) else [dump]:
+        metrics_data = entry.get("metrics", {})
+        header = metrics_data.get("header", {})
+        from_loc = entry.get("from_loc") or header.get("from_location", "")
+        to_loc = entry.get("to_loc") or header.get("to_location", "")
+        if not from_loc or not to_loc:
+            log.warning(f"Skipping dump entry in {path} without a corridor")
+            continue
+
+        ingested += archive_metrics(metrics_data, from_loc, to_loc)
+
+        details_by_date = {}
+        for service_details in entry.get("details", []):
+            record = build_details_record(service_details, from_loc, to_loc)
+            if record["rid"]:
+                details_by_date.setdefault(get_rid_date(record["rid"]), []).append(
+                    record
+                )
+        for hsp_date, records in details_by_date.items():
+            merge_into_partition(get_partition_dir(hsp_date, from_loc, to_loc), records)
+
+    log.info(f"Ingested {ingested} service row(s) from {path}")
+    return ingested
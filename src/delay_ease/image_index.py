@@ -0,0 +1,585 @@
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import combinations
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from src.delay_ease.const import (
+    IMAGE_CONFIRM_MAX_CANDIDATES,
+    IMAGE_CONFIRM_MAX_DIFFERENCE,
+    IMAGE_CONFIRM_MIN_OVERLAP,
+    IMAGE_CONFIRM_STATUS_BAR_ROWS,
+    IMAGE_CONFIRM_WIDTH,
+    IMAGE_CONFIRM_WINDOW,
+    IMAGE_HASH_CHUNKS,
+    IMAGE_INDEX_COMPACT_ROWS,
+    IMAGE_NEAR_DUPLICATE_MAX_DISTANCE,
+)
+from src.delay_ease.ticket_data_extraction import get_extracted_tickets
+
+log = logging.getLogger(__name__)
+
+INDEX_DIR = Path("data/image_index")
+EXTRACTIONS_DIR = INDEX_DIR / "extractions"
+
+# one row per processed image, as parallel fixed-width column files
+HASHES_FILE = INDEX_DIR / "dhash.u64"
+USERS_FILE = INDEX_DIR / "users.u64"
+DIGESTS_FILE = INDEX_DIR / "sha256.bin"
+META_FILE = INDEX_DIR / "meta.json"
+
+CHUNK_BITS = 64 // IMAGE_HASH_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# share of the shorter side ignored at each corner when trimming margins
+TRIM_CORNER = 0.1
+
+# detail copies are first aligned at 1/8 scale from brightness profiles, then
+# refined on the images at 1/4 and full scale down to this fraction of a pixel
+ALIGN_COARSE = 8
+ALIGN_LEVELS = (4, 1)
+ALIGN_MIN_STEP = 0.125
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def get_user_key(user_id: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def get_border_value(image: Image.Image) -> int:
+    """the most common grayscale value along the edges"""
+    width, height = image.size
+    edges = [
+        image.crop(box).histogram()
+        for box in (
+            (0, 0, width, 1),
+            (0, height - 1, width, height),
+            (0, 0, 1, height),
+            (width - 1, 0, width, height),
+        )
+    ]
+    counts = [sum(edge_counts) for edge_counts in zip(*edges)]
+    return counts.index(max(counts))
+
+
+def trim_border(image: Image.Image) -> Image.Image:
+    """drop flat margins so re-cropped screenshots hash alike"""
+    background = Image.new(image.mode, image.size, get_border_value(image))
+    mask = ImageChops.difference(image, background).point(lambda p: p > 16 and 255)
+    # screenshots often have their corners rounded off to another colour
+    corner = round(min(image.size) * TRIM_CORNER)
+    width, height = image.size
+    for x in (0, width - corner):
+        for y in (0, height - corner):
+            mask.paste(0, (x, y, x + corner, y + corner))
+    bbox = mask.getbbox()
+    return image.crop(bbox) if bbox else image
+
+
+def compute_dhash(image_bytes: bytes) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (256, 256))
+        gray = trim_border(image.convert("L"))
+        pixels = gray.resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (left > right)
+    return dhash
+
+
+def compute_detail_image(image_bytes: bytes) -> Image.Image:
+    """trimmed grayscale copy at a fixed width, fine enough to read digits"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (IMAGE_CONFIRM_WIDTH * 2, IMAGE_CONFIRM_WIDTH * 2))
+        gray = trim_border(image.convert("L"))
+        height = max(1, round(gray.height * IMAGE_CONFIRM_WIDTH / gray.width))
+        return gray.resize((IMAGE_CONFIRM_WIDTH, height), Image.Resampling.LANCZOS)
+
+
+def get_profile(image: Image.Image, axis: int) -> list:
+    """mean brightness of each column (axis 0) or row (axis 1)"""
+    size = (image.width, 1) if axis == 0 else (1, image.height)
+    return list(image.resize(size, Image.Resampling.BOX).tobytes())
+
+
+def resample_profile(profile: list, length: int) -> list:
+    image = Image.frombytes("L", (len(profile), 1), bytes(profile))
+    return list(image.resize((length, 1), Image.Resampling.BILINEAR).tobytes())
+
+
+def get_correlation(a: list, b: list) -> float:
+    mean_a, mean_b = sum(a) / len(a), sum(b) / len(b)
+    ab = aa = bb = 0.0
+    for x, y in zip(a, b):
+        x -= mean_a
+        y -= mean_b
+        ab += x * y
+        aa += x * x
+        bb += y * y
+    return ab / math.sqrt(aa * bb) if aa and bb else 0.0
+
+
+def find_profile_offset(profile: list, other: list) -> tuple:
+    """(correlation, offset) of the best placement of other along profile"""
+    best = (-1.0, None)
+    for offset in range(-len(other), len(profile) + 1):
+        start, end = max(0, offset), min(len(profile), offset + len(other))
+        if end - start < IMAGE_CONFIRM_MIN_OVERLAP * max(len(profile), len(other)):
+            continue
+        correlation = get_correlation(
+            profile[start:end], other[start - offset : end - offset]
+        )
+        if correlation > best[0]:
+            best = (correlation, offset)
+    return best
+
+
+def estimate_alignment(detail: Image.Image, other: Image.Image) -> tuple:
+    """
+    rough (scale, dx, dy) putting other's pixel (x, y) at detail's
+    (dx + scale * x, dy + scale * y): the scale and dx from the column
+    profiles, then dy from the row profiles of the columns both show
+    """
+    columns = resample_profile(get_profile(detail, 0), detail.width // ALIGN_COARSE)
+    other_columns = get_profile(other, 0)
+    length = other.width // ALIGN_COARSE
+    best = (-1.0, None, None)
+    for width in range(
+        math.ceil(length * IMAGE_CONFIRM_MIN_OVERLAP),
+        int(length / IMAGE_CONFIRM_MIN_OVERLAP) + 1,
+    ):
+        correlation, dx = find_profile_offset(
+            columns, resample_profile(other_columns, width)
+        )
+        if correlation > best[0]:
+            best = (correlation, width / length, dx * ALIGN_COARSE)
+    _, scale, dx = best
+    if dx is None:
+        return None
+
+    scaled = other.resize(
+        (round(other.width * scale), round(other.height * scale)),
+        Image.Resampling.BOX,
+    )
+    x0, x1 = max(0, dx), min(detail.width, dx + scaled.width)
+    rows = get_profile(detail.crop((x0, 0, x1, detail.height)), 1)
+    other_rows = get_profile(scaled.crop((x0 - dx, 0, x1 - dx, scaled.height)), 1)
+    _, dy = find_profile_offset(
+        resample_profile(rows, len(rows) // ALIGN_COARSE),
+        resample_profile(other_rows, len(other_rows) // ALIGN_COARSE),
+    )
+    if dy is None:
+        return None
+    return scale, float(dx), float(dy * ALIGN_COARSE)
+
+
+def warp_detail(detail: Image.Image, other: Image.Image, alignment: tuple) -> tuple:
+    """
+    (detail, other) cut to where they overlap, other resampled onto detail's
+    pixels. None if the overlap leaves out too much of either
+    """
+    scale, dx, dy = alignment
+    box = (
+        max(0, math.ceil(dx)),
+        max(0, math.ceil(dy)),
+        min(detail.width, math.floor(dx + other.width * scale)),
+        min(detail.height, math.floor(dy + other.height * scale)),
+    )
+    size = (box[2] - box[0], box[3] - box[1])
+    if (
+        min(
+            size[0] / detail.width,
+            size[0] / (other.width * scale),
+            size[1] / detail.height,
+            size[1] / (other.height * scale),
+        )
+        < IMAGE_CONFIRM_MIN_OVERLAP
+    ):
+        return None
+    other_box = (
+        (box[0] - dx) / scale,
+        (box[1] - dy) / scale,
+        (box[2] - dx) / scale,
+        (box[3] - dy) / scale,
+    )
+    return (
+        detail.crop(box),
+        other.resize(size, Image.Resampling.BILINEAR, box=other_box),
+    )
+
+
+def get_alignment_cost(
+    detail: Image.Image, other: Image.Image, alignment: tuple
+) -> float:
+    pair = warp_detail(detail, other, alignment)
+    if pair is None:
+        return math.inf
+    return ImageStat.Stat(ImageChops.difference(*pair)).mean[0]
+
+
+def refine_alignment(
+    detail: Image.Image, other: Image.Image, alignment: tuple
+) -> tuple:
+    """
+    sub-pixel (scale, dx, dy): a pattern search nudging the width other
+    covers, dx and dy by a step that halves whenever no nudge helps
+    """
+    scale, dx, dy = alignment
+    for level in ALIGN_LEVELS:
+        level_detail, level_other = detail.reduce(level), other.reduce(level)
+        alignment = [scale, dx / level, dy / level]
+        cost = get_alignment_cost(level_detail, level_other, alignment)
+        step = 1.0
+        min_step = ALIGN_MIN_STEP if level == 1 else 0.5
+        while step >= min_step:
+            moved = False
+            for i in range(3):
+                for sign in (-1, 1):
+                    candidate = list(alignment)
+                    candidate[i] += sign * step / (level_other.width if i == 0 else 1)
+                    candidate_cost = get_alignment_cost(
+                        level_detail, level_other, candidate
+                    )
+                    if candidate_cost < cost:
+                        alignment, cost, moved = candidate, candidate_cost, True
+            if not moved:
+                step /= 2
+        scale, dx, dy = alignment[0], alignment[1] * level, alignment[2] * level
+    return scale, dx, dy
+
+
+def is_same_detail(detail: Image.Image, other: Image.Image) -> bool:
+    """
+    True if two detail copies show the same thing wherever they overlap. A
+    re-crop shifts and rescales the copy, so other is registered onto detail
+    first; the status bar is left out, its clock changes between screenshots.
+    A changed date, time or station is a handful of glyphs, so the difference
+    is judged over small windows rather than the whole overlap
+    """
+    band = IMAGE_CONFIRM_STATUS_BAR_ROWS
+    if min(detail.height, other.height) < 2 * band:
+        return False
+    detail = detail.crop((0, band, detail.width, detail.height))
+    other = other.crop((0, band, other.width, other.height))
+
+    alignment = estimate_alignment(detail, other)
+    if alignment is None:
+        return False
+    scale, dx, dy = alignment
+    if scale > 1:
+        # always shrink the one resampled - enlarging it blurs its glyphs
+        detail, other = other, detail
+        alignment = (1 / scale, -dx / scale, -dy / scale)
+    pair = warp_detail(detail, other, refine_alignment(detail, other, alignment))
+    if pair is None:
+        return False
+
+    blurred = [image.filter(ImageFilter.GaussianBlur(1)) for image in pair]
+    window_means = ImageChops.difference(*blurred).filter(
+        ImageFilter.BoxBlur(IMAGE_CONFIRM_WINDOW // 2)
+    )
+    # the blur reads past the overlap's edges, which differ between the two
+    margin = 2
+    window_means = window_means.crop(
+        (margin, margin, window_means.width - margin, window_means.height - margin)
+    )
+    return window_means.getextrema()[1] <= IMAGE_CONFIRM_MAX_DIFFERENCE
+
+
+def get_chunks(dhash: int) -> list:
+    return [(dhash >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(IMAGE_HASH_CHUNKS)]
+
+
+def get_chunk_neighbours(chunk: int, max_flips: int):
+    """every chunk value within max_flips bits of chunk"""
+    yield chunk
+    for flips in range(1, max_flips + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            value = chunk
+            for bit in bits:
+                value ^= 1 << bit
+            yield value
+
+
+def read_column(path: Path, typecode: str) -> array:
+    column = array(typecode)
+    if path.exists():
+        with open(path, "rb") as f:
+            column.frombytes(f.read())
+    return column
+
+
+def get_table_path(i: int) -> Path:
+    return INDEX_DIR / f"chunk{i}.u64"
+
+
+def load_image_index() -> dict:
+    """
+    Columns plus one sorted table per hash chunk of (chunk value << 32 | row)
+    keys. Any two hashes within d bits agree to within d // chunks bits on at
+    least one chunk, so a query only probes those few chunk neighbours.
+    Rows added since the tables were last compacted sit in small dict tails.
+    """
+    hashes = read_column(HASHES_FILE, "Q")
+    users = read_column(USERS_FILE, "Q")
+    digests = DIGESTS_FILE.read_bytes() if DIGESTS_FILE.exists() else b""
+    # a crash mid-append can leave the columns uneven - keep complete rows only
+    rows = min(len(hashes), len(users), len(digests) // 32)
+
+    meta = {"sorted_rows": 0}
+    if META_FILE.exists():
+        with open(META_FILE) as f:
+            meta = json.load(f)
+    sorted_rows = min(meta["sorted_rows"], rows)
+
+    index = {
+        "hashes": hashes[:rows],
+        "users": users[:rows],
+        "digests": bytearray(digests[: rows * 32]),
+        "sorted_rows": sorted_rows,
+        "tables": [
+            read_column(get_table_path(i), "Q") if sorted_rows else array("Q")
+            for i in range(IMAGE_HASH_CHUNKS)
+        ],
+        "tails": [{} for _ in range(IMAGE_HASH_CHUNKS)],
+    }
+    if any(len(table) != sorted_rows for table in index["tables"]):
+        # tables from a different run of the columns - rebuild them from scratch
+        index["tables"] = [array("Q") for _ in range(IMAGE_HASH_CHUNKS)]
+        index["sorted_rows"] = 0
+
+    for row in range(index["sorted_rows"], rows):
+        add_to_tails(index, row)
+    return index
+
+
+def add_to_tails(index: dict, row: int) -> None:
+    for tail, chunk in zip(index["tails"], get_chunks(index["hashes"][row])):
+        tail.setdefault(chunk, []).append(row)
+
+
+def compact_image_index(index: dict) -> None:
+    """merge the tails into the sorted chunk tables and persist them"""
+    rows = len(index["hashes"])
+    for i in range(IMAGE_HASH_CHUNKS):
+        new_keys = sorted(
+            (chunk << 32) | row
+            for chunk, chunk_rows in index["tails"][i].items()
+            for row in chunk_rows
+        )
+        # both runs are already sorted, which timsort merges in linear time
+        table = array("Q", sorted(index["tables"][i] + array("Q", new_keys)))
+        tmp_path = get_table_path(i).with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(table.tobytes())
+        os.replace(tmp_path, get_table_path(i))
+        index["tables"][i] = table
+        index["tails"][i] = {}
+
+    index["sorted_rows"] = rows
+    with open(META_FILE, "w") as f:
+        json.dump({"sorted_rows": rows}, f)
+    log.info(f"Compacted image index tables at {rows} image(s)")
+
+
+def get_image_index() -> dict:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = load_image_index()
+            log.info(f"Loaded image index with {len(_index['hashes'])} image(s)")
+        return _index
+
+
+def add_to_index(index: dict, dhash: int, user_key: int, digest: str) -> None:
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    with _index_lock:
+        row = len(index["hashes"])
+        index["hashes"].append(dhash)
+        index["users"].append(user_key)
+        index["digests"] += bytes.fromhex(digest)
+        add_to_tails(index, row)
+
+        with open(HASHES_FILE, "ab") as f:
+            f.write(array("Q", [dhash]).tobytes())
+        with open(USERS_FILE, "ab") as f:
+            f.write(array("Q", [user_key]).tobytes())
+        with open(DIGESTS_FILE, "ab") as f:
+            f.write(bytes.fromhex(digest))
+
+        if row + 1 - index["sorted_rows"] >= IMAGE_INDEX_COMPACT_ROWS:
+            compact_image_index(index)
+
+
+def get_chunk_rows(index: dict, i: int, value: int):
+    table = index["tables"][i]
+    position = bisect_left(table, value << 32)
+    while position < len(table) and table[position] >> 32 == value:
+        yield table[position] & 0xFFFFFFFF
+        position += 1
+    yield from index["tails"][i].get(value, ())
+
+
+def find_near_duplicates(
+    index: dict,
+    dhash: int,
+    user_key: int,
+    max_distance: int = IMAGE_NEAR_DUPLICATE_MAX_DISTANCE,
+) -> list:
+    """(sha256 digest, distance) of this user's images within reach, closest first"""
+    max_flips = max_distance // IMAGE_HASH_CHUNKS
+    hashes, users = index["hashes"], index["users"]
+    matches = []
+    seen = set()
+
+    for i, chunk in enumerate(get_chunks(dhash)):
+        for value in get_chunk_neighbours(chunk, max_flips):
+            for row in get_chunk_rows(index, i, value):
+                if row in seen:
+                    continue
+                seen.add(row)
+                # only a user's own uploads: one app's tickets for different
+                # journeys can sit within a few bits of each other
+                if users[row] != user_key:
+                    continue
+                distance = (hashes[row] ^ dhash).bit_count()
+                if distance <= max_distance:
+                    matches.append((distance, row))
+
+    return [
+        (index["digests"][row * 32 : row * 32 + 32].hex(), distance)
+        for distance, row in sorted(matches)
+    ]
+
+
+def get_extraction_path(digest: str) -> Path:
+    return EXTRACTIONS_DIR / digest[:2] / f"{digest}.json"
+
+
+def load_extraction(digest: str) -> dict:
+    path = get_extraction_path(digest)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_detail_path(digest: str) -> Path:
+    return EXTRACTIONS_DIR / digest[:2] / f"{digest}.png"
+
+
+def load_detail(digest: str) -> Image.Image:
+    path = get_detail_path(digest)
+    if not path.exists():
+        return None
+    with Image.open(path) as detail:
+        return detail.copy()
+
+
+def save_detail(digest: str, detail: Image.Image) -> None:
+    path = get_detail_path(digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    detail.save(tmp_path, "PNG")
+    os.replace(tmp_path, path)
+
+
+def save_extraction(digest: str, extracted_data: dict) -> None:
+    path = get_extraction_path(digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(extracted_data, f)
+    os.replace(tmp_path, path)
+
+
+def find_cached_extraction(image_path: str, user_id: str) -> dict:
+    """
+    stored extraction for this image, or for a near-duplicate the user uploaded
+    before whose detail copy confirms it shows the same journey
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    digest = get_image_digest(image_bytes)
+    extracted_data = load_extraction(digest)
+    if extracted_data is not None:
+        log.info("Identical ticket image seen before, reusing its extraction")
+        return extracted_data
+
+    try:
+        dhash = compute_dhash(image_bytes)
+    except Exception as e:
+        log.warning(f"Could not hash ticket image: {e}")
+        return None
+
+    matches = find_near_duplicates(get_image_index(), dhash, get_user_key(user_id))
+    if not matches:
+        return None
+    try:
+        detail = compute_detail_image(image_bytes)
+    except Exception as e:
+        log.warning(f"Could not hash ticket image: {e}")
+        return None
+
+    # the dhash only makes an image a candidate - the same ticket for another
+    # date or train can hash within a bit of it
+    for digest, distance in matches[:IMAGE_CONFIRM_MAX_CANDIDATES]:
+        candidate_detail = load_detail(digest)
+        if candidate_detail is None or not is_same_detail(candidate_detail, detail):
+            continue
+        extracted_data = load_extraction(digest)
+        if extracted_data is not None:
+            log.info(
+                f"Near-duplicate ticket image ({distance} bits apart), reusing its extraction"
+            )
+            return extracted_data
+    log.info(
+        f"Ticket image is near {len(matches)} earlier one(s) but differs in detail, extracting it again"
+    )
+    return None
+
+
+def remember_extraction(image_path: str, user_id: str, extracted_data: dict) -> None:
+    """
+    index a freshly extracted image so later re-uploads skip extraction. an
+    image whose extraction is already stored is left as it is
+    """
+    # a clearer re-take of an unclear photo must be read again
+    if any("error" in ticket for ticket in get_extracted_tickets(extracted_data)):
+        return
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    digest = get_image_digest(image_bytes)
+    if get_extraction_path(digest).exists():
+        return
+    save_extraction(digest, extracted_data)
+    try:
+        dhash = compute_dhash(image_bytes)
+        save_detail(digest, compute_detail_image(image_bytes))
+    except Exception as e:
+        log.warning(f"Could not hash ticket image: {e}")
+        return
+    add_to_index(get_image_index(), dhash, get_user_key(user_id), digest)
@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from src.delay_ease.const import (
+    IMAGE_GC_GRACE_HOURS,
+    IMAGE_KEEP_CLAIM_REFERENCES,
+    UPLOAD_IMAGE_JPEG_QUALITY,
+    UPLOAD_IMAGE_MAX_SIDE,
+)
+
+log = logging.getLogger(__name__)
+
+# content-addressed ticket images: data/images/ab/cd/<sha256>/ holds the
+# original upload and upload.jpg, the normalised copy sent to portals
+IMAGE_STORE_DIR = Path("data/images")
+UPLOAD_FILE = "upload.jpg"
+
+
+def get_image_dir(image_sha256: str) -> Path:
+    return IMAGE_STORE_DIR / image_sha256[:2] / image_sha256[2:4] / image_sha256
+
+
+def write_file_atomic(path: Path, data: bytes) -> None:
+    # a tmp file of its own: one batch can ingest the same image twice at once
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def build_upload_image(image_bytes: bytes) -> bytes:
+    """upright rgb jpeg, longest side capped, metadata stripped"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # flatten transparency onto white, as the portals render it
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        image.thumbnail((UPLOAD_IMAGE_MAX_SIDE, UPLOAD_IMAGE_MAX_SIDE))
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=UPLOAD_IMAGE_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def get_original_path(image_sha256: str) -> Path:
+    """the stored original for a hash, or None if it isn't in the store"""
+    image_dir = get_image_dir(image_sha256)
+    if not image_dir.exists():
+        return None
+    return next(image_dir.glob("original.*"), None)
+
+
+def ingest_image(image_path: str) -> str:
+    """
+    copy an uploaded ticket into the store and return its sha256. identical
+    images are stored once; a repeat upload only refreshes the gc grace period
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    image_sha256 = hashlib.sha256(image_bytes).hexdigest()
+
+    image_dir = get_image_dir(image_sha256)
+    original_path = get_original_path(image_sha256)
+    if original_path is None:
+        image_dir.mkdir(parents=True, exist_ok=True)
+        suffix = Path(image_path).suffix.lower() or ".img"
+        original_path = image_dir / f"original{suffix}"
+        write_file_atomic(original_path, image_bytes)
+        log.info(f"Stored ticket image {image_sha256[:12]}")
+    else:
+        os.utime(original_path)
+
+    upload_path = image_dir / UPLOAD_FILE
+    if not upload_path.exists():
+        try:
+            write_file_atomic(upload_path, build_upload_image(image_bytes))
+        except Exception as e:
+            # the portal gets the original instead
+            log.warning(f"Could not build upload image for {image_sha256[:12]}: {e}")
+    return image_sha256
+
+
+def get_upload_path(image_sha256: str) -> str:
+    """absolute path of the file to upload to a portal for this image"""
+    upload_path = get_image_dir(image_sha256) / UPLOAD_FILE
+    if upload_path.exists():
+        return str(upload_path.resolve())
+    original_path = get_original_path(image_sha256)
+    if original_path is None:
+        raise FileNotFoundError(f"Ticket image {image_sha256} is not in the store")
+    return str(original_path.resolve())
+
+
+def get_record_image_path(record: dict) -> str:
+    """upload path for a claim record - older records hold a file path instead"""
+    if record.get("ticket_image_sha256"):
+        return get_upload_path(record["ticket_image_sha256"])
+    return record.get("ticket_image_path", "")
+
+
+def is_image_needed(record: dict) -> bool:
+    """claims still to be submitted or handled manually keep their image"""
+    return (
+        record.get("toc_claim_reference") in IMAGE_KEEP_CLAIM_REFERENCES
+        or record.get("automation_status") == "failed"
+    )
+
+
+def list_stored_images() -> list:
+    if not IMAGE_STORE_DIR.exists():
+        return []
+    return sorted(path.name for path in IMAGE_STORE_DIR.glob("*/*/*") if path.is_dir())
+
+
+def collect_image_garbage(
+    claim_records: list, rechecks: list, now=None, dry_run: bool = False
+) -> dict:
+    """
+    Delete stored images no open claim or pending re-check refers to. Images
+    stored within the grace period are kept - their ticket may still be in
+    flight and not yet recorded anywhere.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    keep = {
+        record["ticket_image_sha256"]
+        for record in claim_records
+        if record.get("ticket_image_sha256") and is_image_needed(record)
+    }
+    keep.update(entry["image_sha256"] for entry in rechecks)
+    grace_start = (now - datetime.timedelta(hours=IMAGE_GC_GRACE_HOURS)).timestamp()
+
+    stats = {"kept": 0, "deleted": 0, "freed_bytes": 0}
+    for image_sha256 in list_stored_images():
+        image_dir = get_image_dir(image_sha256)
+        files = [path for path in image_dir.iterdir() if path.is_file()]
+        if image_sha256 in keep or any(
+            path.stat().st_mtime >= grace_start for path in files
+        ):
+            stats["kept"] += 1
+            continue
+        stats["deleted"] += 1
+        stats["freed_bytes"] += sum(path.stat().st_size for path in files)
+        if not dry_run:
+            shutil.rmtree(image_dir)
+    return stats
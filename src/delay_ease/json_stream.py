@@ -0,0 +1,106 @@
+import codecs
+import json
+import re
+
+WHITESPACE = " \t\n\r"
+SCALAR_END = re.compile(r"[,\]}\s]")
+
+_decoder = json.JSONDecoder()
+
+
+class JsonStream:
+    """
+    Incremental reader over a json document arriving as byte chunks. Only the
+    unparsed tail is buffered, so memory stays around one chunk plus the value
+    being decoded, however large the document.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._pos = 0
+        self._eof = False
+
+    def fill(self) -> bool:
+        """append the next chunk to the buffer, dropping what's been parsed"""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            new_text = self._utf8.decode(b"", final=True)
+        else:
+            new_text = self._utf8.decode(chunk)
+        self._text = self._text[self._pos :] + new_text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while self._pos >= len(self._text):
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON stream")
+        return self._text[self._pos]
+
+    def skip_whitespace(self) -> None:
+        while self.peek() in WHITESPACE:
+            self._pos += 1
+
+    def expect(self, char: str) -> None:
+        self.skip_whitespace()
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at {self.peek()!r} in JSON stream")
+        self._pos += 1
+
+    def consume_if(self, char: str) -> bool:
+        self.skip_whitespace()
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def decode_value(self):
+        self.skip_whitespace()
+        if self.peek() not in '{["':
+            # a number or literal can decode from a cut-off prefix ("3" of
+            # "3.14"), so read on until the delimiter after it has arrived
+            while not SCALAR_END.search(self._text, self._pos):
+                if not self.fill():
+                    break
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._text, self._pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self._pos = end
+            return value
+
+
+def iter_array_items(chunks, key: str):
+    """
+    Yield the items of the array under top-level `key` of a json object as
+    its bytes arrive. Other top-level values are decoded and dropped. Stop
+    iterating to stop reading.
+    """
+    stream = JsonStream(chunks)
+    stream.expect("{")
+    if stream.consume_if("}"):
+        return
+    while True:
+        name = stream.decode_value()
+        stream.expect(":")
+        if name == key:
+            stream.expect("[")
+            if not stream.consume_if("]"):
+                while True:
+                    yield stream.decode_value()
+                    if not stream.consume_if(","):
+                        stream.expect("]")
+                        break
+        else:
+            stream.decode_value()
+        if not stream.consume_if(","):
+            stream.expect("}")
+            return
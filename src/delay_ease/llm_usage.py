@@ -0,0 +1,170 @@
+import contextlib
+import contextvars
+import logging
+import threading
+
+from src.delay_ease.const import LLM_PRICES_USD_PER_MTOK
+
+log = logging.getLogger(__name__)
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "steps", "seconds")
+
+# usage collector for the ticket being processed - set per task/thread context
+current_usage = contextvars.ContextVar("llm_usage", default=None)
+
+# cumulative counters for this process, per stage
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def new_usage_entry() -> dict:
+    return {**{field: 0 for field in USAGE_FIELDS}, "cost_usd": 0.0}
+
+
+def new_llm_usage() -> dict:
+    return {"stages": {}, "total": new_usage_entry()}
+
+
+def get_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prices = LLM_PRICES_USD_PER_MTOK.get(model)
+    if not prices:
+        return 0.0
+    return (
+        prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]
+    ) / 1_000_000
+
+
+def add_usage(entry: dict, usage: dict) -> None:
+    for field in USAGE_FIELDS:
+        entry[field] += usage.get(field, 0)
+    entry["seconds"] = round(entry["seconds"], 3)
+    entry["cost_usd"] = round(entry["cost_usd"] + usage.get("cost_usd", 0.0), 6)
+
+
+def record_llm_usage(
+    stage: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    seconds: float,
+    steps: int = 1,
+    calls: int = 1,
+) -> dict:
+    """add one llm call or agent run to the current ticket and process totals"""
+    usage = {
+        "calls": calls,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "steps": steps,
+        "seconds": seconds,
+        "cost_usd": get_cost(model, prompt_tokens or 0, completion_tokens or 0),
+    }
+    log.debug(
+        f"{stage} used {usage['prompt_tokens']}+{usage['completion_tokens']} tokens "
+        f"in {seconds:.1f}s"
+    )
+
+    collector = current_usage.get()
+    if collector is not None:
+        add_usage(collector["stages"].setdefault(stage, new_usage_entry()), usage)
+        add_usage(collector["total"], usage)
+
+    with _totals_lock:
+        add_usage(_totals.setdefault(stage, new_usage_entry()), usage)
+    return usage
+
+
+def record_agent_usage(stage: str, model: str, history, seconds: float) -> dict:
+    """usage of one Agent.run() from its history"""
+    summary = history.usage
+    return record_llm_usage(
+        stage,
+        model,
+        summary.total_prompt_tokens if summary else 0,
+        summary.total_completion_tokens if summary else 0,
+        seconds,
+        steps=history.number_of_steps(),
+        calls=summary.entry_count if summary else 0,
+    )
+
+
+@contextlib.contextmanager
+def track_llm_usage(usage: dict = None):
+    """collect usage of every llm call made in this context into one dict"""
+    usage = usage if usage is not None else new_llm_usage()
+    token = current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        current_usage.reset(token)
+
+
+def merge_llm_usage(*usages) -> dict:
+    merged = new_llm_usage()
+    for usage in usages:
+        if not usage:
+            continue
+        for stage, entry in usage["stages"].items():
+            add_usage(merged["stages"].setdefault(stage, new_usage_entry()), entry)
+        add_usage(merged["total"], usage["total"])
+    return merged
+
+
+def split_llm_usage(usage: dict, parts: int) -> list:
+    """
+    equal shares of one ticket's usage, for an image holding several tickets -
+    each claim carries its share of the vision call instead of all of it
+    """
+    shares = []
+    for _ in range(parts):
+        share = new_llm_usage()
+        for stage, entry in usage["stages"].items():
+            share["stages"][stage] = {
+                field: round(value / parts, 6) for field, value in entry.items()
+            }
+        share["total"] = {
+            field: round(value / parts, 6) for field, value in usage["total"].items()
+        }
+        shares.append(share)
+    return shares
+
+
+def get_llm_usage_totals() -> dict:
+    """cumulative per-stage usage since the process started"""
+    with _totals_lock:
+        stages = {stage: dict(entry) for stage, entry in _totals.items()}
+    total = new_usage_entry()
+    for entry in stages.values():
+        add_usage(total, entry)
+    return {"stages": stages, "total": total}
+
+
+def reset_llm_usage_totals() -> None:
+    with _totals_lock:
+        _totals.clear()
+
+
+def add_llm_usage_totals(totals: dict) -> None:
+    """fold another process's get_llm_usage_totals() into this process's totals"""
+    with _totals_lock:
+        for stage, entry in totals["stages"].items():
+            add_usage(_totals.setdefault(stage, new_usage_entry()), entry)
+
+
+def summarise_usage_by_toc(records: list) -> dict:
+    """per-toc llm cost and latency from claim records or results"""
+    by_toc = {}
+    for record in records:
+        usage = record.get("llm_usage")
+        if not usage:
+            continue
+        toc = record.get("toc") or record.get("train_operator") or "Unknown"
+        row = by_toc.setdefault(toc, {"claims": 0, "usage": new_llm_usage()})
+        row["claims"] += 1
+        row["usage"] = merge_llm_usage(row["usage"], usage)
+
+    for row in by_toc.values():
+        total = row["usage"]["total"]
+        row["cost_per_claim_usd"] = round(total["cost_usd"] / row["claims"], 4)
+        row["seconds_per_claim"] = round(total["seconds"] / row["claims"], 1)
+    return dict(sorted(by_toc.items()))
@@ -0,0 +1,279 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from src.delay_ease.const import MONITOR_RUN_TIME
+from src.delay_ease.delay_calculation import (
+    extract_delay_info,
+    find_service_by_dep_time,
+    get_cached_service_details,
+    get_cached_service_metrics,
+    get_delay_repay_percentage,
+    get_detailed_status_message,
+    get_hsp_days,
+    get_operator_name,
+    load_tok_codes,
+    new_hsp_cache,
+)
+from src.delay_ease.ticket_data_extraction import (
+    build_crs_to_station,
+    load_stations,
+    validate_segment,
+)
+
+log = logging.getLogger(__name__)
+
+MONITORING_DIR = Path("data/monitoring")
+REGISTRY_FILE = MONITORING_DIR / "journeys.json"
+ALERTS_DIR = MONITORING_DIR / "alerts"
+
+DAY_NAMES = ("MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN")
+FULL_DAY_NAMES = {
+    "MONDAY": "MON",
+    "TUESDAY": "TUE",
+    "WEDNESDAY": "WED",
+    "THURSDAY": "THU",
+    "FRIDAY": "FRI",
+    "SATURDAY": "SAT",
+    "SUNDAY": "SUN",
+}
+DAY_GROUPS = {
+    "DAILY": DAY_NAMES,
+    "WEEKDAY": DAY_NAMES[:5],
+    "WEEKEND": DAY_NAMES[5:],
+}
+
+
+def parse_days(days: str) -> list:
+    """'WEEKDAY', 'WEEKEND', 'DAILY' or a comma list such as 'MON,WED,FRI'"""
+    parsed = []
+    for part in days.upper().split(","):
+        part = part.strip()
+        if part in DAY_GROUPS:
+            parsed.extend(DAY_GROUPS[part])
+        elif part in DAY_NAMES:
+            parsed.append(part)
+        elif part in FULL_DAY_NAMES:
+            parsed.append(FULL_DAY_NAMES[part])
+        else:
+            raise ValueError(f"Unknown day '{part}'")
+    return [day for day in DAY_NAMES if day in parsed]
+
+
+def load_registry() -> list:
+    if not REGISTRY_FILE.exists():
+        return []
+    with open(REGISTRY_FILE) as f:
+        return json.load(f)
+
+
+def save_registry(registrations: list) -> None:
+    MONITORING_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = REGISTRY_FILE.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(registrations, f, indent=2)
+    os.replace(tmp_path, REGISTRY_FILE)
+
+
+def register_journey(
+    user_id: str,
+    departure: str,
+    arrival: str,
+    departure_time: str,
+    days: str = "WEEKDAY",
+    toc: str = None,
+) -> dict:
+    """register a recurring journey - stations may be names or crs codes"""
+    stations = load_stations()
+    crs_to_station = build_crs_to_station(stations)
+
+    journey = {}
+    for prefix, value in (("departure", departure), ("arrival", arrival)):
+        if value.strip().upper() in crs_to_station:
+            journey[f"{prefix}_crs"] = value.strip().upper()
+        else:
+            journey[f"{prefix}_station"] = value
+    journey = validate_segment(journey, stations, crs_to_station)
+    if "error" in journey:
+        raise ValueError(journey["error"])
+
+    departure_time = datetime.datetime.strptime(departure_time, "%H:%M").strftime(
+        "%H:%M"
+    )
+    key = f"{user_id}|{journey['departure_crs']}|{journey['arrival_crs']}|{departure_time}"
+    registration = {
+        "registration_id": f"RJ_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}",
+        "user_id": user_id,
+        "departure_station": journey["departure_station"],
+        "departure_crs": journey["departure_crs"],
+        "arrival_station": journey["arrival_station"],
+        "arrival_crs": journey["arrival_crs"],
+        "departure_time": departure_time,
+        "days": parse_days(days),
+        "toc": toc,
+        "created_at": datetime.datetime.now().isoformat(),
+    }
+
+    registrations = [
+        r
+        for r in load_registry()
+        if r["registration_id"] != registration["registration_id"]
+    ]
+    registrations.append(registration)
+    save_registry(registrations)
+    return registration
+
+
+def unregister_journey(registration_id: str) -> bool:
+    registrations = load_registry()
+    remaining = [r for r in registrations if r["registration_id"] != registration_id]
+    save_registry(remaining)
+    return len(remaining) < len(registrations)
+
+
+def save_alert(alert: dict) -> bool:
+    """write an alert once - returns False if it was already raised"""
+    ALERTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = ALERTS_DIR / f"{alert['alert_id']}.json"
+    if path.exists():
+        return False
+    with open(path, "w") as f:
+        json.dump(alert, f, indent=2)
+    return True
+
+
+def check_registration(
+    registration: dict, services: list, journey_date, hsp_cache, tok_codes
+) -> dict:
+    """delay outcome for one registered journey from the corridor's metrics"""
+    matching_service = find_service_by_dep_time(
+        services, registration["departure_time"].replace(":", "")
+    )
+    if matching_service is None:
+        return {"status": "error_no_match"}
+
+    metrics = matching_service["serviceAttributesMetrics"]
+    operator = get_operator_name(metrics.get("toc_code", ""), tok_codes)
+    if registration.get("toc") and registration["toc"] != operator:
+        return {"status": "error_no_match", "train_operator": operator}
+
+    # registrations on the same train share a single details lookup
+    service_details = get_cached_service_details(metrics["rids"][0], hsp_cache)
+    delay_info = extract_delay_info(
+        service_details, registration["departure_crs"], registration["arrival_crs"]
+    )
+    delay = delay_info.get("arrival_delay_minutes")
+    if delay is None:
+        return {"status": "error_no_delay_data", "train_operator": operator}
+
+    days_old = (datetime.datetime.now() - journey_date).days
+    comp_pct = get_delay_repay_percentage(delay, operator)
+    outcome = get_detailed_status_message(delay, operator, days_old, comp_pct)
+    outcome.update(
+        {
+            "train_operator": operator,
+            "delay_minutes": delay,
+            "compensation_percentage": comp_pct,
+        }
+    )
+    return outcome
+
+
+def run_daily_monitor(journey_date: datetime.date = None) -> dict:
+    """
+    Check every journey registered for the given day (default yesterday) with one
+    day-wide serviceMetrics query per corridor, fanning results out to each
+    registered user. Qualifying delays raise a ticket_requested alert.
+    """
+    if journey_date is None:
+        journey_date = datetime.date.today() - datetime.timedelta(days=1)
+    journey_datetime = datetime.datetime.combine(journey_date, datetime.time())
+    day_name = DAY_NAMES[journey_date.weekday()]
+
+    corridors = {}
+    for registration in load_registry():
+        if day_name in registration["days"]:
+            key = (registration["departure_crs"], registration["arrival_crs"])
+            corridors.setdefault(key, []).append(registration)
+
+    hsp_cache = new_hsp_cache()
+    tok_codes = load_tok_codes()
+    hsp_date = journey_date.strftime("%Y-%m-%d")
+    summary = {
+        "date": hsp_date,
+        "corridors": len(corridors),
+        "checked": 0,
+        "alerts": [],
+    }
+
+    for (departure_crs, arrival_crs), registrations in corridors.items():
+        try:
+            metrics_data = get_cached_service_metrics(
+                {
+                    "from_loc": departure_crs,
+                    "to_loc": arrival_crs,
+                    "from_time": "0000",
+                    "to_time": "2359",
+                    "from_date": hsp_date,
+                    "to_date": hsp_date,
+                    "days": get_hsp_days(journey_datetime),
+                },
+                hsp_cache,
+            )
+        except Exception as e:
+            log.error(f"Metrics lookup failed for {departure_crs}-{arrival_crs}: {e}")
+            continue
+
+        services = metrics_data.get("Services", [])
+        for registration in registrations:
+            summary["checked"] += 1
+            try:
+                outcome = check_registration(
+                    registration, services, journey_datetime, hsp_cache, tok_codes
+                )
+            except Exception as e:
+                log.error(f"Check failed for {registration['registration_id']}: {e}")
+                continue
+
+            if outcome.get("status") != "eligible":
+                continue
+
+            alert = {
+                "alert_id": f"{registration['registration_id']}_{journey_date.strftime('%Y%m%d')}",
+                "registration_id": registration["registration_id"],
+                "user_id": registration["user_id"],
+                "ticket_date": journey_date.strftime("%d %b %Y"),
+                "departure_time": registration["departure_time"],
+                "departure_station": registration["departure_station"],
+                "arrival_station": registration["arrival_station"],
+                "train_operator": outcome["train_operator"],
+                "delay_minutes": outcome["delay_minutes"],
+                "compensation_percentage": outcome["compensation_percentage"],
+                "status": "ticket_requested",
+                "message": f"Your {registration['departure_time']} {registration['departure_station']} to {registration['arrival_station']} train was {outcome['delay_minutes']} minutes late and qualifies for {outcome['compensation_percentage']} compensation. Upload your ticket to claim.",
+                "created_at": datetime.datetime.now().isoformat(),
+            }
+            if save_alert(alert):
+                summary["alerts"].append(alert)
+
+    summary["metrics_queries"] = len(hsp_cache["metrics"])
+    summary["details_queries"] = len(hsp_cache["details"])
+    log.info(
+        f"Monitored {summary['checked']} journey(s) on {summary['corridors']} corridor(s): "
+        f"{summary['metrics_queries']} metrics and {summary['details_queries']} details "
+        f"queries, {len(summary['alerts'])} alert(s)"
+    )
+    return summary
+
+
+def get_next_monitor_run(now: datetime.datetime = None) -> datetime.datetime:
+    if now is None:
+        now = datetime.datetime.now()
+    run_time = datetime.datetime.strptime(MONITOR_RUN_TIME, "%H:%M").time()
+    next_run = datetime.datetime.combine(now.date(), run_time)
+    if next_run <= now:
+        next_run += datetime.timedelta(days=1)
+    return next_run
@@ -0,0 +1,462 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from src.delay_ease.const import (
+    PROFILE_SAMPLE_INTERVAL_SECONDS,
+    PROFILE_SNAPSHOTS_PER_STAGE,
+    PROFILE_STAGES,
+    PROFILE_TOP_ALLOCATIONS,
+    PROFILE_TRACEMALLOC_FRAMES,
+)
+
+log = logging.getLogger(__name__)
+
+PROFILING_DIR = Path("data/profiling")
+
+# allocations made by the profiler itself stay out of the snapshot diffs
+PROFILER_FILES = frozenset((tracemalloc.__file__, contextlib.__file__, __file__))
+
+_profiler = None
+
+
+def new_stage_profile() -> dict:
+    return {
+        "calls": 0,
+        "timed_calls": 0,
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "wait_seconds": 0.0,
+        "allocated_bytes": 0,
+        "samples": 0,
+        "stacks": {},
+        "allocations": {},
+        "snapshots": 0,
+    }
+
+
+def new_profile_data() -> dict:
+    return {"stages": {}, "external": {}, "worker_cpu_seconds": 0.0}
+
+
+def get_stage_caller(frame) -> tuple:
+    """(file, line) the stage was entered from, past the context manager frames"""
+    while frame.f_code.co_filename in (contextlib.__file__, __file__):
+        frame = frame.f_back
+    return frame.f_code.co_filename, frame.f_lineno
+
+
+def get_frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def fold_stack(frame) -> str:
+    """root;...;leaf, as flamegraph.pl and speedscope read it"""
+    labels = []
+    while frame is not None:
+        labels.append(get_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profiler:
+    """
+    Per-stage wall time, cpu time, external waits and allocations, plus a
+    sampler thread that reads every thread's stack at a fixed interval and
+    files it under the innermost stage that thread is running.
+
+    tracemalloc slows every allocation down, so it only runs while one of the
+    first PROFILE_SNAPSHOTS_PER_STAGE calls of a stage is in progress, and
+    stage calls that overlap a traced call are left out of the timings.
+    """
+
+    def __init__(self, stages: tuple, interval: float):
+        self.stages = frozenset(stages)
+        self.interval = interval
+        self.data = new_profile_data()
+        self.lock = threading.Lock()
+        # thread id -> stack of open stage entries
+        self.active = {}
+        self.local = threading.local()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.cpu_started = time.process_time()
+        # stage calls currently being traced
+        self.tracing = 0
+        self.owns_tracing = False
+
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self.sample_loop, name="delay-ease-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def sample_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, entries in list(self.active.items()):
+                frame = frames.get(thread_id)
+                try:
+                    name = entries[-1]["stage"]
+                except IndexError:
+                    # not in a stage (or it just left its last one)
+                    continue
+                if frame is None:
+                    continue
+                folded = fold_stack(frame)
+                with self.lock:
+                    stage = self.get_stage(name)
+                    stage["samples"] += 1
+                    stage["stacks"][folded] = stage["stacks"].get(folded, 0) + 1
+
+    def get_stage(self, name: str) -> dict:
+        return self.data["stages"].setdefault(name, new_stage_profile())
+
+    def get_entries(self) -> list:
+        entries = getattr(self.local, "entries", None)
+        if entries is None:
+            entries = self.local.entries = []
+            self.active[threading.get_ident()] = entries
+        return entries
+
+    def start_tracing(self) -> None:
+        with self.lock:
+            self.tracing += 1
+            # every thread's allocations are slowed down from here on
+            for entries in self.active.values():
+                for entry in list(entries):
+                    entry["traced"] = True
+            if self.tracing == 1 and not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self.owns_tracing = True
+
+    def stop_tracing(self) -> None:
+        with self.lock:
+            self.tracing -= 1
+            # tracing switched on with PYTHONTRACEMALLOC is left running
+            if self.tracing == 0 and self.owns_tracing:
+                tracemalloc.stop()
+                self.owns_tracing = False
+
+    def enter(self, name: str) -> dict:
+        entries = self.get_entries()
+        # a stage re-entered from inside itself is timed once, at the outside
+        if any(entry["stage"] == name for entry in entries):
+            entries.append({"stage": name, "nested": True})
+            return entries[-1]
+
+        with self.lock:
+            stage = self.get_stage(name)
+            traced = stage["snapshots"] < PROFILE_SNAPSHOTS_PER_STAGE
+            if traced:
+                stage["snapshots"] += 1
+        snapshot = None
+        if traced:
+            # taken before the clocks start, so the snapshot isn't timed
+            self.start_tracing()
+            snapshot = tracemalloc.take_snapshot()
+        entry = {
+            "stage": name,
+            "nested": False,
+            "traced": traced or self.tracing > 0,
+            "caller": get_stage_caller(sys._getframe()),
+            "snapshot": snapshot,
+            "wait_seconds": 0.0,
+            "cpu_started": time.thread_time(),
+            "started": time.perf_counter(),
+        }
+        entries.append(entry)
+        return entry
+
+    def exit(self, entry: dict) -> None:
+        self.get_entries().pop()
+        if entry["nested"]:
+            return
+        wall = time.perf_counter() - entry["started"]
+        cpu = time.thread_time() - entry["cpu_started"]
+
+        allocations = []
+        if entry["snapshot"]:
+            after = tracemalloc.take_snapshot()
+            self.stop_tracing()
+            # other threads allocate meanwhile - keep the blocks allocated
+            # beneath this stage's caller, i.e. by this call of the stage.
+            # Checked on the diff rather than with Snapshot.filter_traces,
+            # which matches every frame of every trace with fnmatch
+            allocations = [
+                stat
+                for stat in after.compare_to(entry["snapshot"], "traceback")
+                if stat.size_diff > 0
+                and stat.traceback[-1].filename not in PROFILER_FILES
+                and any(
+                    (frame.filename, frame.lineno) == entry["caller"]
+                    for frame in stat.traceback
+                )
+            ]
+
+        with self.lock:
+            stage = self.get_stage(entry["stage"])
+            stage["calls"] += 1
+            if not entry["traced"]:
+                stage["timed_calls"] += 1
+                stage["wall_seconds"] += wall
+                stage["cpu_seconds"] += cpu
+                stage["wait_seconds"] += entry["wait_seconds"]
+            for stat in allocations:
+                stage["allocated_bytes"] += stat.size_diff
+                # tracebacks run oldest to most recent frame
+                site = str(stat.traceback[-1])
+                size, count = stage["allocations"].get(site, (0, 0))
+                stage["allocations"][site] = (
+                    size + stat.size_diff,
+                    count + stat.count_diff,
+                )
+
+    def add_wait(self, dependency: str, seconds: float) -> None:
+        # sync callers are inside their thread's stages; async ones never are,
+        # as a stage doesn't span an await
+        for entry in getattr(self.local, "entries", []):
+            if not entry["nested"]:
+                entry["wait_seconds"] += seconds
+        with self.lock:
+            external = self.data["external"].setdefault(
+                dependency, {"calls": 0, "seconds": 0.0}
+            )
+            external["calls"] += 1
+            external["seconds"] += seconds
+
+
+@contextlib.contextmanager
+def profile_stage(name: str):
+    """
+    time the block as one call of a pipeline stage when --profile is on.
+    usable as a decorator; does nothing when profiling is off
+    """
+    profiler = _profiler
+    if profiler is None or name not in profiler.stages:
+        yield
+        return
+    entry = profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit(entry)
+
+
+@contextlib.contextmanager
+def external_wait(dependency: str):
+    """time spent waiting on hsp, openai etc., reported apart from cpu time"""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_wait(dependency, time.perf_counter() - started)
+
+
+def start_profiling(stages: tuple = None) -> None:
+    """profile the given stages (all of PROFILE_STAGES by default) until stopped"""
+    global _profiler
+    stages = tuple(stages or PROFILE_STAGES)
+    unknown = [stage for stage in stages if stage not in PROFILE_STAGES]
+    if unknown:
+        raise ValueError(
+            f"Unknown profile stage(s): {', '.join(unknown)} "
+            f"(expected some of {', '.join(PROFILE_STAGES)})"
+        )
+    if _profiler is not None:
+        _profiler.stop()
+    _profiler = Profiler(stages, PROFILE_SAMPLE_INTERVAL_SECONDS)
+    _profiler.start()
+
+
+def restart_profiling() -> None:
+    """
+    in a forked worker: the parent's sampler thread didn't come along and its
+    data is the parent's to report - start afresh on the same stages
+    """
+    global _profiler
+    if _profiler is None:
+        return
+    stages = _profiler.stages
+    _profiler = Profiler(stages, PROFILE_SAMPLE_INTERVAL_SECONDS)
+    _profiler.start()
+
+
+def collect_profile_data() -> dict:
+    """a worker's profile data so far, cpu time included; counting restarts from zero"""
+    if _profiler is None:
+        return None
+    with _profiler.lock:
+        data = _profiler.data
+        _profiler.data = new_profile_data()
+    cpu_now = time.process_time()
+    data["worker_cpu_seconds"] = cpu_now - _profiler.cpu_started
+    _profiler.cpu_started = cpu_now
+    return data
+
+
+def merge_profile_data(data: dict) -> None:
+    """fold a worker's collect_profile_data() into this process's profile"""
+    if _profiler is None or not data:
+        return
+    with _profiler.lock:
+        for name, worker_stage in data["stages"].items():
+            stage = _profiler.get_stage(name)
+            for field in (
+                "calls",
+                "timed_calls",
+                "wall_seconds",
+                "cpu_seconds",
+                "wait_seconds",
+                "allocated_bytes",
+                "samples",
+                "snapshots",
+            ):
+                stage[field] += worker_stage[field]
+            for folded, count in worker_stage["stacks"].items():
+                stage["stacks"][folded] = stage["stacks"].get(folded, 0) + count
+            for site, (size, count) in worker_stage["allocations"].items():
+                total_size, total_count = stage["allocations"].get(site, (0, 0))
+                stage["allocations"][site] = (total_size + size, total_count + count)
+        for dependency, worker_external in data["external"].items():
+            external = _profiler.data["external"].setdefault(
+                dependency, {"calls": 0, "seconds": 0.0}
+            )
+            external["calls"] += worker_external["calls"]
+            external["seconds"] += worker_external["seconds"]
+        _profiler.data["worker_cpu_seconds"] += data["worker_cpu_seconds"]
+
+
+def build_profile_summary(data: dict, wall_seconds: float, cpu_seconds: float) -> dict:
+    stages = {}
+    for name, stage in sorted(data["stages"].items()):
+        top = sorted(stage["allocations"].items(), key=lambda item: -item[1][0])
+        timed_calls = max(stage["timed_calls"], 1)
+        stages[name] = {
+            "calls": stage["calls"],
+            # the times are over the timed calls only
+            "timed_calls": stage["timed_calls"],
+            "wall_seconds": round(stage["wall_seconds"], 4),
+            "cpu_seconds": round(stage["cpu_seconds"], 4),
+            "wait_seconds": round(stage["wait_seconds"], 4),
+            "wall_ms_per_call": round(stage["wall_seconds"] * 1000 / timed_calls, 3),
+            "cpu_ms_per_call": round(stage["cpu_seconds"] * 1000 / timed_calls, 3),
+            "wait_ms_per_call": round(stage["wait_seconds"] * 1000 / timed_calls, 3),
+            "allocated_bytes": stage["allocated_bytes"],
+            "samples": stage["samples"],
+            "top_allocations": [
+                {"site": site, "size_bytes": size, "count": count}
+                for site, (size, count) in top[:PROFILE_TOP_ALLOCATIONS]
+            ],
+        }
+    external = {
+        dependency: {"calls": entry["calls"], "seconds": round(entry["seconds"], 4)}
+        for dependency, entry in sorted(data["external"].items())
+    }
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        "worker_cpu_seconds": round(data["worker_cpu_seconds"], 4),
+        "external_wait_seconds": round(
+            sum(entry["seconds"] for entry in external.values()), 4
+        ),
+        "external": external,
+        "stages": stages,
+    }
+
+
+def write_profile(data: dict, summary: dict, output_dir: Path) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name, stage in data["stages"].items():
+        with open(output_dir / f"{name}.folded", "w") as f:
+            for folded, count in sorted(stage["stacks"].items()):
+                f.write(f"{folded} {count}\n")
+    with open(output_dir / "summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def log_profile_summary(summary: dict) -> None:
+    log.info(
+        "Profile: %.2fs wall, %.2fs cpu (+%.2fs in workers), "
+        "%.2fs waiting on external calls",
+        summary["wall_seconds"],
+        summary["cpu_seconds"],
+        summary["worker_cpu_seconds"],
+        summary["external_wait_seconds"],
+    )
+    for dependency, entry in summary["external"].items():
+        log.info(
+            "  %s: %s call(s), %.2fs waiting",
+            dependency,
+            entry["calls"],
+            entry["seconds"],
+        )
+    for name, stage in summary["stages"].items():
+        log.info(
+            "  %s: %s call(s), per call %.2fms wall, %.2fms cpu, %.2fms waiting; "
+            "%s sample(s)",
+            name,
+            stage["calls"],
+            stage["wall_ms_per_call"],
+            stage["cpu_ms_per_call"],
+            stage["wait_ms_per_call"],
+            stage["samples"],
+        )
+        for allocation in stage["top_allocations"][:3]:
+            log.info(
+                "    %.1f KiB in %s block(s) at %s",
+                allocation["size_bytes"] / 1024,
+                allocation["count"],
+                allocation["site"],
+            )
+
+
+@contextlib.contextmanager
+def profiling(stages: tuple = None):
+    """
+    Profile the block: on exit, writes one folded-stack file per stage and a
+    summary.json (wall, cpu and external wait time; top allocation sites per
+    stage) to data/profiling/<timestamp>/, and logs the summary.
+    """
+    start_profiling(stages)
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        yield
+    finally:
+        wall_seconds = time.perf_counter() - started
+        cpu_seconds = time.process_time() - cpu_started
+        stop_profiling(wall_seconds, cpu_seconds)
+
+
+def stop_profiling(wall_seconds: float, cpu_seconds: float) -> Path:
+    global _profiler
+    if _profiler is None:
+        return None
+    _profiler.stop()
+    data = _profiler.data
+    _profiler = None
+
+    summary = build_profile_summary(data, wall_seconds, cpu_seconds)
+    output_dir = PROFILING_DIR / datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    write_profile(data, summary, output_dir)
+    log_profile_summary(summary)
+    log.info("Profile written to %s", output_dir)
+    return output_dir
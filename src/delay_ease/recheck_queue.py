@@ -0,0 +1,296 @@
+import copy
+import datetime
+import json
+import logging
+import os
+from pathlib import Path
+
+from src.delay_ease.const import (
+    CLAIM_WINDOW_DAYS,
+    DEFERRABLE_STATUSES,
+    DEGRADED_RECHECK_BASE_MINUTES,
+    DEGRADED_STATUS,
+    RECHECK_BASE_DELAY_MINUTES,
+    RECHECK_MAX_ATTEMPTS,
+    RECHECK_MAX_DELAY_HOURS,
+)
+from src.delay_ease.delay_calculation import (
+    check_ticket_delays,
+    new_hsp_cache,
+    prefetch_service_metrics,
+)
+from src.delay_ease.image_store import get_original_path, ingest_image
+from src.delay_ease.llm_usage import split_llm_usage, track_llm_usage
+from src.delay_ease.profiling import profile_stage
+from src.delay_ease.ticket_data_extraction import (
+    extract_ticket_details,
+    is_openai_unavailable,
+)
+
+log = logging.getLogger(__name__)
+
+RECHECK_DIR = Path("data/rechecks")
+
+
+def get_ticket_legs(extracted_data: dict) -> list:
+    return extracted_data.get("segments", [extracted_data])
+
+
+def needs_recheck(ticket_data: dict) -> bool:
+    """hsp had no actuals yet for the ticket, or for any of its segments"""
+    if ticket_data.get("status") in DEFERRABLE_STATUSES:
+        return True
+    return any(
+        seg.get("status") in DEFERRABLE_STATUSES
+        for seg in ticket_data.get("segments", [])
+    )
+
+
+def get_recheck_delay(attempts: int, status: str = None) -> datetime.timedelta:
+    """
+    exponential backoff: base delay doubling per attempt, capped. tickets
+    parked by an outage start from a shorter base
+    """
+    base = (
+        DEGRADED_RECHECK_BASE_MINUTES
+        if status == DEGRADED_STATUS
+        else RECHECK_BASE_DELAY_MINUTES
+    )
+    minutes = base * (2**attempts)
+    return min(
+        datetime.timedelta(minutes=minutes),
+        datetime.timedelta(hours=RECHECK_MAX_DELAY_HOURS),
+    )
+
+
+def get_recheck_deadline(extracted_data: dict) -> datetime.datetime:
+    if extracted_data is None:
+        # parked before extraction - the journey date isn't known yet
+        return datetime.datetime.now() + datetime.timedelta(days=CLAIM_WINDOW_DAYS + 1)
+    journey_date = datetime.datetime.strptime(
+        get_ticket_legs(extracted_data)[0]["ticket_date"], "%d %b %Y"
+    )
+    return journey_date + datetime.timedelta(days=CLAIM_WINDOW_DAYS + 1)
+
+
+def save_recheck(entry: dict) -> None:
+    RECHECK_DIR.mkdir(parents=True, exist_ok=True)
+    path = RECHECK_DIR / f"{entry['recheck_id']}.json"
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f, profile_stage("result_serialization"):
+        json.dump(entry, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remove_recheck(recheck_id: str) -> None:
+    path = RECHECK_DIR / f"{recheck_id}.json"
+    if path.exists():
+        path.unlink()
+
+
+def load_rechecks() -> list:
+    if not RECHECK_DIR.exists():
+        return []
+    entries = []
+    for path in sorted(RECHECK_DIR.glob("*.json")):
+        with open(path) as f:
+            entries.append(json.load(f))
+    return entries
+
+
+def find_pending_recheck(image_sha256: str) -> dict:
+    """pending re-check for the same image bytes, so a re-upload skips extraction"""
+    for entry in load_rechecks():
+        if entry.get("image_sha256") == image_sha256:
+            return entry
+    return None
+
+
+def schedule_recheck(
+    user_id: str,
+    image_sha256: str,
+    extracted_data: dict,
+    status: str,
+    ticket_index: int = None,
+) -> dict:
+    """
+    store the extracted ticket and schedule its first re-check. extracted_data
+    is None for tickets parked while openai was down; ticket_index is set for
+    one of several tickets on the image
+    """
+    now = datetime.datetime.now()
+    recheck_id = f"RC_{now.strftime('%Y%m%d_%H%M%S')}_{image_sha256[:12]}"
+    if ticket_index is not None:
+        recheck_id = f"{recheck_id}_{ticket_index}"
+    entry = {
+        "recheck_id": recheck_id,
+        "user_id": user_id,
+        "image_sha256": image_sha256,
+        "ticket_index": ticket_index,
+        "extracted_data": extracted_data,
+        "attempts": 0,
+        "outages": 0,
+        "last_status": status,
+        "created_at": now.isoformat(),
+        "next_check_at": (now + get_recheck_delay(0, status)).isoformat(),
+        "deadline": get_recheck_deadline(extracted_data).isoformat(),
+    }
+    save_recheck(entry)
+    log.info(f"Scheduled re-check {entry['recheck_id']} at {entry['next_check_at']}")
+    return entry
+
+
+def get_parked_image_path(entry: dict) -> str:
+    """
+    the stored image for a parked ticket. entries parked before ticket images
+    were kept in the store only hold the upload's path, which is ingested now
+    """
+    if get_original_path(entry["image_sha256"]) is None and entry.get("image_path"):
+        ingest_image(entry["image_path"])
+    original_path = get_original_path(entry["image_sha256"])
+    if original_path is None:
+        raise FileNotFoundError(
+            f"Ticket image {entry['image_sha256'][:12]} is not in the store"
+        )
+    return str(original_path)
+
+
+def extract_parked_ticket(entry: dict) -> bool:
+    """vision extraction for a ticket parked while openai was down"""
+    with track_llm_usage(entry.get("llm_usage")) as llm_usage:
+        try:
+            extracted_data = extract_ticket_details(get_parked_image_path(entry))
+        except Exception as e:
+            if is_openai_unavailable(e):
+                log.warning(f"Re-check {entry['recheck_id']} still waiting: {e}")
+                return False
+            extracted_data = {"error": str(e)}
+    entry["llm_usage"] = llm_usage
+    entry["extracted_data"] = extracted_data
+    try:
+        entry["deadline"] = get_recheck_deadline(extracted_data).isoformat()
+    except (KeyError, ValueError):
+        # unreadable ticket - resolves as an extraction error on this check
+        pass
+    return True
+
+
+def split_parked_tickets(entry: dict, now: datetime.datetime) -> list:
+    """
+    A parked image that turned out to hold several tickets: the entry keeps
+    the first and each other ticket gets an entry of its own, due now, with an
+    equal share of the extraction's usage. Returns the new entries.
+    """
+    if "tickets" not in entry["extracted_data"]:
+        return []
+    tickets = entry["extracted_data"]["tickets"]
+    shares = split_llm_usage(entry["llm_usage"], len(tickets))
+    entries = []
+    for i, (ticket, usage) in enumerate(zip(tickets, shares)):
+        ticket_entry = entry if i == 0 else copy.deepcopy(entry)
+        if i:
+            ticket_entry["recheck_id"] = f"{entry['recheck_id']}_{i}"
+            ticket_entry["next_check_at"] = now.isoformat()
+            entries.append(ticket_entry)
+        ticket_entry["ticket_index"] = i
+        ticket_entry["extracted_data"] = ticket
+        ticket_entry["llm_usage"] = usage
+        try:
+            ticket_entry["deadline"] = get_recheck_deadline(ticket).isoformat()
+        except (KeyError, ValueError):
+            pass
+    for ticket_entry in entries:
+        save_recheck(ticket_entry)
+    return entries
+
+
+def reschedule_recheck(entry: dict, now: datetime.datetime) -> None:
+    if entry["last_status"] == DEGRADED_STATUS:
+        # outages back off separately and don't use up the ticket's attempts
+        entry["outages"] = entry.get("outages", 0) + 1
+        delay = get_recheck_delay(entry["outages"], DEGRADED_STATUS)
+    else:
+        delay = get_recheck_delay(entry["attempts"])
+    deadline = datetime.datetime.fromisoformat(entry["deadline"])
+    entry["next_check_at"] = min(now + delay, deadline).isoformat()
+    save_recheck(entry)
+
+
+def run_due_rechecks(now: datetime.datetime = None) -> list:
+    """
+    Re-check every due entry using its stored extraction (no vision call,
+    except for tickets parked before they could be read). Metrics for entries sharing a corridor and date are fetched with a single
+    merged hsp query. Returns (entry, ticket_data) for entries that resolved;
+    unresolved entries are rescheduled with backoff until the deadline.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+
+    due = [
+        entry
+        for entry in load_rechecks()
+        if datetime.datetime.fromisoformat(entry["next_check_at"]) <= now
+    ]
+    if not due:
+        return []
+
+    # tickets parked while openai was down still need their extraction
+    split_off = []
+    for entry in due:
+        if entry["extracted_data"] is not None:
+            continue
+        if extract_parked_ticket(entry):
+            split_off.extend(split_parked_tickets(entry, now))
+        elif now >= datetime.datetime.fromisoformat(entry["deadline"]):
+            log.warning(
+                f"Re-check {entry['recheck_id']} expired before its ticket could be read"
+            )
+            remove_recheck(entry["recheck_id"])
+        else:
+            entry["last_status"] = DEGRADED_STATUS
+            reschedule_recheck(entry, now)
+    due = [entry for entry in due + split_off if entry["extracted_data"] is not None]
+    if not due:
+        return []
+
+    hsp_cache = new_hsp_cache()
+    # unreadable or paper tickets from a deferred extraction make no hsp calls
+    legs = [
+        leg
+        for entry in due
+        if "error" not in entry["extracted_data"]
+        for leg in get_ticket_legs(entry["extracted_data"])
+        if leg.get("ticket_format") != "Paper"
+    ]
+    queries = prefetch_service_metrics(legs, hsp_cache)
+    log.info(f"Re-checking {len(due)} ticket(s) with {queries} metrics query(s)")
+
+    resolved = []
+    for entry in due:
+        ticket_data = check_ticket_delays(
+            copy.deepcopy(entry["extracted_data"]), hsp_cache=hsp_cache
+        )
+        entry["last_status"] = ticket_data.get("status")
+        if entry["last_status"] != DEGRADED_STATUS:
+            entry["attempts"] += 1
+
+        deadline = datetime.datetime.fromisoformat(entry["deadline"])
+        if (
+            needs_recheck(ticket_data)
+            and entry["attempts"] < RECHECK_MAX_ATTEMPTS
+            and now < deadline
+        ):
+            reschedule_recheck(entry, now)
+            continue
+
+        remove_recheck(entry["recheck_id"])
+        resolved.append((entry, ticket_data))
+
+    return resolved
+
+
+def get_next_recheck_time() -> datetime.datetime:
+    entries = load_rechecks()
+    if not entries:
+        return None
+    return min(datetime.datetime.fromisoformat(e["next_check_at"]) for e in entries)
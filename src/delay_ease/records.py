@@ -0,0 +1,222 @@
+import sys
+
+
+class _Missing:
+    """marks a field absent from the source dict, so to_dict round-trips its shape"""
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self):
+        # copies and pickles resolve back to the module singleton
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class SlottedRecord:
+    """
+    fixed-field record with dict-style access, so code written against the
+    json dicts keeps working. keys outside FIELDS are kept in `extra`, and
+    INTERNED fields (stations, operators, statuses) share one string object
+    across records
+    """
+
+    FIELDS = ()
+    INTERNED = frozenset()
+    __slots__ = ("extra",)
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.pop(field, MISSING))
+        self.extra = values or None
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        record = cls.__new__(cls)
+        extra = None
+        for key in data.keys() - cls.FIELD_SET:
+            if extra is None:
+                extra = {}
+            extra[key] = data[key]
+        for field in cls.FIELDS:
+            value = data.get(field, MISSING)
+            if field in cls.INTERNED and type(value) is str:
+                value = sys.intern(value)
+            setattr(record, field, value)
+        record.extra = extra
+        return record
+
+    def to_dict(self) -> dict:
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not MISSING:
+                data[field] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self.FIELD_SET:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def keys(self) -> list:
+        return list(self.to_dict())
+
+    def items(self) -> list:
+        return list(self.to_dict().items())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, MISSING) is not MISSING
+
+    def __setitem__(self, key, value):
+        if key in self.FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class SegmentRecord(SlottedRecord):
+    """
+    a ticket (or one leg of it) as reported back: the crucial result fields,
+    with the rest (image hash, llm usage, re-check id) in extra
+    """
+
+    FIELDS = (
+        "ticket_date",
+        "departure_time",
+        "departure_station",
+        "departure_crs",
+        "arrival_station",
+        "arrival_crs",
+        "ticket_type",
+        "railcard",
+        "ctr",
+        "delay_minutes",
+        "train_operator",
+        "toc_code",
+        "delay_status",
+        "compensation_percentage",
+        "arrival_delay_minutes",
+        "ticket_format",
+        "status",
+        "message",
+        "next_action",
+        "learn_more_topic",
+        "journey_mode",
+        "replacement_service",
+    )
+    INTERNED = frozenset(
+        {
+            "ticket_date",
+            "departure_station",
+            "departure_crs",
+            "arrival_station",
+            "arrival_crs",
+            "ticket_type",
+            "railcard",
+            "ticket_format",
+            "train_operator",
+            "toc_code",
+            "delay_status",
+            "compensation_percentage",
+            "status",
+            "next_action",
+            "learn_more_topic",
+            "journey_mode",
+        }
+    )
+    __slots__ = FIELDS
+
+
+class ClaimRecord(SlottedRecord):
+    """a saved claim (data/claims/<claim_id>.json)"""
+
+    FIELDS = (
+        "claim_id",
+        "user_id",
+        "toc_claim_reference",
+        "status",
+        "toc",
+        "journey_date",
+        "departure_station",
+        "arrival_station",
+        "departure_time",
+        "delay_minutes",
+        "compensation_percentage",
+        "compensation_amount",
+        "submitted_at",
+        "ticket_image_sha256",
+        "ticket_image_path",
+        "llm_usage",
+        "automation_status",
+        "automation_error",
+        "failed_stage",
+        "submission_attempts",
+        "claim_status",
+        "portal_status",
+        "portal_reference",
+        "status_checked_at",
+    )
+    INTERNED = frozenset(
+        {
+            "user_id",
+            "status",
+            "toc",
+            "journey_date",
+            "departure_station",
+            "arrival_station",
+            "departure_time",
+            "compensation_percentage",
+            "automation_status",
+            "failed_stage",
+            "claim_status",
+        }
+    )
+    __slots__ = FIELDS
+
+
+def build_result_record(result: dict) -> SegmentRecord:
+    """
+    a ticket's result as held while a batch is aggregated - its segments, or
+    the tickets of a multi-ticket image, become records too
+    """
+    if isinstance(result, SegmentRecord):
+        return result
+    record = SegmentRecord.from_dict(result)
+    for key in ("segments", "tickets"):
+        if record.extra and key in record.extra:
+            record.extra[key] = [
+                build_result_record(item) for item in record.extra[key]
+            ]
+    return record
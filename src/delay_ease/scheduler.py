@@ -0,0 +1,119 @@
+import datetime
+import heapq
+import logging
+
+from src.delay_ease.const import (
+    AT_RISK_MARGIN_HOURS,
+    AVERAGE_FARE_GBP,
+    CLAIM_WINDOW_DAYS,
+    FAIRNESS_PENALTY_HOURS,
+    SUBMISSION_CAPACITY_PER_HOUR,
+    VALUE_REFERENCE_GBP,
+)
+
+log = logging.getLogger(__name__)
+
+
+def get_claim_deadline(record: dict) -> datetime.datetime:
+    """claims close at the end of the last day of the claim window"""
+    journey_date = datetime.datetime.strptime(record["journey_date"], "%d %b %Y")
+    return journey_date + datetime.timedelta(days=CLAIM_WINDOW_DAYS + 1)
+
+
+def get_expected_value(record: dict) -> float:
+    """expected compensation in pounds, estimated from the percentage if no amount"""
+    if record.get("compensation_amount"):
+        return float(record["compensation_amount"])
+    try:
+        percentage = float(str(record.get("compensation_percentage", "0%")).rstrip("%"))
+    except ValueError:
+        percentage = 0.0
+    return AVERAGE_FARE_GBP * percentage / 100.0
+
+
+def get_priority_key(record: dict, now: datetime.datetime) -> float:
+    """hours of slack, shrunk for valuable claims - lower runs first"""
+    hours_remaining = (get_claim_deadline(record) - now).total_seconds() / 3600.0
+    return hours_remaining / (1.0 + get_expected_value(record) / VALUE_REFERENCE_GBP)
+
+
+def schedule_claims(records: list, now: datetime.datetime = None) -> tuple:
+    """
+    Order claims by deadline slack and value, with fair sharing across users:
+    each claim already scheduled for a user pushes that user's next claim back
+    by FAIRNESS_PENALTY_HOURS. Returns (scheduled, expired).
+    """
+    if now is None:
+        now = datetime.datetime.now()
+
+    expired = []
+    per_user = {}
+    for record in records:
+        if get_claim_deadline(record) <= now:
+            expired.append(record)
+            continue
+        per_user.setdefault(record.get("user_id", ""), []).append(
+            (get_priority_key(record, now), record["claim_id"], record)
+        )
+
+    heap = []
+    for user_id, queue in per_user.items():
+        queue.sort(key=lambda item: (item[0], item[1]))
+        key, claim_id, _ = queue[0]
+        heapq.heappush(heap, (key, claim_id, user_id, 0))
+
+    scheduled = []
+    while heap:
+        _, _, user_id, position = heapq.heappop(heap)
+        scheduled.append(per_user[user_id][position][2])
+        position += 1
+        if position < len(per_user[user_id]):
+            key, claim_id, _ = per_user[user_id][position]
+            heapq.heappush(
+                heap,
+                (key + position * FAIRNESS_PENALTY_HOURS, claim_id, user_id, position),
+            )
+
+    return scheduled, expired
+
+
+def build_admission_report(
+    records: list,
+    capacity_per_hour: float = SUBMISSION_CAPACITY_PER_HOUR,
+    now: datetime.datetime = None,
+) -> dict:
+    """simulate the schedule at the given capacity and flag claims likely to expire"""
+    if capacity_per_hour <= 0:
+        raise ValueError(f"Capacity must be positive, got {capacity_per_hour}")
+    if now is None:
+        now = datetime.datetime.now()
+
+    scheduled, expired = schedule_claims(records, now)
+    margin = datetime.timedelta(hours=AT_RISK_MARGIN_HOURS)
+
+    queue = []
+    at_risk = []
+    for position, record in enumerate(scheduled):
+        estimated_start = now + datetime.timedelta(hours=position / capacity_per_hour)
+        deadline = get_claim_deadline(record)
+        entry = {
+            "claim_id": record["claim_id"],
+            "user_id": record.get("user_id"),
+            "toc": record.get("toc"),
+            "deadline": deadline.isoformat(),
+            "estimated_start": estimated_start.isoformat(),
+            "expected_value": round(get_expected_value(record), 2),
+        }
+        queue.append(entry)
+        if estimated_start + margin > deadline:
+            at_risk.append(entry)
+
+    return {
+        "generated_at": now.isoformat(),
+        "capacity_per_hour": capacity_per_hour,
+        "queued": len(scheduled),
+        "hours_to_clear": round(len(scheduled) / capacity_per_hour, 2),
+        "queue": queue,
+        "at_risk": at_risk,
+        "expired": [record["claim_id"] for record in expired],
+    }
@@ -1,4 +1,5 @@
 import asyncio
+import copy
 import datetime
 import json
 import logging
@@ -6,14 +7,46 @@ import os
 from pathlib import Path
 
 from src.delay_ease.browser_automation_type_a import run_type_a_automation
-from src.delay_ease.delay_calculation import calculate_delay_compensation
-from src.delay_ease.utils import is_type_a_toc
+from src.delay_ease.checkpoint import build_checkpoint_id
+from src.delay_ease.circuit_breaker import CircuitOpenError, get_portal_breaker
+from src.delay_ease.const import DEGRADED_STATUS, MAX_CONCURRENT_TICKETS
+from src.delay_ease.delay_calculation import check_ticket_delays, new_hsp_cache
+from src.delay_ease.image_index import find_cached_extraction, remember_extraction
+from src.delay_ease.image_store import get_original_path, get_upload_path, ingest_image
+from src.delay_ease.llm_usage import merge_llm_usage, split_llm_usage, track_llm_usage
+from src.delay_ease.profiling import external_wait, profile_stage
+from src.delay_ease.recheck_queue import (
+    find_pending_recheck,
+    needs_recheck,
+    run_due_rechecks,
+    schedule_recheck,
+)
+from src.delay_ease.records import ClaimRecord, build_result_record
+from src.delay_ease.structured_logging import bind_log_context
+from src.delay_ease.ticket_data_extraction import (
+    extract_ticket_details_async,
+    is_openai_unavailable,
+    openai_breaker,
+)
+from src.delay_ease.user_profiles import is_profile_store_enabled, load_user_profile
+from src.delay_ease.utils import get_operator_website, is_type_a_toc
 
 log = logging.getLogger(__name__)
 
+# claim reference for eligible type a claims waiting for batched submission
+PENDING_SUBMISSION = "PENDING_SUBMISSION"
 
-def get_user_details():
+
+def get_user_details(user_id: str = None):
     """Get user details with fail-fast validation for required fields"""
+    # with a profile key configured every user must have their own stored profile,
+    # so one user's claim can never be filed with another user's bank details
+    if is_profile_store_enabled():
+        if not user_id:
+            raise ValueError("A user id is required when the profile store is enabled")
+        profile = load_user_profile(user_id)
+        return {"passenger": profile["passenger"], "bank": profile["bank"]}
+
     required_user_vars = [
         "USER_TITLE",
         "USER_FIRST_NAME",
@@ -52,15 +85,29 @@ def get_user_details():
     return {"passenger": p, "bank": b}
 
 
+CLAIMS_DIR = Path("data/claims")
+
+
 def save_claim_record(
     user_id: str, ticket_data: dict, claim_reference: str = None
 ) -> str:
-    claims_dir = Path("data/claims")
+    claims_dir = CLAIMS_DIR
     claims_dir.mkdir(exist_ok=True)
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     claim_id = f"DE_{timestamp}_{user_id}"
 
+    # batch runs can save several claims for one user within the same second,
+    # from several worker processes - the file is created exclusively to claim the id
+    suffix = 1
+    while True:
+        try:
+            claim_file = open(claims_dir / f"{claim_id}.json", "x")
+            break
+        except FileExistsError:
+            suffix += 1
+            claim_id = f"DE_{timestamp}_{user_id}_{suffix}"
+
     claim_record = {
         "claim_id": claim_id,
         "user_id": user_id,
@@ -70,20 +117,59 @@ def save_claim_record(
         "journey_date": ticket_data.get("ticket_date", "Unknown"),
         "departure_station": ticket_data.get("departure_station", "Unknown"),
         "arrival_station": ticket_data.get("arrival_station", "Unknown"),
+        "departure_time": ticket_data.get("departure_time", "Unknown"),
         "delay_minutes": ticket_data.get("delay_minutes", 0),
         "compensation_percentage": ticket_data.get("compensation_percentage", "0%"),
         "compensation_amount": ticket_data.get("compensation_amount"),
         "submitted_at": datetime.datetime.now().isoformat(),
-        "ticket_image_path": ticket_data.get("image_path", ""),
+        "ticket_image_sha256": ticket_data.get("image_sha256"),
+        "llm_usage": ticket_data.get("llm_usage"),
     }
 
-    claim_file = claims_dir / f"{claim_id}.json"
-    with open(claim_file, "w") as f:
-        json.dump(claim_record, f, indent=2)
+    with claim_file, profile_stage("result_serialization"):
+        json.dump(claim_record, claim_file, indent=2)
 
     return claim_id
 
 
+def load_claim_records(claim_reference: str = None) -> list:
+    """load saved claims as ClaimRecords, optionally only those with a reference"""
+    records = []
+    if not CLAIMS_DIR.exists():
+        return records
+
+    for claim_file in sorted(CLAIMS_DIR.glob("*.json")):
+        with open(claim_file) as f:
+            record = json.load(f)
+        if claim_reference and record.get("toc_claim_reference") != claim_reference:
+            continue
+        records.append(ClaimRecord.from_dict(record))
+    return records
+
+
+def update_claim_record(claim_id: str, updates: dict) -> dict:
+    claim_file = CLAIMS_DIR / f"{claim_id}.json"
+    with open(claim_file) as f:
+        claim_record = json.load(f)
+
+    claim_record.update(updates)
+    with open(claim_file, "w") as f, profile_stage("result_serialization"):
+        json.dump(claim_record, f, indent=2)
+
+    return claim_record
+
+
+def build_journey_details(ticket_data: dict) -> dict:
+    return {
+        "train_operator": ticket_data.get("train_operator", ""),
+        "date": ticket_data.get("ticket_date", ""),
+        "departure_time": ticket_data.get("departure_time", ""),
+        "departure_station": ticket_data.get("departure_station", ""),
+        "arrival_station": ticket_data.get("arrival_station", ""),
+        "delay_minutes": ticket_data.get("delay_minutes", 0),
+    }
+
+
 def display_status_message(ticket_data: dict):
     """Display user-friendly status messages with appropriate emojis and formatting"""
     status = ticket_data.get("status", "unknown")
@@ -97,7 +183,8 @@ def display_status_message(ticket_data: dict):
 
         if "learn_more" in ticket_data.get("next_action", ""):
             log.info(
-                f"Learn more about {ticket_data.get('learn_more_topic', 'delay repay policies')}"
+                "Learn more about %s",
+                ticket_data.get("learn_more_topic", "delay repay policies"),
             )
 
     elif status == "eligible":
@@ -111,116 +198,443 @@ def display_status_message(ticket_data: dict):
 
         log.info("ELIGIBLE FOR COMPENSATION!")
         log.info("=" * 60)
-        log.info(f"{message}")
+        log.info("%s", message)
         log.info("Details:")
-        log.info(f"   Operator: {toc}")
-        log.info(f"   From: {dep_station}")
-        log.info(f"   To: {arr_station}")
-        log.info(f"   Date: {journey_date}")
-        log.info(f"   Departure time: {dep_time}")
-        log.info(f"   Delay: {delay} minutes")
-        log.info(f"   Compensation: {compensation}")
+        log.info("   Operator: %s", toc)
+        log.info("   From: %s", dep_station)
+        log.info("   To: %s", arr_station)
+        log.info("   Date: %s", journey_date)
+        log.info("   Departure time: %s", dep_time)
+        log.info("   Delay: %s minutes", delay)
+        log.info("   Compensation: %s", compensation)
 
         amount = ticket_data.get("compensation_amount")
         if amount:
-            log.info(f"   Estimated amount: £{amount:.2f}")
+            log.info("   Estimated amount: £%.2f", amount)
 
     elif status.startswith("error"):
         log.error("ERROR PROCESSING TICKET")
-        log.error(f"{message}")
+        log.error("%s", message)
 
     else:
-        log.info(f"STATUS: {status.upper()}")
-        log.info(f"{message}")
+        log.info("STATUS: %s", status.upper())
+        log.info("%s", message)
 
 
-def process_single_ticket(image_path: str, user_id: str = "test_user") -> dict:
-    log.info("DELAY EASE - AUTOMATED DELAY REPAY")
-    log.info(f"Processing ticket: {os.path.basename(image_path)}")
+def queue_claim_for_submission(ticket_data: dict, user_id: str) -> None:
+    """save an eligible type a claim for submit_pending_claims"""
+    claim_id = save_claim_record(user_id, ticket_data, PENDING_SUBMISSION)
+    ticket_data["claim_id"] = claim_id
+    ticket_data["automation_status"] = "pending_submission"
 
-    if not os.path.exists(image_path):
-        return {
-            "status": "error_file_not_found",
-            "message": f"Ticket file not found: {image_path}",
-            "next_action": "upload_valid_file",
-        }
-
-    try:
-        # phase 1 & 2: extract ticket data and check eligibility
-        log.info("Analyzing ticket and checking for delays...")
-        ticket_data = calculate_delay_compensation(image_path)
-        ticket_data["image_path"] = os.path.abspath(image_path)
 
-        display_status_message(ticket_data)
+def build_degraded_response(entry: dict, dependency: str) -> dict:
+    return {
+        "status": DEGRADED_STATUS,
+        "message": f"{dependency} is temporarily unavailable. Your ticket has been queued and we'll process it automatically at {entry['next_check_at']}.",
+        "next_action": "await_recheck",
+        "recheck_id": entry["recheck_id"],
+    }
 
-        # phase 3: proceed with automation if eligible
-        if ticket_data.get("status") == "eligible":
-            toc = ticket_data.get("train_operator", "")
-
-            if is_type_a_toc(toc):
-                log.info(f"Proceeding with automated claim submission for {toc}...")
-
-                journey_details = {
-                    "train_operator": toc,
-                    "date": ticket_data.get("ticket_date", ""),
-                    "departure_time": ticket_data.get("departure_time", ""),
-                    "departure_station": ticket_data.get("departure_station", ""),
-                    "arrival_station": ticket_data.get("arrival_station", ""),
-                    "delay_minutes": ticket_data.get("delay_minutes", 0),
-                }
-
-                user_details = get_user_details()
-
-                # phase 4: run automation
-                try:
-                    log.info("Submitting claim automatically...")
-                    asyncio.run(
-                        run_type_a_automation(
-                            journey_details,
-                            user_details["passenger"],
-                            user_details["bank"],
-                            ticket_data["image_path"],
-                        )
-                    )
 
-                    # phase 5: store claim record
-                    claim_id = save_claim_record(user_id, ticket_data, "AUTO_SUBMITTED")
+async def handle_checked_ticket_async(
+    ticket_data: dict, user_id: str, submission_mode: str = "immediate"
+) -> dict:
+    """claim phases for a ticket whose eligibility has been checked"""
+    # phase 3: proceed with automation if eligible
+    if ticket_data.get("status") == "eligible":
+        toc = ticket_data.get("train_operator", "")
 
-                    log.info("CLAIM SUBMITTED SUCCESSFULLY!")
-                    log.info(f"Claim ID: {claim_id}")
-                    log.info(
-                        "You will receive a notification when compensation is ready for withdrawal"
+        portal_breaker = (
+            get_portal_breaker(get_operator_website(toc))
+            if is_type_a_toc(toc)
+            else None
+        )
+        if is_type_a_toc(toc) and submission_mode == "batch":
+            log.info("Queued claim for batched submission to %s", toc)
+            queue_claim_for_submission(ticket_data, user_id)
+
+        elif is_type_a_toc(toc) and not (
+            portal_breaker.is_available() and openai_breaker.is_available()
+        ):
+            # don't hold a browser on a portal or model that is down
+            log.warning("%s submission unavailable, queueing claim for later", toc)
+            queue_claim_for_submission(ticket_data, user_id)
+
+        elif is_type_a_toc(toc):
+            log.info("Proceeding with automated claim submission for %s...", toc)
+
+            journey_details = build_journey_details(ticket_data)
+
+            user_details = get_user_details(user_id)
+            checkpoint_id = build_checkpoint_id(user_id, journey_details)
+            if ticket_data.get("ticket_index"):
+                # several passengers' tickets on one image can share a journey
+                checkpoint_id = f"{checkpoint_id}_{ticket_data['ticket_index']}"
+
+            # phase 4: run automation
+            try:
+                log.info("Submitting claim automatically...")
+                with external_wait("portal"):
+                    await portal_breaker.call_async(
+                        run_type_a_automation,
+                        journey_details,
+                        user_details["passenger"],
+                        user_details["bank"],
+                        get_upload_path(ticket_data["image_sha256"]),
+                        checkpoint_id,
+                        user_id,
                     )
 
-                    ticket_data["claim_id"] = claim_id
-                    ticket_data["automation_status"] = "submitted"
+                # phase 5: store claim record
+                claim_id = save_claim_record(user_id, ticket_data, "AUTO_SUBMITTED")
 
-                except Exception as e:
-                    log.error(f"Error during automation: {e}")
-                    ticket_data["automation_status"] = "failed"
-                    ticket_data["automation_error"] = str(e)
+                log.info("CLAIM SUBMITTED SUCCESSFULLY!")
+                log.info("Claim ID: %s", claim_id)
+                log.info(
+                    "You will receive a notification when compensation is ready for withdrawal"
+                )
 
-            else:
-                log.info(f"{toc} automation not yet available")
-                log.info("Your claim details have been saved for manual processing")
-
-                claim_id = save_claim_record(user_id, ticket_data, "MANUAL_REQUIRED")
                 ticket_data["claim_id"] = claim_id
-                ticket_data["automation_status"] = "manual_required"
+                ticket_data["automation_status"] = "submitted"
+
+            except CircuitOpenError as e:
+                log.warning("%s - queueing claim for later", e)
+                queue_claim_for_submission(ticket_data, user_id)
+
+            except Exception as e:
+                log.error("Error during automation: %s", e)
+                ticket_data["automation_status"] = "failed"
+                ticket_data["automation_error"] = str(e)
+                # a retry with the same ticket resumes from this checkpoint
+                ticket_data["checkpoint_id"] = checkpoint_id
+
+        else:
+            log.info("%s automation not yet available", toc)
+            log.info("Your claim details have been saved for manual processing")
 
-        elif ticket_data.get("status", "").startswith("ineligible"):
-            claim_id = save_claim_record(user_id, ticket_data, "INELIGIBLE")
+            claim_id = save_claim_record(user_id, ticket_data, "MANUAL_REQUIRED")
             ticket_data["claim_id"] = claim_id
+            ticket_data["automation_status"] = "manual_required"
 
-        log.info("=" * 60)
-        return ticket_data
-
-    except Exception as e:
-        log.error(f"Unexpected error processing ticket: {e}")
-        error_data = {
-            "status": "error_processing",
-            "message": f"Unexpected error: {str(e)}",
-            "next_action": "contact_support",
-        }
-        display_status_message(error_data)
-        return error_data
+    elif ticket_data.get("status", "").startswith("ineligible"):
+        claim_id = save_claim_record(user_id, ticket_data, "INELIGIBLE")
+        ticket_data["claim_id"] = claim_id
+
+    return ticket_data
+
+
+def handle_checked_ticket(
+    ticket_data: dict, user_id: str, submission_mode: str = "immediate"
+) -> dict:
+    return asyncio.run(
+        handle_checked_ticket_async(ticket_data, user_id, submission_mode)
+    )
+
+
+async def read_ticket_async(
+    image_path: str, user_id: str, validate: bool = True
+) -> tuple:
+    """
+    Store the image and extract its details, reusing an earlier extraction.
+    Returns (image_sha256, extracted_data, None), or (image_sha256, None,
+    result) when the ticket is settled for now - already queued, or parked.
+    validate=False leaves validating a fresh extraction, and remembering it
+    for re-uploads, to the caller
+    """
+    if not os.path.exists(image_path):
+        return (
+            None,
+            None,
+            {
+                "status": "error_file_not_found",
+                "message": f"Ticket file not found: {image_path}",
+                "next_action": "upload_valid_file",
+            },
+        )
+
+    # identical uploads share one stored copy; from here on the ticket is
+    # referred to by its hash, not the caller's file path
+    image_sha256 = await asyncio.to_thread(ingest_image, image_path)
+    image_path = str(get_original_path(image_sha256))
+
+    # a re-upload of a ticket already waiting on hsp data needs no new extraction
+    pending = find_pending_recheck(image_sha256)
+    if pending:
+        log.info("Ticket already queued for re-check %s", pending["recheck_id"])
+        return (
+            image_sha256,
+            None,
+            {
+                "status": "pending_recheck",
+                "message": f"We're still waiting for rail performance data for this journey. We'll check again automatically at {pending['next_check_at']}.",
+                "next_action": "await_recheck",
+                "recheck_id": pending["recheck_id"],
+            },
+        )
+
+    # phase 1: extract ticket data
+    log.info("Analyzing ticket and checking for delays...")
+    # re-uploads, including re-cropped or re-saved screenshots, reuse the
+    # earlier extraction instead of another vision call
+    extracted_data = await asyncio.to_thread(
+        find_cached_extraction, image_path, user_id
+    )
+    if extracted_data is None:
+        try:
+            extracted_data = await extract_ticket_details_async(image_path, validate)
+        except Exception as e:
+            if not is_openai_unavailable(e):
+                raise
+            # park the ticket instead of failing it - extracted on re-check
+            log.warning("Ticket reading unavailable, parking ticket: %s", e)
+            entry = schedule_recheck(user_id, image_sha256, None, DEGRADED_STATUS)
+            return image_sha256, None, build_degraded_response(entry, "Ticket reading")
+        if validate:
+            await asyncio.to_thread(
+                remember_extraction, image_path, user_id, extracted_data
+            )
+    return image_sha256, extracted_data, None
+
+
+async def check_extracted_ticket_async(
+    image_sha256: str,
+    extracted_data: dict,
+    user_id: str,
+    submission_mode: str,
+    hsp_cache: dict,
+    llm_usage: dict,
+    ticket_index: int = None,
+) -> dict:
+    """
+    phase 2: check eligibility against hsp, then claim or schedule a re-check.
+    ticket_index is the ticket's place on an image showing several
+    """
+    # hsp calls are blocking requests - run them in a worker thread
+    ticket_data = await asyncio.to_thread(
+        check_ticket_delays, copy.deepcopy(extracted_data), hsp_cache=hsp_cache
+    )
+    ticket_data["image_sha256"] = image_sha256
+    if ticket_index is not None:
+        ticket_data["ticket_index"] = ticket_index
+    # live view - claim records saved later include the automation stages
+    ticket_data["llm_usage"] = llm_usage
+
+    # hsp often lacks actuals for very recent journeys - retry later, reusing the extraction
+    if needs_recheck(ticket_data):
+        entry = schedule_recheck(
+            user_id,
+            image_sha256,
+            extracted_data,
+            ticket_data.get("status"),
+            ticket_index,
+        )
+        ticket_data["recheck_id"] = entry["recheck_id"]
+        ticket_data["next_action"] = "await_recheck"
+        if ticket_data.get("status") != DEGRADED_STATUS:
+            # segment-mode results carry their messages per segment only
+            message = ticket_data.get("message", "")
+            ticket_data["message"] = (
+                f"{message} We'll re-check automatically once the data is published."
+            ).strip()
+
+    display_status_message(ticket_data)
+    await handle_checked_ticket_async(ticket_data, user_id, submission_mode)
+
+    log.info("=" * 60)
+    return ticket_data
+
+
+def split_extracted_tickets(extracted_data: dict, llm_usage: dict) -> list:
+    """
+    (ticket_index, extracted ticket, llm usage) per ticket on the image. A lone
+    ticket has no index and keeps the image's usage; several share it equally
+    """
+    if "tickets" not in extracted_data:
+        return [(None, extracted_data, llm_usage)]
+    tickets = extracted_data["tickets"]
+    return [
+        (i, ticket, usage)
+        for i, (ticket, usage) in enumerate(
+            zip(tickets, split_llm_usage(llm_usage, len(tickets)))
+        )
+    ]
+
+
+def build_multi_ticket_result(results: list) -> dict:
+    """one result for an image of several tickets, each checked and claimed alone"""
+    eligible = sum(1 for r in results if r.get("status") == "eligible")
+    return {
+        "status": "multiple_tickets",
+        "message": f"Found {len(results)} tickets in your image, {eligible} eligible for compensation.",
+        "tickets": results,
+        "llm_usage": merge_llm_usage(*(r.get("llm_usage") for r in results)),
+    }
+
+
+async def check_extracted_tickets_async(
+    image_sha256: str,
+    extracted_data: dict,
+    user_id: str,
+    submission_mode: str,
+    hsp_cache: dict,
+    llm_usage: dict,
+) -> dict:
+    """
+    check_extracted_ticket_async for every ticket on the image. Tickets are
+    checked one after another on one hsp cache, so tickets for the same
+    service (several passengers, say) make its hsp lookups once
+    """
+    if "tickets" not in extracted_data:
+        return await check_extracted_ticket_async(
+            image_sha256, extracted_data, user_id, submission_mode, hsp_cache, llm_usage
+        )
+
+    tickets = split_extracted_tickets(extracted_data, llm_usage)
+    log.info("Found %s tickets in the image", len(tickets))
+    if hsp_cache is None:
+        hsp_cache = new_hsp_cache()
+
+    results = []
+    for ticket_index, ticket, ticket_usage in tickets:
+        # later stages (the browser agents) count towards this ticket alone
+        with track_llm_usage(ticket_usage):
+            try:
+                result = await check_extracted_ticket_async(
+                    image_sha256,
+                    ticket,
+                    user_id,
+                    submission_mode,
+                    hsp_cache,
+                    ticket_usage,
+                    ticket_index,
+                )
+            except Exception as e:
+                result = build_processing_error(e)
+                result["ticket_index"] = ticket_index
+                result["llm_usage"] = ticket_usage
+        results.append(result)
+    return build_multi_ticket_result(results)
+
+
+def build_processing_error(error: Exception) -> dict:
+    log.error("Unexpected error processing ticket: %s", error)
+    error_data = {
+        "status": "error_processing",
+        "message": f"Unexpected error: {str(error)}",
+        "next_action": "contact_support",
+    }
+    display_status_message(error_data)
+    return error_data
+
+
+async def process_ticket_async(
+    image_path: str,
+    user_id: str = "test_user",
+    submission_mode: str = "immediate",
+    hsp_cache: dict = None,
+) -> dict:
+    """
+    Check a ticket and claim if eligible. submission_mode "immediate" runs the
+    browser automation now; "batch" queues type a claims for submit_pending_claims.
+    Extraction, hsp lookups and automation are all awaited, so many tickets can
+    share one event loop.
+    """
+    log.info("DELAY EASE - AUTOMATED DELAY REPAY")
+    log.info("Processing ticket: %s", os.path.basename(image_path))
+
+    # every llm call for this ticket, extraction through the browser agents; every
+    # line logged for it carries the user id
+    with track_llm_usage() as llm_usage, bind_log_context(user_id=user_id):
+        try:
+            image_sha256, extracted_data, result = await read_ticket_async(
+                image_path, user_id
+            )
+            if result is not None:
+                return result
+            return await check_extracted_tickets_async(
+                image_sha256,
+                extracted_data,
+                user_id,
+                submission_mode,
+                hsp_cache,
+                llm_usage,
+            )
+        except Exception as e:
+            return build_processing_error(e)
+
+
+def process_single_ticket(
+    image_path: str, user_id: str = "test_user", submission_mode: str = "immediate"
+) -> dict:
+    return asyncio.run(process_ticket_async(image_path, user_id, submission_mode))
+
+
+async def process_tickets_async(
+    image_paths: list,
+    user_id: str = "test_user",
+    submission_mode: str = "immediate",
+    max_concurrency: int = MAX_CONCURRENT_TICKETS,
+) -> list:
+    """
+    process several tickets concurrently, sharing hsp responses between them.
+    results are SegmentRecords - a batch can hold a great many
+    """
+    # with one ticket there's no one to share whole metrics responses with
+    hsp_cache = new_hsp_cache(keep_metrics=len(image_paths) > 1)
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def process(image_path):
+        async with slots:
+            return build_result_record(
+                await process_ticket_async(
+                    image_path, user_id, submission_mode, hsp_cache
+                )
+            )
+
+    return await asyncio.gather(*(process(path) for path in image_paths))
+
+
+def process_tickets(
+    image_paths: list,
+    user_id: str = "test_user",
+    submission_mode: str = "immediate",
+    max_concurrency: int = MAX_CONCURRENT_TICKETS,
+) -> list:
+    return asyncio.run(
+        process_tickets_async(image_paths, user_id, submission_mode, max_concurrency)
+    )
+
+
+async def process_due_rechecks_async(submission_mode: str = "immediate") -> list:
+    """re-check queued tickets that are due and claim those now resolved"""
+    results = []
+    for entry, ticket_data in run_due_rechecks():
+        if get_original_path(entry["image_sha256"]) is None and entry.get("image_path"):
+            # queued before ticket images were kept in the store
+            ingest_image(entry["image_path"])
+        ticket_data["image_sha256"] = entry["image_sha256"]
+        ticket_data["recheck_id"] = entry["recheck_id"]
+        if entry.get("ticket_index") is not None:
+            ticket_data["ticket_index"] = entry["ticket_index"]
+        log.info(
+            "Re-check %s resolved: %s", entry["recheck_id"], ticket_data.get("status")
+        )
+
+        display_status_message(ticket_data)
+        # parked tickets carry the usage of their deferred extraction
+        with (
+            track_llm_usage(entry.get("llm_usage")) as llm_usage,
+            bind_log_context(user_id=entry["user_id"]),
+        ):
+            ticket_data["llm_usage"] = llm_usage
+            results.append(
+                await handle_checked_ticket_async(
+                    ticket_data, entry["user_id"], submission_mode
+                )
+            )
+    return results
+
+
+def process_due_rechecks(submission_mode: str = "immediate") -> list:
+    return asyncio.run(process_due_rechecks_async(submission_mode))
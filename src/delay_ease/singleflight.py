@@ -0,0 +1,133 @@
+import asyncio
+import copy
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# every single-flight group, for reporting coalescing counters
+FLIGHT_GROUPS = {}
+
+
+class SingleFlight:
+    """
+    Share one outstanding call between concurrent identical requests.
+    Callers with the same key while a call is in flight wait for it and get
+    its result (a copy, so callers can't mutate each other's data) or error.
+    Works for threads via do() and for asyncio tasks via do_async().
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        FLIGHT_GROUPS[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {
+                    "done": threading.Event(),
+                    "result": None,
+                    "error": None,
+                    "waiters": 0,
+                }
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call["waiters"] += 1
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return copy.deepcopy(call["result"])
+
+        try:
+            call["result"] = fn(*args, **kwargs)
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call["waiters"] > 0
+            call["done"].set()
+
+        # the shared result stays untouched while waiters copy it
+        return copy.deepcopy(call["result"]) if shared else call["result"]
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """
+        Coalesce tasks on this event loop first, then run the call once through
+        do() in a worker thread so it also joins identical threaded calls.
+        Coroutine functions are awaited directly on the loop.
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+
+        call = self._async_calls.get(loop_key)
+        if call is not None:
+            call["waiters"] += 1
+            with self._lock:
+                self.coalesced += 1
+            result = await asyncio.shield(call["future"])
+            return copy.deepcopy(result)
+
+        call = {"future": loop.create_future(), "waiters": 0}
+        self._async_calls[loop_key] = call
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                with self._lock:
+                    self.executed += 1
+                result = await fn(*args, **kwargs)
+            else:
+                result = await asyncio.to_thread(self.do, key, fn, *args, **kwargs)
+            call["future"].set_result(result)
+        except Exception as e:
+            call["future"].set_exception(e)
+            # mark retrieved so an unawaited shared error isn't logged by asyncio
+            call["future"].exception()
+            raise
+        finally:
+            del self._async_calls[loop_key]
+            if not call["future"].done():
+                # leader was cancelled - release waiters rather than hang them
+                call["future"].cancel()
+
+        return copy.deepcopy(result) if call["waiters"] else result
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "coalesced": self.coalesced}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.executed = 0
+            self.coalesced = 0
+
+    def add_stats(self, stats: dict) -> None:
+        with self._lock:
+            self.executed += stats["executed"]
+            self.coalesced += stats["coalesced"]
+
+
+def get_singleflight_stats() -> dict:
+    return {name: group.stats() for name, group in FLIGHT_GROUPS.items()}
+
+
+def reset_singleflight_stats() -> None:
+    for group in FLIGHT_GROUPS.values():
+        group.reset_stats()
+
+
+def add_singleflight_stats(stats: dict) -> None:
+    """fold another process's get_singleflight_stats() into this process's"""
+    for name, group_stats in stats.items():
+        if name in FLIGHT_GROUPS:
+            FLIGHT_GROUPS[name].add_stats(group_stats)
@@ -0,0 +1,198 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from src.delay_ease.const import (
+    LOG_CONTEXT_FIELDS,
+    LOG_SAMPLE_EVERY,
+    LOG_SAMPLED_LOGGERS,
+)
+
+# claim_id / user_id / stage of the ticket being worked on. asyncio tasks and
+# to_thread workers inherit it, so every line they log carries the fields
+log_context = contextvars.ContextVar("log_context", default={})
+
+# pass as extra= on noisy per-step lines; only every LOG_SAMPLE_EVERY-th
+# line from each call site is kept (warnings and errors always are)
+SAMPLED = {"sampled": True}
+
+# libraries that attach their own (synchronous) stdout handlers on import and
+# don't propagate; their records are moved onto the queue too
+SELF_LOGGING_LIBRARIES = ("browser_use", "bubus", "cdp_use")
+
+_listener = None
+
+
+@contextlib.contextmanager
+def bind_log_context(**fields):
+    """add fields to every log record made inside the block"""
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+
+def get_log_sample_every() -> int:
+    value = os.environ.get("DELAY_EASE_LOG_SAMPLE_EVERY", "").strip()
+    return max(1, int(value)) if value else LOG_SAMPLE_EVERY
+
+
+def get_log_format() -> str:
+    """text (default) or json, set with DELAY_EASE_LOG_FORMAT"""
+    log_format = os.environ.get("DELAY_EASE_LOG_FORMAT", "").strip().lower() or "text"
+    if log_format not in ("text", "json"):
+        raise ValueError(f"Unknown DELAY_EASE_LOG_FORMAT: {log_format}")
+    return log_format
+
+
+class ContextFilter(logging.Filter):
+    """copy the bound log context onto the record, in the caller's thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        for field in LOG_CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    keep one in `every` records marked with SAMPLED (or from a sampled
+    library), counted per call site
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counters = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if not (
+            getattr(record, "sampled", False)
+            or record.name.startswith(LOG_SAMPLED_LOGGERS)
+        ):
+            return True
+        site = (record.pathname, record.lineno)
+        counter = self._counters.get(site)
+        if counter is None:
+            # setdefault keeps one counter if two threads race on a new site
+            counter = self._counters.setdefault(site, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """one json object per line: time, level, logger, message and context"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """the plain "LEVEL: message" lines, prefixed with the claim/stage if bound"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s: %(context)s%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = " ".join(
+            f"{field}={getattr(record, field)}"
+            for field in LOG_CONTEXT_FIELDS
+            if getattr(record, field, None) is not None
+        )
+        record.context = f"[{context}] " if context else ""
+        return super().format(record)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records for the listener thread. Only the %-args are merged here
+    (they may be mutated once the call returns); the traceback is kept apart
+    from the message so the json formatter can report it as its own field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def build_queue_handler(log_queue, sample_every: int) -> ContextQueueHandler:
+    # filters on the queue handler run in the caller's thread - the context is
+    # only visible there, and sampled-out lines are dropped before formatting
+    handler = ContextQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(sample_every))
+    return handler
+
+
+def setup_logging(level: int = logging.INFO, stream=None) -> None:
+    """
+    Route all logging through a queue: callers only enqueue the record and a
+    listener thread formats and writes it, so slow stdout never blocks a
+    worker. Safe to call again - the previous listener is stopped first.
+    """
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(
+        JsonFormatter() if get_log_format() == "json" else TextFormatter()
+    )
+    log_queue = queue.SimpleQueue()
+
+    queue_handler = build_queue_handler(log_queue, get_log_sample_every())
+    root = logging.getLogger()
+    for logger in [root, *map(logging.getLogger, SELF_LOGGING_LIBRARIES)]:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name in SELF_LOGGING_LIBRARIES:
+        logging.getLogger(name).addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, output, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,11 +1,42 @@
+import asyncio
 import base64
 import csv
+import hashlib
 import json
 import os
+import time
+from pathlib import Path
 
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI, OpenAI
 
 from src.delay_ease.builders.prompt_builder import build_ticket_extraction_prompt
+from src.delay_ease.circuit_breaker import CircuitOpenError, get_breaker
+from src.delay_ease.const import (
+    EXTRACTION_MAX_TOKENS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_REQUEST_TIMEOUT_SECONDS,
+)
+from src.delay_ease.llm_usage import record_llm_usage
+from src.delay_ease.profiling import external_wait, profile_stage
+from src.delay_ease.singleflight import SingleFlight
+
+extraction_flight = SingleFlight("openai_ticket_extraction")
+
+
+def is_openai_outage(error: Exception) -> bool:
+    """connection errors, timeouts, rate limiting and 5xx - not bad requests"""
+    return isinstance(
+        error,
+        (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError),
+    )
+
+
+def is_openai_unavailable(error: Exception) -> bool:
+    return isinstance(error, CircuitOpenError) or is_openai_outage(error)
+
+
+openai_breaker = get_breaker("openai", is_failure=is_openai_outage)
 
 
 def get_openai_credentials():
@@ -51,6 +82,7 @@ def get_reference_data_path(filename):
     return os.path.join(base_dir, "data", "reference_data", filename)
 
 
+@profile_stage("reference_loading")
 def load_stations(csv_filename=None) -> dict:
     """load station data from csv - returns dict keyed by station name"""
     if csv_filename is None:
@@ -129,6 +161,7 @@ def validate_segment(segment: dict, stations: dict, crs_to_station: dict) -> dic
     return segment
 
 
+@profile_stage("validate_extracted_data")
 def validate_extracted_data(extracted_data: dict, stations_csv_filename=None) -> dict:
     """validate ticket data against stations csv"""
     if stations_csv_filename is None:
@@ -157,26 +190,27 @@ def validate_extracted_data(extracted_data: dict, stations_csv_filename=None) ->
 
 
 def extract_ticket_details(image_path: str) -> dict:
-    """extract ticket info from image using openai vision"""
-
+    """extract ticket info from image - concurrent identical images share one call"""
     with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        image_bytes = image_file.read()
 
-    data_url = f"data:image/png;base64,{base64_image}"
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    return extraction_flight.do(
+        image_hash, extract_ticket_details_from_bytes, image_bytes
+    )
 
-    prompt = build_ticket_extraction_prompt()
 
-    api_key, organization, project = get_openai_credentials()
+def build_extraction_request(image_bytes: bytes) -> dict:
+    """chat completion arguments for extracting ticket details from an image"""
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
 
-    client = OpenAI(
-        api_key=api_key,
-        organization=organization,
-        project=project,
-    )
+    data_url = f"data:image/png;base64,{base64_image}"
 
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[
+    prompt = build_ticket_extraction_prompt()
+
+    return {
+        "model": "gpt-4.1",
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -185,12 +219,27 @@ def extract_ticket_details(image_path: str) -> dict:
                 ],
             }
         ],
-        max_tokens=500,
+        "max_tokens": EXTRACTION_MAX_TOKENS,
+    }
+
+
+def record_extraction_usage(model: str, response, seconds: float) -> None:
+    usage = response.usage
+    record_llm_usage(
+        "extraction",
+        model,
+        usage.prompt_tokens if usage else 0,
+        usage.completion_tokens if usage else 0,
+        seconds,
     )
 
-    details_json = response.choices[0].message.content
-    extracted_data = json.loads(details_json)
 
+def get_extracted_tickets(extracted_data: dict) -> list:
+    """the tickets read from one image - a lone ticket keeps its own shape"""
+    return extracted_data.get("tickets", [extracted_data])
+
+
+def parse_extracted_ticket(extracted_data: dict) -> dict:
     # skip validation for paper tickets
     if "segments" in extracted_data:
         for segment in extracted_data["segments"]:
@@ -208,3 +257,95 @@ def extract_ticket_details(image_path: str) -> dict:
         }
 
     return validated_data
+
+
+def validate_extracted_tickets(extracted_data: dict) -> dict:
+    """
+    validate every ticket of an extraction on its own, so one unclear ticket
+    doesn't fail the rest. validated tickets pass through unchanged
+    """
+    if "error" in extracted_data:
+        return extracted_data
+    tickets = [
+        parse_extracted_ticket(ticket)
+        for ticket in get_extracted_tickets(extracted_data)
+    ]
+    if "tickets" in extracted_data:
+        return {"tickets": tickets}
+    return tickets[0]
+
+
+def parse_extraction_response(response, validate: bool = True) -> dict:
+    """
+    one ticket as before, or {"tickets": [...]} when the image shows several.
+    validate=False leaves station validation to the caller
+    """
+    details_json = response.choices[0].message.content
+    extracted_data = json.loads(details_json)
+
+    tickets = get_extracted_tickets(extracted_data)
+    if not tickets:
+        return {
+            "error": "no ticket found in photo, please upload a photo of your ticket"
+        }
+    extracted_data = tickets[0] if len(tickets) == 1 else {"tickets": tickets}
+    if validate:
+        return validate_extracted_tickets(extracted_data)
+    return extracted_data
+
+
+def extract_ticket_details_from_bytes(image_bytes: bytes) -> dict:
+    """extract ticket info from image bytes using openai vision"""
+    api_key, organization, project = get_openai_credentials()
+
+    client = OpenAI(
+        api_key=api_key,
+        organization=organization,
+        project=project,
+        timeout=OPENAI_REQUEST_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+    request = build_extraction_request(image_bytes)
+    started = time.perf_counter()
+    with external_wait("openai"):
+        response = openai_breaker.call(client.chat.completions.create, **request)
+    record_extraction_usage(request["model"], response, time.perf_counter() - started)
+    return parse_extraction_response(response)
+
+
+async def extract_ticket_details_from_bytes_async(
+    image_bytes: bytes, validate: bool = True
+) -> dict:
+    api_key, organization, project = get_openai_credentials()
+
+    client = AsyncOpenAI(
+        api_key=api_key,
+        organization=organization,
+        project=project,
+        timeout=OPENAI_REQUEST_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+    request = build_extraction_request(image_bytes)
+    started = time.perf_counter()
+    with external_wait("openai"):
+        response = await openai_breaker.call_async(
+            client.chat.completions.create, **request
+        )
+    record_extraction_usage(request["model"], response, time.perf_counter() - started)
+    # station validation reads the reference csv - keep it off the event loop
+    return await asyncio.to_thread(parse_extraction_response, response, validate)
+
+
+async def extract_ticket_details_async(image_path: str, validate: bool = True) -> dict:
+    """awaitable extract_ticket_details - identical images on a loop share one call"""
+    image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
+
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    return await extraction_flight.do_async(
+        image_hash if validate else f"{image_hash}:unvalidated",
+        extract_ticket_details_from_bytes_async,
+        image_bytes,
+        validate,
+    )
@@ -0,0 +1,155 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from src.delay_ease.const import PROFILE_CACHE_TTL_SECONDS
+
+log = logging.getLogger(__name__)
+
+PROFILES_DIR = Path("data/profiles")
+
+REQUIRED_PROFILE_FIELDS = {
+    "passenger": (
+        "title",
+        "first_name",
+        "last_name",
+        "address_line1",
+        "town_city",
+        "postcode",
+        "country",
+        "email",
+    ),
+    "bank": ("account_holder", "sort_code", "account_number"),
+    "delay_repay": ("email", "password"),
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_profile_key():
+    """Fernet key for profiles at rest - None means single-user env var mode"""
+    return os.environ.get("DELAY_EASE_PROFILE_KEY") or None
+
+
+def get_fernet() -> Fernet:
+    key = get_profile_key()
+    if not key:
+        raise ValueError(
+            "Missing required environment variable: DELAY_EASE_PROFILE_KEY"
+        )
+    return Fernet(key.encode("utf-8"))
+
+
+def generate_profile_key() -> str:
+    return Fernet.generate_key().decode("utf-8")
+
+
+def is_profile_store_enabled() -> bool:
+    return get_profile_key() is not None
+
+
+def get_profile_path(user_id: str) -> Path:
+    if not user_id or "/" in user_id or user_id.startswith("."):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    return PROFILES_DIR / f"{user_id}.enc"
+
+
+def validate_profile(profile: dict) -> None:
+    missing = [
+        f"{section}.{field}"
+        for section, fields in REQUIRED_PROFILE_FIELDS.items()
+        for field in fields
+        if not profile.get(section, {}).get(field)
+    ]
+    if missing:
+        raise ValueError(f"Missing required profile fields: {', '.join(missing)}")
+
+
+def save_user_profile(user_id: str, profile: dict) -> None:
+    """encrypt and store a profile, replacing any existing one"""
+    validate_profile(profile)
+    profile = {**profile, "user_id": user_id}
+    token = get_fernet().encrypt(json.dumps(profile).encode("utf-8"))
+
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    path = get_profile_path(user_id)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(token)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+    invalidate_user_profile(user_id)
+
+
+def delete_user_profile(user_id: str) -> bool:
+    path = get_profile_path(user_id)
+    invalidate_user_profile(user_id)
+    if not path.exists():
+        return False
+    path.unlink()
+    return True
+
+
+def invalidate_user_profile(user_id: str = None) -> None:
+    """drop one cached profile, or all of them"""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def load_user_profile(user_id: str) -> dict:
+    """decrypted profile for a user, served from the ttl cache when fresh"""
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] > now:
+            return copy.deepcopy(cached[1])
+
+    path = get_profile_path(user_id)
+    if not path.exists():
+        raise ValueError(f"No profile stored for user: {user_id}")
+
+    with open(path, "rb") as f:
+        token = f.read()
+    try:
+        profile = json.loads(get_fernet().decrypt(token))
+    except InvalidToken:
+        raise ValueError(f"Could not decrypt profile for user {user_id}: wrong key?")
+
+    with _cache_lock:
+        _cache[user_id] = (now + PROFILE_CACHE_TTL_SECONDS, profile)
+    return copy.deepcopy(profile)
+
+
+def build_profile_from_env() -> dict:
+    """profile from the single-user USER_* and DELAY_REPAY_* variables"""
+    return {
+        "passenger": {
+            "title": os.environ.get("USER_TITLE", ""),
+            "first_name": os.environ.get("USER_FIRST_NAME", ""),
+            "last_name": os.environ.get("USER_LAST_NAME", ""),
+            "address_line1": os.environ.get("USER_ADDRESS", ""),
+            "town_city": os.environ.get("USER_CITY", ""),
+            "postcode": os.environ.get("USER_POSTCODE", ""),
+            "country": os.environ.get("USER_COUNTRY", ""),
+            "email": os.environ.get("USER_EMAIL", ""),
+        },
+        "bank": {
+            "account_holder": os.environ.get("USER_ACCOUNT_HOLDER", ""),
+            "sort_code": os.environ.get("USER_SORT_CODE", ""),
+            "account_number": os.environ.get("USER_ACCOUNT_NUMBER", ""),
+        },
+        "delay_repay": {
+            "email": os.environ.get("DELAY_REPAY_EMAIL", ""),
+            "password": os.environ.get("DELAY_REPAY_PASSWORD", ""),
+        },
+    }
@@ -1,3 +1,6 @@
+import os
+from urllib.parse import urlsplit
+
 from src.delay_ease.const import TYPE_A_TOCS
 
 
@@ -8,3 +11,18 @@ def is_type_a_toc(train_operator: str) -> bool:
 def get_operator_website(train_operator: str) -> str:
     """Return the delay repay website URL for the given train operator"""
     return TYPE_A_TOCS.get(train_operator)
+
+
+def get_portal_home(operator_website: str) -> str:
+    """landing page of a delay repay portal, without login redirect params"""
+    parts = urlsplit(operator_website)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+def is_test_mode() -> bool:
+    """test mode lets stale tickets through the claim window pre-filter"""
+    return os.environ.get("DELAY_EASE_TEST_MODE", "").strip().lower() in (
+        "1",
+        "true",
+        "yes",
+    )
@@ -0,0 +1,23 @@
+from src.delay_ease.browser_automation_type_a import build_browser_args
+from src.delay_ease.const import BROWSER_PROFILES
+
+
+def get_resolver_rules(profile: dict) -> list:
+    for arg in build_browser_args(profile):
+        if arg.startswith("--host-resolver-rules="):
+            return arg.split("=", 1)[1].split(", ")
+    return []
+
+
+def test_performance_profile_blocks_tracker_hosts_only():
+    rules = get_resolver_rules(BROWSER_PROFILES["performance"])
+
+    assert "MAP googletagmanager.com ~NOTFOUND" in rules
+    assert "MAP *.google-analytics.com ~NOTFOUND" in rules
+    assert "EXCLUDE www.google.com" in rules
+    # portal, captcha and cdn hosts are left to resolve
+    assert not any(rule.startswith("MAP * ") for rule in rules)
+
+
+def test_standard_profile_blocks_nothing():
+    assert build_browser_args(BROWSER_PROFILES["standard"]) == []
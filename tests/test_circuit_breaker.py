@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.delay_ease import circuit_breaker
+from src.delay_ease.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    PortalLoginError,
+    is_portal_outage,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """a monotonic clock the test moves by hand"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        circuit_breaker, "time", SimpleNamespace(monotonic=lambda: clock.now)
+    )
+    return clock
+
+
+def fail(error=TimeoutError("timed out")):
+    raise error
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(TimeoutError):
+            breaker.call(fail)
+
+
+def test_opens_at_threshold_and_fails_fast(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    calls = []
+
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            breaker.call(fail)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    with pytest.raises(TimeoutError):
+        breaker.call(fail)
+    assert breaker.state == circuit_breaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.call(calls.append, "called")
+    assert calls == []
+    assert error.value.retry_in == 30
+    assert breaker.rejected == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+
+    with pytest.raises(TimeoutError):
+        breaker.call(fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(TimeoutError):
+        breaker.call(fail)
+
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    open_breaker(breaker)
+
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    clock.now += 1
+    assert breaker.is_available()
+    breaker.check()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.is_available()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    open_breaker(breaker)
+    clock.now += 30
+
+    with pytest.raises(TimeoutError):
+        breaker.call(fail)
+
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.get_retry_in() == 30
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+@pytest.mark.parametrize(
+    "error", [PortalLoginError("password rejected"), ValueError("form rejected")]
+)
+def test_non_outage_errors_do_not_count(clock, error):
+    breaker = CircuitBreaker(
+        "portal:test",
+        failure_threshold=1,
+        reset_seconds=30,
+        is_failure=is_portal_outage,
+    )
+
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            breaker.call(fail, error)
+
+    assert breaker.state == circuit_breaker.CLOSED
+    with pytest.raises(ConnectionError):
+        breaker.call(fail, ConnectionError("reset"))
+    assert breaker.state == circuit_breaker.OPEN
+
+
+def test_cancelled_probe_frees_the_probe(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    open_breaker(breaker)
+    clock.now += 30
+
+    async def cancelled():
+        raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(breaker.call_async(cancelled))
+
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert breaker.is_available()
+
+    async def ok():
+        return "ok"
+
+    assert asyncio.run(breaker.call_async(ok)) == "ok"
+    assert breaker.state == circuit_breaker.CLOSED
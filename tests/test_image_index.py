@@ -0,0 +1,64 @@
+import io
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.delay_ease import image_index
+
+TICKET_PATH = Path(__file__).parents[1] / "data" / "test_tickets" / "eticket_test1.png"
+
+
+def get_detail(image: Image.Image, format: str = "PNG") -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format, quality=80)
+    return image_index.compute_detail_image(buffer.getvalue())
+
+
+def change_departure_time(ticket: Image.Image) -> Image.Image:
+    """19:35 -> 19:33, by pasting the ticket's own 3 over its 5"""
+    ticket = ticket.copy()
+    three = ticket.crop((597, 1628, 622, 1664))
+    ImageDraw.Draw(ticket).rectangle((623, 1626, 648, 1664), fill=(255, 248, 242))
+    ticket.paste(three, (624, 1628))
+    return ticket
+
+
+@pytest.fixture(scope="module")
+def ticket():
+    with Image.open(TICKET_PATH) as image:
+        return image.convert("RGB")
+
+
+@pytest.mark.parametrize(
+    "crop",
+    [(0, 60, 0, 0), (0, 0, 0, 100), (20, 0, 20, 0), (40, 100, 40, 200)],
+)
+def test_recropped_ticket_is_same_detail(ticket, crop):
+    left, top, right, bottom = crop
+    width, height = ticket.size
+    recropped = ticket.crop((left, top, width - right, height - bottom))
+
+    assert image_index.is_same_detail(get_detail(ticket), get_detail(recropped, "JPEG"))
+    assert image_index.is_same_detail(get_detail(recropped, "JPEG"), get_detail(ticket))
+
+
+def test_status_bar_clock_is_left_out(ticket):
+    """the dark band above the ticket stands in for the status bar"""
+    clock = ticket.copy()
+    ImageDraw.Draw(clock).text((80, 50), "10:07", fill=(255, 255, 255), font_size=50)
+
+    assert image_index.is_same_detail(get_detail(ticket), get_detail(clock))
+
+
+@pytest.mark.parametrize("crop", [(0, 0, 0, 0), (20, 60, 20, 100)])
+def test_changed_departure_time_is_not_same_detail(ticket, crop):
+    left, top, right, bottom = crop
+    width, height = ticket.size
+    changed = change_departure_time(ticket).crop(
+        (left, top, width - right, height - bottom)
+    )
+
+    assert not image_index.is_same_detail(
+        get_detail(ticket), get_detail(changed, "JPEG")
+    )
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from src.delay_ease.json_stream import iter_array_items
+
+DOCUMENT = {
+    "header": {"Services": ["not", "these"], "from_loc": "LDN", "count": 3},
+    "Services": [
+        {
+            "serviceAttributesMetrics": {
+                "origin_location": "ELY",
+                "gbtt_ptd": "1935",
+                "rids": ["202507107654321"],
+                "toc_code": "XC",
+            },
+            "Metrics": [{"tolerance_value": 0, "percent_tolerance": 87.5}],
+        },
+        {"name": "Llandudno Junction – “Caffi” £4.50 🚆", "delay": -12.75e3},
+        [1, 22, 333.25, -0.5, 1e-7],
+        'quoted \\ " é',
+        1234567890,
+        3.14159,
+        True,
+        False,
+        None,
+    ],
+    "footer": [{"note": "ignored"}, 42],
+}
+PAYLOAD = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+
+
+def split_every(data: bytes, size: int) -> list:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, len(PAYLOAD)])
+def test_items_survive_any_chunk_size(size):
+    assert list(iter_array_items(split_every(PAYLOAD, size), "Services")) == (
+        DOCUMENT["Services"]
+    )
+
+
+def test_items_survive_a_split_at_any_byte():
+    """splits land inside multi-byte characters, numbers and literals"""
+    for i in range(len(PAYLOAD) + 1):
+        chunks = [PAYLOAD[:i], PAYLOAD[i:]]
+        assert list(iter_array_items(chunks, "Services")) == DOCUMENT["Services"], i
+
+
+@pytest.mark.parametrize(
+    "payload", [b'{"Services": []}', b'{ "Services" : [ ] }', b"{}", b'{"other": [1]}']
+)
+def test_empty_or_missing_array_yields_nothing(payload):
+    assert list(iter_array_items(split_every(payload, 1), "Services")) == []
+
+
+def test_other_top_level_values_are_skipped():
+    payload = b'{"a": 1, "b": "[x]", "Services": [{"n": 1}], "c": {"d": [2]}}'
+
+    assert list(iter_array_items(split_every(payload, 4), "Services")) == [{"n": 1}]
+
+
+def test_truncated_stream_raises():
+    """every cut short of the closing brace, even mid-number or mid-character"""
+    for i in range(len(PAYLOAD)):
+        with pytest.raises(ValueError):
+            list(iter_array_items(split_every(PAYLOAD[:i], 7), "Services"))
+
+
+def test_stopping_early_reads_no_further():
+    read = []
+
+    def chunks():
+        for chunk in split_every(PAYLOAD, 16):
+            read.append(chunk)
+            yield chunk
+
+    items = iter_array_items(chunks(), "Services")
+    assert next(items) == DOCUMENT["Services"][0]
+    items.close()
+
+    # one chunk at most past the end of the first item
+    first_item_end = PAYLOAD.index(b"87.5}]}") + len(b"87.5}]}")
+    assert sum(map(len, read)) < first_item_end + 16
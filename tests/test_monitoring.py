@@ -0,0 +1,22 @@
+import pytest
+
+from src.delay_ease.monitoring import parse_days
+
+
+@pytest.mark.parametrize(
+    "days, expected",
+    [
+        ("WEEKDAY", ["MON", "TUE", "WED", "THU", "FRI"]),
+        ("weekend", ["SAT", "SUN"]),
+        ("fri, Monday,wed", ["MON", "WED", "FRI"]),
+        ("SUNDAY,SUN", ["SUN"]),
+    ],
+)
+def test_parse_days(days, expected):
+    assert parse_days(days) == expected
+
+
+@pytest.mark.parametrize("days", ["MONKEY", "SATELLITE", "TUES", "MO", "MON,", ""])
+def test_parse_days_rejects_unknown_names(days):
+    with pytest.raises(ValueError):
+        parse_days(days)
@@ -0,0 +1,56 @@
+import datetime
+import hashlib
+
+from src.delay_ease import image_store, recheck_queue
+
+DAY = datetime.timedelta(days=1)
+
+
+def test_legacy_parked_ticket_is_read_from_its_upload_path(monkeypatch, tmp_path):
+    """entries parked before the image store hold only the upload's path"""
+    monkeypatch.setattr(image_store, "IMAGE_STORE_DIR", tmp_path / "images")
+    image_path = tmp_path / "ticket.png"
+    image_path.write_bytes(b"ticket image")
+    read_paths = []
+
+    def extract_ticket_details(path):
+        read_paths.append(path)
+        return {"error": "unreadable"}
+
+    monkeypatch.setattr(recheck_queue, "extract_ticket_details", extract_ticket_details)
+    image_sha256 = hashlib.sha256(b"ticket image").hexdigest()
+    entry = {
+        "recheck_id": "RC_legacy",
+        "image_path": str(image_path),
+        "image_sha256": image_sha256,
+        "extracted_data": None,
+    }
+
+    assert recheck_queue.extract_parked_ticket(entry)
+    assert read_paths == [str(image_store.get_image_dir(image_sha256) / "original.png")]
+    assert entry["extracted_data"] == {"error": "unreadable"}
+
+
+def test_parked_ticket_expires_at_its_deadline(monkeypatch, tmp_path):
+    """an outage outlasting the deadline drops the entry instead of retrying"""
+    monkeypatch.setattr(recheck_queue, "RECHECK_DIR", tmp_path)
+    monkeypatch.setattr(recheck_queue, "extract_parked_ticket", lambda entry: False)
+    now = datetime.datetime(2025, 8, 10, 12, 0)
+    for recheck_id, deadline in (("RC_expired", now), ("RC_waiting", now + DAY)):
+        recheck_queue.save_recheck(
+            {
+                "recheck_id": recheck_id,
+                "image_sha256": "ab" * 32,
+                "extracted_data": None,
+                "attempts": 0,
+                "outages": 0,
+                "last_status": "degraded",
+                "next_check_at": (now - DAY).isoformat(),
+                "deadline": deadline.isoformat(),
+            }
+        )
+
+    assert recheck_queue.run_due_rechecks(now) == []
+    (entry,) = recheck_queue.load_rechecks()
+    assert entry["recheck_id"] == "RC_waiting"
+    assert datetime.datetime.fromisoformat(entry["next_check_at"]) > now
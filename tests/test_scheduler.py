@@ -0,0 +1,16 @@
+import pytest
+
+from src.delay_ease.scheduler import build_admission_report
+
+
+@pytest.mark.parametrize("capacity", [0, -5])
+def test_admission_report_rejects_non_positive_capacity(capacity):
+    with pytest.raises(ValueError):
+        build_admission_report([], capacity)
+
+
+def test_admission_report_of_empty_queue():
+    report = build_admission_report([], 0.5)
+
+    assert report["queued"] == 0
+    assert report["hours_to_clear"] == 0
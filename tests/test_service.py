@@ -0,0 +1,34 @@
+import asyncio
+import json
+
+from src.delay_ease import recheck_queue, service
+
+
+def test_segment_mode_ticket_with_deferrable_leg_is_scheduled(monkeypatch, tmp_path):
+    """segment-mode results have no top-level message to extend"""
+    monkeypatch.setattr(recheck_queue, "RECHECK_DIR", tmp_path)
+    checked = {
+        "segments": [
+            {"status": "ineligible_delay_too_short", "message": "Delay too short."},
+            {"status": "error_no_delay_data", "message": "No actuals yet."},
+        ]
+    }
+    monkeypatch.setattr(service, "check_ticket_delays", lambda *a, **kw: checked)
+    extracted_data = {
+        "segments": [
+            {"ticket_date": "10 Jul 2025", "departure_time": "19:35"},
+            {"ticket_date": "10 Jul 2025", "departure_time": "20:10"},
+        ]
+    }
+
+    ticket_data = asyncio.run(
+        service.check_extracted_ticket_async(
+            "ab" * 32, extracted_data, "user", "immediate", {}, {}
+        )
+    )
+
+    assert ticket_data["next_action"] == "await_recheck"
+    assert ticket_data["message"].startswith("We'll re-check automatically")
+    (entry_path,) = tmp_path.glob("*.json")
+    with open(entry_path) as f:
+        assert json.load(f)["recheck_id"] == ticket_data["recheck_id"]